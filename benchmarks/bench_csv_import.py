@@ -0,0 +1,54 @@
+"""
+Compare the old CSV import (one eager read_csv with try_parse_dates, then
+write_parquet) with the chunked parallel import in tsapi.csv_import.
+
+    PYTHONPATH=. python benchmarks/bench_csv_import.py
+"""
+import io
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+
+from tsapi.csv_import import import_csv
+
+NUM_ROWS = 2_000_000
+NUM_SERIES = 20
+
+
+def make_csv() -> bytes:
+    rng = np.random.default_rng(0)
+    df = pl.DataFrame({
+        'timestamp': pl.datetime_range(
+            datetime(2020, 1, 1), datetime(2020, 1, 1) + timedelta(minutes=NUM_ROWS - 1), '1m', eager=True
+        ),
+        **{f's{i}': rng.normal(size=NUM_ROWS) for i in range(NUM_SERIES)},
+    })
+    buffer = io.BytesIO()
+    df.write_csv(buffer)
+    return buffer.getvalue()
+
+
+def legacy_import(data: bytes) -> bytes:
+    df = pl.read_csv(io.BytesIO(data), has_header=True, try_parse_dates=True)
+    buffer = io.BytesIO()
+    df.write_parquet(buffer)
+    return buffer.getvalue()
+
+
+def main():
+    data = make_csv()
+    print(f"{len(data) / 1e6:.0f} MB, {NUM_ROWS} rows")
+
+    start = time.perf_counter()
+    legacy_import(data)
+    seconds = time.perf_counter() - start
+    print(f"{'read_csv':>10}: {seconds:6.2f} s  {NUM_ROWS / seconds:12,.0f} rows/s")
+
+    result = import_csv(io.BytesIO(data), io.BytesIO())
+    print(f"{'chunked':>10}: {result.seconds:6.2f} s  {result.rows_per_second:12,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare building forecast results the old way (indexing the prediction
+arrays inside the per-step loop) with the vectorized builder in
+tsapi.forecast.  The model is fit once per horizon, so only the result
+construction is timed.
+
+    PYTHONPATH=. python benchmarks/bench_forecast.py
+"""
+import time
+from datetime import datetime
+
+import augurs as aug
+import numpy as np
+import polars as pl
+
+from tsapi.forecast import forecast_records, future_timestamps
+from tsapi.frequency import infer_freq
+
+HORIZONS = [10, 1000, 5000, 20000]
+
+
+def legacy_records(predictions, timestamp, horizon):
+    pred_records = []
+    freq = infer_freq(timestamp)
+    for i in range(horizon):
+        pred_records.append(
+            (
+                timestamp[-1] + (i + 1) * freq,
+                {
+                    "point": predictions.point()[i],
+                    "lower": predictions.lower()[i],
+                    "upper": predictions.upper()[i]
+                }
+            )
+        )
+    return pred_records
+
+
+def vectorized_records(predictions, timestamp, horizon):
+    freq = infer_freq(timestamp)
+    return forecast_records(pl.DataFrame({
+        'timestamp': future_timestamps(timestamp, freq, horizon),
+        'point': predictions.point(),
+        'lower': predictions.lower(),
+        'upper': predictions.upper(),
+    }))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    timestamp = pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 3, 1), interval='1h', eager=True)
+    y = np.sin(np.arange(len(timestamp)) * 2 * np.pi / 24) + np.random.default_rng(0).normal(0, 0.1, len(timestamp))
+
+    model = aug.MSTL.ets([3, 4])
+    model.fit(y)
+
+    print(f"{'horizon':>8} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>8}")
+    for horizon in HORIZONS:
+        predictions = model.predict(horizon, level=0.95)
+        legacy, legacy_time = timed(legacy_records, predictions, timestamp, horizon)
+        vectorized, vectorized_time = timed(vectorized_records, predictions, timestamp, horizon)
+
+        assert [t for t, _ in legacy] == [t for t, _ in vectorized]
+        print(f"{horizon:>8} {legacy_time:>12.4f} {vectorized_time:>15.4f} {legacy_time / vectorized_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Measure the cold start of the API: the time to import main, which heavy
+modules that pulls in, and the latency of the first request (startup, which
+loads the settings, plus GET /health).  Each run is a fresh interpreter.
+
+    DATA_DIR=/tmp/data SECRETS_DIR=/tmp/secrets PYTHONPATH=. python benchmarks/bench_startup.py
+"""
+import json
+import subprocess
+import sys
+
+RUNS = 5
+
+# Modules that are slow to import and are only needed by some requests
+HEAVY_MODULES = ['augurs', 'google.cloud.storage', 'redis', 'brotli', 'zstandard', 'pyinstrument']
+
+PROBE = """
+import json, sys, time
+
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+# Before the test client, which imports some of them itself
+loaded = [m for m in %r if m in sys.modules]
+
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    client.get('/health')
+first_request = time.perf_counter()
+
+print(json.dumps({
+    'import': imported - start,
+    'first_request': first_request - imported,
+    'loaded': loaded,
+}))
+"""
+
+
+def run_probe() -> dict:
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE % HEAVY_MODULES],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    results = [run_probe() for _ in range(RUNS)]
+
+    for key in ['import', 'first_request']:
+        times = sorted(r[key] for r in results)
+        print(f"{key:>14}: median {times[len(times) // 2] * 1000:8.1f} ms  min {times[0] * 1000:8.1f} ms")
+
+    print(f"{'heavy modules':>14}: {', '.join(results[0]['loaded']) or 'none'} loaded by the import")
+
+
+if __name__ == '__main__':
+    main()
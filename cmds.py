@@ -1,41 +1,42 @@
+"""
+Helpers for poking at datasets from a Python shell.  For bulk operations use
+the CLI (python -m tsapi.cli).
+"""
 import asyncio
+import atexit
 
 import polars as pl
+import structlog
 
-from tsapi.mongo_client import MongoClient
+from tsapi.cli import Admin, dataset_info  # noqa: F401
 from tsapi.model.dataset import DataSet
-from main import settings
+from tsapi.settings import load_settings
+
+settings = load_settings()
+admin = Admin(settings, structlog.get_logger(), workers=4)
+
+# One event loop for the whole session, so the MongoDB client is reused rather than made for each call
+runner = asyncio.Runner()
+atexit.register(runner.close)
 
 
 def get_datasets():
-    lup = asyncio.new_event_loop()
-    client = MongoClient(settings)
-    return lup.run_until_complete(client.get_datasets())
+    return runner.run(admin.mongo.get_datasets())
 
 
 def add_dataset(name, description, file_path):
     df = pl.read_parquet(file_path)
 
-    dataset = DataSet.from_dataframe(df, name, description)
+    dataset = DataSet.from_dataframe(df, name)
+    dataset.description = description
 
-    lup = asyncio.new_event_loop()
-    client = MongoClient(settings)
-    lup.run_until_complete(client.insert_dataset(dataset.model_dump()))
+    return runner.run(admin.mongo.insert_dataset(dataset.model_dump()))
 
 
 def delete_dataset(dataset_id):
-    lup = asyncio.new_event_loop()
-    client = MongoClient(settings)
-    lup.run_until_complete(client.delete_dataset(dataset_id))
+    return runner.run(admin.mongo.delete_dataset(dataset_id))
 
 
 def delete_dataset_by_name(name):
-    lup = asyncio.new_event_loop()
-    client = MongoClient(settings)
-    dataset = lup.run_until_complete(client.get_dataset_by_name(name))
-    lup.run_until_complete(client.delete_dataset(dataset['id']))
-
-
-def dataset_info(path):
-    df = pl.read_parquet(path)
-    print(df.describe())
+    """Delete the dataset, its file and its cached frames, as `tsapi.cli delete` does."""
+    return runner.run(admin.delete(name))
@@ -1,71 +1,47 @@
-from typing import Annotated, Any
+from contextlib import asynccontextmanager
+from typing import Annotated
 
-import environ
+import asyncio
+import math
+
+import polars as pl
 from fastapi import FastAPI, File, HTTPException, Depends, Query, Request, status
-from fastapi.responses import Response, PlainTextResponse, JSONResponse
+from fastapi.responses import Response, PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic_settings import BaseSettings, SettingsConfigDict
 import structlog
 
 
+from tsapi.admission import AdmissionMiddleware
 from tsapi.gcs import generate_signed_url
+from tsapi.profiling import ProfilingMiddleware, authorized, report_name, speedscope_name, stage
+from tsapi.compression import CompressionMiddleware
+from tsapi.http_cache import cache_headers, is_not_modified, make_etag, not_modified_response
 from tsapi.model.dataset import (
     DataSet, OperationSet, save_dataset, save_dataset_source, DatasetRequest,
     store_dataset
 )
 from tsapi.frequency import adjust_frequency
+from tsapi.model.admission import AdmissionReport
+from tsapi.model.profile import ProfileReport
 from tsapi.model.responses import SignedURLResponse
-from tsapi.model.forecast import ForecastResponse, ForecastRequest
-from tsapi.model.time_series import TimeSeries, TimeRecord
+from tsapi.model.stats import DatasetStats
+from tsapi.model.forecast import ForecastResponse, ForecastRequest, BacktestRequest, BacktestResponse
+from tsapi.model.time_series import TimeSeries, TimeRecord, AlignedRequest, AlignedTimeSeries
+from tsapi.align import AlignFrame, ALIGNED_TSCOL, align_frames, check_durations
 from tsapi.mongo_client import MongoClient
+from tsapi.cache_sweeper import run_sweeper
 from tsapi.dataset_cache import DatasetCache
-from tsapi.forecast import forecast
-from tsapi.errors import TsApiNoTimestampError
-
-
-class Settings(BaseSettings):
-    env: str = "local"
-    app_name: str = "Time Series API"
-    data_dir: str
-    secrets_dir: str = "/var/secrets"
-    secrets: Any = None
-
-    mdb_user: str = "tsapiuser"
-    mdb_host: str = "localhost"
-    mdb_port: int = 27017
-    mdb_name: str = "tsapidb"
-    mdb_scheme: str = "mongodb"
-    mdb_options: str = ""
-
-    redis_host: str = "localhost"
-
-    model_config = SettingsConfigDict(env_file=".env")
-
-    @property
-    def mdb_url(self):
-        """MongoDB connection URL"""
-        # NB: Leaving out port for now because mongodb+srv can't use it.
-        url = f"{self.mdb_scheme}://{self.mdb_user}:{self.secrets.mdb_password}@{self.mdb_host}/{self.mdb_name}"
-
-        if self.mdb_options:
-            url += f"?{self.mdb_options}"
-
-        return url
-
-
-settings = Settings()
-
-# Kinda silly maybe, but i like how environ does secrets.  Maybe should just
-# ditch pydantic for settings?
-file_secrets = environ.secrets.DirectorySecrets.from_path(settings.secrets_dir)
-
-
-@environ.config
-class SecretConfig:
-    mdb_password = file_secrets.secret()
-
+from tsapi.dataset_storage import get_storage
+from tsapi.progressive import progressive_refinements, time_records
+from tsapi.forecast import forecast_groups, forecast_records, pooled_forecast_frame
+from tsapi.backtest import backtest
+from tsapi.seasonality import series_periods
+from tsapi.errors import (
+    TsApiDataError, TsApiForecastError, TsApiForecastTimeoutError, TsApiMemoryBudgetError, TsApiNoTimestampError,
+    TsApiOperationError
+)
+from tsapi.settings import Settings, load_settings
 
-settings.secrets = SecretConfig.from_environ()
 
 structlog.configure(
     processors=[
@@ -79,7 +55,23 @@ structlog.configure(
 logger = structlog.get_logger()
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Settings and secrets are read once per worker, not at import or per request
+    app.state.settings = load_settings()
+    logger.info("Loaded settings", env=app.state.settings.env)
+
+    sweeper = None
+    if app.state.settings.cache_sweep_seconds > 0:
+        sweeper = asyncio.create_task(run_sweeper(app.state.settings, logger))
+
+    yield
+
+    if sweeper is not None:
+        sweeper.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 app.logger = logger
 
 
@@ -89,6 +81,13 @@ origins = [
     "http://localhost:5173",
 ]
 
+# Only admitted requests are profiled
+app.add_middleware(ProfilingMiddleware)
+
+# Inside CORS, so that browsers can read the 429 and 503 responses.  Configured
+# from app.state.settings on the first request.
+app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -97,11 +96,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Configured from app.state.settings on the first request
+app.add_middleware(CompressionMiddleware)
+
 
-def get_settings():
-    curr_settings = Settings()
-    curr_settings.secrets = SecretConfig.from_environ()
-    return curr_settings
+def get_settings(request: Request) -> Settings:
+    return request.app.state.settings
+
+
+@app.exception_handler(TsApiMemoryBudgetError)
+async def memory_budget_exceeded(request: Request, e: TsApiMemoryBudgetError):
+    # Wherever a frame is loaded, the worker is out of memory for now, like an admission rejection
+    logger.warning("Memory budget exceeded", path=request.url.path, error=str(e))
+    return JSONResponse(
+        {'detail': 'Request rejected (memory), retry later'},
+        status_code=503,
+        headers={'Retry-After': str(max(1, math.ceil(request.app.state.settings.memory_wait_seconds)))},
+    )
 
 
 @app.get("/")
@@ -114,9 +125,58 @@ async def health():
     return "OK"
 
 
+@app.get("/tsapi/v1/admission")
+async def get_admission(request: Request, config: Settings = Depends(get_settings)) -> AdmissionReport:
+    """
+    The admission counters of the worker that serves the request.
+    """
+    controller = getattr(request.app.state, 'admission', None)
+    return AdmissionReport(
+        route_classes=list(controller.stats.values()) if controller else [],
+        parquet_loads_waiting=get_storage(config).loads_waiting,
+        memory=get_storage(config).memory.stats,
+    )
+
+
+def check_profile_token(request: Request, config: Settings = Depends(get_settings)):
+    if not authorized(request.scope, getattr(config.secrets, 'profile_token', None)):
+        raise HTTPException(status_code=403, detail="Profiling not allowed")
+
+
+@app.get("/tsapi/v1/profiles/{profile_id}", dependencies=[Depends(check_profile_token)])
+async def get_profile(profile_id: str, config: Settings = Depends(get_settings)) -> ProfileReport:
+    try:
+        data = await asyncio.to_thread(get_storage(config).store.read, report_name(profile_id))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return ProfileReport.model_validate_json(data)
+
+
+@app.get("/tsapi/v1/profiles/{profile_id}/speedscope", dependencies=[Depends(check_profile_token)])
+async def get_profile_flamegraph(profile_id: str, config: Settings = Depends(get_settings)) -> Response:
+    """
+    The flamegraph of a profile, for https://www.speedscope.app
+    """
+    try:
+        data = await asyncio.to_thread(get_storage(config).store.read, speedscope_name(profile_id))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(data, media_type="application/json")
+
+
 @app.get("/tsapi/v1/datasets")
-async def get_datasets(config: Settings = Depends(get_settings)) -> list[DataSet]:
-    return await MongoClient(config).get_datasets()
+async def get_datasets(
+        request: Request, response: Response, config: Settings = Depends(get_settings)
+) -> list[DataSet]:
+    mngo_client = MongoClient(config)
+
+    version, updated_at = await mngo_client.get_datasets_version()
+    etag = make_etag('datasets', version)
+    if is_not_modified(request, etag, updated_at):
+        return not_modified_response(etag, updated_at)
+
+    response.headers.update(cache_headers(etag, updated_at))
+    return await mngo_client.get_datasets()
 
 
 @app.post("/tsapi/v1/datasets")
@@ -134,9 +194,13 @@ async def create_dataset(
     try:
 
         if dataset_req.upload_type == 'add':
-            dataset = await DataSet.build(dataset_req.name, config.data_dir)
+            dataset = await DataSet.build(
+                dataset_req.name, get_storage(config), dataset_req.compact, dataset_req.allow_float32
+            )
         elif dataset_req.upload_type == 'import':
-            dataset = await DataSet.import_csv(dataset_req.name, config.data_dir)
+            dataset = await DataSet.import_csv(
+                dataset_req.name, get_storage(config), logger, dataset_req.compact, dataset_req.allow_float32
+            )
         else:
             raise HTTPException(status_code=400, detail="Invalid upload type")
 
@@ -147,23 +211,41 @@ async def create_dataset(
         logger.error("Unexpected error", name=dataset_req.name, error=str(e))
         raise HTTPException(status_code=400, detail=str(e))
 
-    dataset_id = await MongoClient(config).insert_dataset(dataset.model_dump())
-    dataset.id = dataset_id
+    if dataset.compaction is not None:
+        logger.info("Compacted dataset", name=dataset.name, **dataset.compaction.model_dump())
+
+    # A dataset of the same name is replaced, keeping its id and opsets
+    dataset_id = await MongoClient(config).save_dataset(dataset.model_dump())
 
-    return dataset
+    return await MongoClient(config).get_dataset(dataset_id)
 
 
 @app.get("/tsapi/v1/datasets/{dataset_id}")
 async def get_dataset(dataset_id: str, config: Settings = Depends(get_settings)) -> DataSet:
-    return await MongoClient(config).get_dataset(dataset_id)
+    return await find_dataset(MongoClient(config), dataset_id)
+
+
+@app.get("/tsapi/v1/datasets/{dataset_id}/stats")
+async def get_dataset_stats(dataset_id: str, config: Settings = Depends(get_settings)) -> DatasetStats:
+    """
+    Return the column and chunk statistics computed when the dataset was ingested.
+    This only reads the dataset metadata, never the parquet file.
+    """
+    stats = await MongoClient(config).get_dataset_stats(dataset_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Dataset statistics not found")
+    return stats
 
 
 @app.delete("/tsapi/v1/datasets/{dataset_id}")
 async def delete_dataset(dataset_id: str, config: Settings = Depends(get_settings)) -> DataSet:
-    mngo_client = MongoClient(settings)
-    dataset = DataSet.model_validate(await mngo_client.get_dataset(dataset_id))
+    mngo_client = MongoClient(config)
+    dataset = await find_dataset(mngo_client, dataset_id)
     await mngo_client.delete_dataset(dataset_id)
-    await dataset.delete(config.data_dir, logger)
+    await dataset.delete(get_storage(config), logger)
+    # The sweeper would get these too, but there's no need to wait for it
+    deleted = await DatasetCache(dataset, config, logger).delete_dataset()
+    logger.info("Deleted cached frames", dataset_id=dataset_id, keys=deleted)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -175,99 +257,368 @@ async def create_opset(opset: OperationSet, config: Settings = Depends(get_setti
 
 
 @app.put("/tsapi/v1/opsets/{opset_id}")
-async def update_opset(opset_id: str, opset: OperationSet) -> OperationSet:
-    mngo_client = MongoClient(settings)
-
-    curr_opset = await mngo_client.get_opset(opset_id)
+async def update_opset(
+        opset_id: str, opset: OperationSet, config: Settings = Depends(get_settings)
+) -> OperationSet:
+    mngo_client = MongoClient(config)
+
+    curr_opset = await find_opset(mngo_client, opset_id)
+    # The operations may have changed, so the series periods have to be detected again
+    opset.periods = {}
     opset = await mngo_client.update_opset(opset_id, opset.model_dump())
     if opset is None:
-        raise HTTPException(status_code=404, detail="Opset not found")
+        raise HTTPException(status_code=404, detail=f"Opset not found: {opset_id}")
 
-    dataset_data = await MongoClient(settings).get_dataset(opset['dataset_id'])
+    dataset = await find_dataset(mngo_client, opset['dataset_id'])
 
-    ds_cache = DatasetCache(DataSet(**dataset_data), settings, logger)
-    await ds_cache.update_operation_set(OperationSet(**opset), OperationSet(**curr_opset))
+    ds_cache = DatasetCache(dataset, config, logger)
+    await ds_cache.update_operation_set(OperationSet(**opset), curr_opset)
 
     return opset
 
 
 @app.get("/tsapi/v1/opsets/{opset_id}")
-async def get_opset(opset_id: str) -> OperationSet:
-    opset = await MongoClient(settings).get_opset(opset_id)
-    return opset
+async def get_opset(opset_id: str, config: Settings = Depends(get_settings)) -> OperationSet:
+    return await find_opset(MongoClient(config), opset_id)
+
+
+async def find_opset(mngo_client: MongoClient, opset_id: str) -> OperationSet:
+    """The opset, or a 404 if there is no such opset (or the id isn't valid)."""
+    opset = await mngo_client.get_opset(opset_id)
+    if opset is None:
+        raise HTTPException(status_code=404, detail=f"Opset not found: {opset_id}")
+    return OperationSet(**opset)
+
+
+async def find_dataset(mngo_client: MongoClient, dataset_id: str) -> DataSet:
+    """The dataset, or a 404 if there is no such dataset (or the id isn't valid)."""
+    dataset = await mngo_client.get_dataset(dataset_id)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+    return DataSet(**dataset)
+
+
+def check_group_by(opset: OperationSet, dataset: DataSet):
+    if opset.group_by is not None and opset.group_by not in dataset.other_cols:
+        raise HTTPException(status_code=400, detail=f"Invalid group column: {opset.group_by}")
 
 
 @app.get("/tsapi/v1/tsop/{opset_id}")
 async def get_op_time_series(
-        opset_id: str, config: Settings = Depends(get_settings)
+        opset_id: str,
+        request: Request,
+        response: Response,
+        group: str | None = Query(None),
+        progressive: bool = Query(False),
+        config: Settings = Depends(get_settings)
 ) -> TimeSeries:
+    """
+    The opset time series, downsampled to at most MAX_POINTS.  With
+    progressive, the response is NDJSON with successively finer refinements
+    (see tsapi.progressive), so large opsets can be drawn before they load.
+    """
     logger.info("Get time series", opset_id=opset_id)
 
-    opset = await MongoClient(config).get_opset(opset_id)
-    opset = OperationSet(**opset)
-    logger.info('Retrieved opset', opset=opset)
-    dataset_data = await MongoClient(settings).get_dataset(opset.dataset_id)
-    dataset = DataSet(**dataset_data)
+    with stage('metadata'):
+        opset = await find_opset(MongoClient(config), opset_id)
+        logger.info('Retrieved opset', opset=opset)
+        dataset = await find_dataset(MongoClient(config), opset.dataset_id)
+
+    # The response only depends on these versions, so check before any data is
+    # loaded, or the file is looked at.  Replacing the file bumps the dataset version.
+    etag = make_etag(
+        opset.id, opset.version, dataset.id, dataset.version, group, *(['progressive'] if progressive else [])
+    )
+    last_modified = max((t for t in (opset.updated_at, dataset.updated_at) if t is not None), default=None)
+    if is_not_modified(request, etag, last_modified):
+        logger.info("Time series not modified", opset_id=opset_id)
+        return not_modified_response(etag, last_modified)
+    response.headers.update(cache_headers(etag, last_modified))
+
+    check_group_by(opset, dataset)
 
     ds_cache = DatasetCache(dataset, config, logger)
+    if progressive:
+        return StreamingResponse(
+            progressive_refinements(dataset, opset, group, ds_cache, get_storage(config), logger),
+            media_type="application/x-ndjson",
+            headers={**cache_headers(etag, last_modified), "X-Accel-Buffering": "no"}
+        )
 
     # Check if there's already a dataset for this opset
-    dataset_df = await ds_cache.get_operation_set(opset)
+    try:
+        with stage('load'):
+            if opset.group_by is not None and group is not None:
+                dataset_df = await ds_cache.get_operation_set_group(opset, group)
+            else:
+                dataset_df = await ds_cache.get_operation_set(opset)
+    except TsApiOperationError as e:
+        logger.error("Invalid operation", opset_id=opset_id, error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
 
     # We have to do downsampling here because it changes the number of rows
-    dataset_df = adjust_frequency(dataset_df, dataset.tscol)
+    with stage('adjust_frequency'):
+        if opset.group_by is not None and group is None:
+            dataset_df = adjust_frequency(dataset_df, dataset.tscol, group_col=opset.group_by)
+        else:
+            dataset_df = adjust_frequency(dataset_df, dataset.tscol)
     logger.info("Adjusted frequency")
 
-    tsdata = []
-    for x in dataset_df.iter_rows(named=True):
-        tsdata.append(TimeRecord(timestamp=x[dataset.tscol], data={k: x[k] for k in opset.series_ids}))
+    with stage('records'):
+        tsdata = time_records(dataset_df, dataset.tscol, opset)
 
     logger.info("Created time series data")
 
     return TimeSeries(id=opset_id, name="electricity", data=tsdata)
 
 
+@app.get("/tsapi/v1/tsop/{opset_id}/tail")
+async def tail_op_time_series(opset_id: str, config: Settings = Depends(get_settings)) -> StreamingResponse:
+    """
+    Server-Sent Events with the rows appended to the dataset after the
+    subscription starts, instead of polling /tsop for the whole window.  Each
+    `rows` event has the opset records from `since` onwards.
+    """
+    opset = await find_opset(MongoClient(config), opset_id)
+    dataset = await find_dataset(MongoClient(config), opset.dataset_id)
+
+    check_group_by(opset, dataset)
+
+    # Imported here, with Redis pub/sub, only when a tail is subscribed
+    from tsapi.live_tail import tail_events
+
+    return StreamingResponse(
+        tail_events(config, get_storage(config), dataset, opset, logger),
+        media_type='text/event-stream',
+        # Stop proxies (e.g. nginx) from buffering the events
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def load_align_frame(opset_id: str, config: Settings) -> AlignFrame:
+    mngo_client = MongoClient(config)
+    opset = await find_opset(mngo_client, opset_id)
+    dataset = await find_dataset(mngo_client, opset.dataset_id)
+
+    dataset_df = await DatasetCache(dataset, config, logger).get_operation_set(opset)
+
+    return AlignFrame(name=opset.id, df=dataset_df, tscol=dataset.tscol, series_cols=opset.series_ids)
+
+
+@app.post("/tsapi/v1/tsop/align")
+async def get_aligned_time_series(
+        align_req: AlignedRequest,
+        config: Settings = Depends(get_settings)
+) -> AlignedTimeSeries:
+    """
+    Load several opsets (possibly from different datasets) concurrently, join
+    them on their timestamps and downsample the result once.  Series are
+    named `<opset id>:<series id>`.
+    """
+    logger.info("Get aligned time series", opset_ids=align_req.opset_ids)
+
+    try:
+        # Before any data is loaded
+        check_durations(every=align_req.every, tolerance=align_req.tolerance)
+        frames = await asyncio.gather(
+            *[load_align_frame(opset_id, config) for opset_id in align_req.opset_ids]
+        )
+        aligned_df = align_frames(frames, every=align_req.every, tolerance=align_req.tolerance)
+    except TsApiOperationError as e:
+        logger.error("Invalid operation", opset_ids=align_req.opset_ids, error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info("Aligned time series", rows=len(aligned_df))
+
+    return AlignedTimeSeries(
+        timestamps=aligned_df[ALIGNED_TSCOL].to_list(),
+        series={col: aligned_df[col].to_list() for col in aligned_df.columns if col != ALIGNED_TSCOL}
+    )
+
+
+async def get_series_periods(
+        opset: OperationSet, dataset: DataSet, series_id: str, dataset_df: pl.DataFrame, config: Settings
+) -> list[int]:
+    """
+    Seasonal periods of an opset series.  Raw series are analyzed at ingest and
+    stored with the dataset; derived (operations) or grouped series are analyzed
+    on first use and stored with the opset.
+    """
+    derived = len(opset.operations) > 0 or opset.group_by is not None
+    stored = opset.periods if derived else dataset.periods
+    if series_id in stored:
+        return stored[series_id]
+
+    if opset.group_by is not None and dataset_df[opset.group_by].n_unique() > 1:
+        # Use the longest series to find the season for all the groups
+        largest_group = dataset_df[opset.group_by].value_counts(sort=True)[opset.group_by][0]
+        dataset_df = dataset_df.filter(pl.col(opset.group_by).eq_missing(largest_group))
+
+    dataset_df = dataset_df.sort(dataset.tscol)
+    periods = series_periods(dataset_df[series_id], dataset_df[dataset.tscol])
+    logger.info("Detected seasonal periods", series_id=series_id, periods=periods)
+
+    stored = {**stored, series_id: periods}
+    if derived:
+        await MongoClient(config).update_opset_periods(opset.id, stored)
+    else:
+        await MongoClient(config).update_dataset_periods(dataset.id, stored)
+
+    return periods
+
+
 @app.post("/tsapi/v1/forecast")
 async def create_forecast(
         forecast_req: ForecastRequest,
         config: Settings = Depends(get_settings)) -> ForecastResponse:
 
-    opset = await MongoClient(config).get_opset(forecast_req.opset_id)
-    opset = OperationSet(**opset)
-    logger.info('Retrieved opset', opset=opset)
-    dataset_data = await MongoClient(settings).get_dataset(opset.dataset_id)
-    dataset = DataSet(**dataset_data)
+    with stage('metadata'):
+        opset = await find_opset(MongoClient(config), forecast_req.opset_id)
+        logger.info('Retrieved opset', opset=opset)
+        dataset = await find_dataset(MongoClient(config), opset.dataset_id)
+
+    check_group_by(opset, dataset)
 
     ds_cache = DatasetCache(dataset, config, logger)
     # Check if there's already a dataset for this opset
-    dataset_df = await ds_cache.get_operation_set(opset)
+    try:
+        with stage('load'):
+            if opset.group_by is not None and forecast_req.group is not None:
+                dataset_df = await ds_cache.get_operation_set_group(opset, forecast_req.group)
+            else:
+                dataset_df = await ds_cache.get_operation_set(opset)
+    except TsApiOperationError as e:
+        logger.error("Invalid operation", opset_id=opset.id, error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
 
-    forecast_result = forecast(
-        dataset_df[forecast_req.series_id],
-        dataset_df[dataset.tscol],
-        horizon=forecast_req.horizon)
+    # Derived series (e.g. diff, rolling) have leading nulls that can't be fit
+    dataset_df = dataset_df.drop_nulls(forecast_req.series_id)
+    with stage('periods'):
+        periods = await get_series_periods(opset, dataset, forecast_req.series_id, dataset_df, config)
+
+    # Fits run on the forecast workers if there are any, otherwise in this replica
+    fit = pooled_forecast_frame
+    if config.forecast_queue:
+        from tsapi.forecast_queue import get_forecast_queue
+        fit = get_forecast_queue(config).forecast_frame
+
+    if opset.group_by is not None and forecast_req.group is None:
+        with stage('forecast'):
+            group_results = await forecast_groups(
+                dataset_df,
+                forecast_req.series_id,
+                dataset.tscol,
+                opset.group_by,
+                horizon=forecast_req.horizon,
+                level=forecast_req.level,
+                model_key=(opset.id, forecast_req.series_id),
+                periods=periods,
+                fit=fit
+            )
+
+        records = []
+        failed = []
+        for group, forecast_result in group_results.items():
+            if isinstance(forecast_result, Exception):
+                logger.error("Forecast failed", group=group, error=str(forecast_result))
+                failed.append(group)
+                continue
+            records.extend(
+                TimeRecord(timestamp=t, data=data, group=group) for t, data in forecast_records(forecast_result)
+            )
+
+        return ForecastResponse(
+            forecast=records,
+            error=f"Forecast failed for groups: {', '.join(failed)}" if failed else None
+        )
+
+    with stage('forecast'):
+        try:
+            forecast_result = forecast_records(await fit(
+                dataset_df[forecast_req.series_id],
+                dataset_df[dataset.tscol],
+                forecast_req.horizon,
+                forecast_req.level,
+                (opset.id, forecast_req.series_id, forecast_req.group),
+                periods))
+        except TsApiForecastTimeoutError as e:
+            logger.error("Forecast timed out", opset_id=opset.id, error=str(e))
+            raise HTTPException(status_code=504, detail=str(e))
+        except TsApiForecastError as e:
+            logger.error("Forecast failed", opset_id=opset.id, error=str(e))
+            raise HTTPException(status_code=500, detail=str(e))
     return ForecastResponse(
-        forecast=[TimeRecord(timestamp=t, data=data) for t, data in forecast_result],
+        forecast=[TimeRecord(timestamp=t, data=data, group=forecast_req.group) for t, data in forecast_result],
     )
 
 
+@app.post("/tsapi/v1/backtest")
+async def create_backtest(
+        backtest_req: BacktestRequest,
+        config: Settings = Depends(get_settings)) -> BacktestResponse:
+    """
+    Evaluate forecasts for an opset series with rolling-origin folds, each
+    fit in parallel with the same model as /forecast.
+    """
+    opset = await find_opset(MongoClient(config), backtest_req.opset_id)
+    dataset = await find_dataset(MongoClient(config), opset.dataset_id)
+    check_group_by(opset, dataset)
+
+    ds_cache = DatasetCache(dataset, config, logger)
+    try:
+        if opset.group_by is not None and backtest_req.group is not None:
+            dataset_df = await ds_cache.get_operation_set_group(opset, backtest_req.group)
+        else:
+            dataset_df = await ds_cache.get_operation_set(opset)
+
+        dataset_df = dataset_df.drop_nulls(backtest_req.series_id).sort(dataset.tscol)
+        periods = await get_series_periods(opset, dataset, backtest_req.series_id, dataset_df, config)
+        result = await backtest(
+            dataset_df[backtest_req.series_id],
+            dataset_df[dataset.tscol],
+            horizon=backtest_req.horizon,
+            folds=backtest_req.folds,
+            level=backtest_req.level,
+            periods=periods
+        )
+    except TsApiDataError as e:
+        logger.error("Backtest failed", opset_id=opset.id, error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    except TsApiForecastError as e:
+        logger.error("Backtest failed", opset_id=opset.id, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    for fold in result.folds:
+        if fold.error is not None:
+            logger.error("Backtest fold failed", opset_id=opset.id, fold=fold.fold, error=fold.error)
+    logger.info("Backtest complete", opset_id=opset.id, folds=len(result.folds), seconds=result.compute_seconds)
+
+    return result
+
+
 @app.post("/tsapi/v1/files")
 async def create_file(
         name: Annotated[str, File()],
         upload_type: Annotated[str, File()],
-        file: Annotated[bytes, File()]
+        file: Annotated[bytes, File()],
+        compact: Annotated[bool, File()] = False,
+        allow_float32: Annotated[bool, File()] = False,
+        config: Settings = Depends(get_settings)
 ) -> DataSet:
     logger.info("Received file: ", name=name, upload_type=upload_type)
 
     try:
         if upload_type == "add":
-            dataset = save_dataset(name, settings.data_dir, file, logger)
+            dataset = save_dataset(name, get_storage(config), file, logger, compact, allow_float32)
         elif upload_type == "import":
-            dataset = save_dataset_source(name, settings.data_dir, file)
+            dataset = save_dataset_source(name, get_storage(config), file, logger, compact, allow_float32)
         else:
             raise HTTPException(status_code=400, detail="Invalid upload type")
 
-        dataset_id = await MongoClient(settings).insert_dataset(dataset.model_dump())
+        if dataset.compaction is not None:
+            logger.info("Compacted dataset", name=name, **dataset.compaction.model_dump())
+
+        dataset_id = await MongoClient(config).save_dataset(dataset.model_dump())
     except TsApiNoTimestampError as e:
         logger.error("No timestamp column found", name=name, error=str(e))
         raise HTTPException(status_code=400, detail=str(e))
@@ -275,17 +626,18 @@ async def create_file(
         logger.error("Unexpected error", name=name, error=str(e))
         raise HTTPException(status_code=400, detail=str(e))
 
-    return await MongoClient(settings).get_dataset(dataset_id)
+    return await MongoClient(config).get_dataset(dataset_id)
 
 
 @app.put("/tsapi/v1/upload")
 async def store_file(
         request: Request,
         name: str = Query(...),
-        upload_type: str = Query(...)
+        upload_type: str = Query(...),
+        config: Settings = Depends(get_settings)
 ) -> DataSet:
     data = await request.body()
-    store_dataset(name, settings.data_dir, data, upload_type, logger)
+    store_dataset(name, get_storage(config), data, upload_type, logger)
 
     return JSONResponse(content={"message": "File stored successfully"})
 
@@ -299,10 +651,10 @@ async def create_signed_url(
     """
     file_type = 'parquet' if dataset_req.upload_type == 'add' else 'csv'
 
-    if settings.env != 'local':
+    if config.env != 'local':
         signed_url = generate_signed_url(
-            bucket_name='tsnext_bucket',
-            blob_name=f'datasets/{dataset_req.name}.{file_type}',
+            bucket_name=config.gcs_bucket,
+            blob_name=f'{config.gcs_prefix}{dataset_req.name}.{file_type}',
             expiration_minutes=5
         )
 
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from tsapi.admission import (
+    EXEMPT, FORECAST, TSOP, AdmissionController, AdmissionMiddleware, Limiter, Overloaded, route_class
+)
+
+
+def test_route_class():
+    assert route_class("GET", "/health") is EXEMPT
+    assert route_class("GET", "/tsapi/v1/tsop/abc/tail") is EXEMPT
+    assert route_class("OPTIONS", "/tsapi/v1/forecast") is EXEMPT
+    assert route_class("POST", "/tsapi/v1/forecast") is FORECAST
+    assert route_class("GET", "/tsapi/v1/tsop/abc") is TSOP
+    assert route_class("POST", "/tsapi/v1/tsop/align") is TSOP
+    assert route_class("GET", "/tsapi/v1/datasets").name == "default"
+
+
+@pytest.mark.asyncio()
+async def test_limiter_priority():
+    limiter = Limiter(1, 10)
+    await limiter.acquire()
+
+    order = []
+
+    async def request(name, priority):
+        await limiter.acquire(priority)
+        order.append(name)
+        limiter.release()
+
+    tasks = [
+        asyncio.create_task(request("heavy", 3)),
+        asyncio.create_task(request("cheap", 1)),
+        asyncio.create_task(request("heavy2", 3)),
+    ]
+    await asyncio.sleep(0)
+    assert limiter.queued == 3
+
+    limiter.release()
+    await asyncio.gather(*tasks)
+
+    assert order == ["cheap", "heavy", "heavy2"]
+    assert limiter.active == 0
+
+
+@pytest.mark.asyncio()
+async def test_limiter_rejects():
+    limiter = Limiter(1, 1)
+    await limiter.acquire()
+
+    waiter = asyncio.create_task(limiter.acquire(timeout=0.05))
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded) as e:
+        await limiter.acquire()
+    assert e.value.reason == "queue_full"
+    assert e.value.retry_after >= 1
+
+    with pytest.raises(Overloaded) as e:
+        await waiter
+    assert e.value.reason == "timeout"
+    assert limiter.queued == 0
+
+    limiter.release()
+    assert limiter.active == 0
+
+
+def test_middleware():
+    app = FastAPI()
+
+    @app.get("/slow")
+    def slow():
+        time.sleep(0.2)
+        return PlainTextResponse("done")
+
+    @app.get("/health")
+    def health():
+        return PlainTextResponse("OK")
+
+    controller = AdmissionController(1, {}, max_queue=0, max_queue_seconds=1)
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+
+    with TestClient(app) as client:
+        async def burst():
+            loop = asyncio.get_running_loop()
+            return await asyncio.gather(*[loop.run_in_executor(None, client.get, "/slow") for _ in range(3)])
+
+        responses = asyncio.run(burst())
+        codes = sorted(response.status_code for response in responses)
+        assert codes[0] == 200
+        assert 503 in codes
+        assert all("retry-after" in response.headers for response in responses if response.status_code == 503)
+
+        # Health checks aren't held back by the limit
+        assert client.get("/health").status_code == 200
+
+    stats = controller.stats["default"]
+    assert stats.admitted + stats.rejected_queue_full == 3
+    assert stats.in_flight == 0
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+
+import polars as pl
+import pytest
+
+from tsapi.align import ALIGNED_TSCOL, AlignFrame, align_frames
+from tsapi.constants import MAX_POINTS
+from tsapi.errors import TsApiOperationError
+
+
+@pytest.fixture()
+def hourly_df():
+    return pl.DataFrame(
+        {
+            "ts": pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 1, 1, 5), interval='1h', eager=True),
+            "a": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+        }
+    )
+
+
+@pytest.fixture()
+def offset_df():
+    return pl.DataFrame(
+        {
+            "time": [datetime(2024, 1, 1, 0, 30), datetime(2024, 1, 1, 2, 30)],
+            "b": [10, 30],
+            "label": ["x", "y"],
+        }
+    )
+
+
+def test_align_asof(hourly_df, offset_df):
+    frames = [AlignFrame("one", hourly_df, "ts", ["a"]), AlignFrame("two", offset_df, "time", [])]
+    aligned = align_frames(frames)
+
+    assert aligned.columns == [ALIGNED_TSCOL, "one:a", "two:b"]
+    assert len(aligned) == 6
+    assert aligned["two:b"].to_list() == [None, 10.0, 10.0, 30.0, 30.0, 30.0]
+
+
+def test_align_asof_tolerance(hourly_df, offset_df):
+    frames = [AlignFrame("one", hourly_df, "ts", ["a"]), AlignFrame("two", offset_df, "time", ["b"])]
+    aligned = align_frames(frames, tolerance='1h')
+
+    assert aligned["two:b"].to_list() == [None, 10.0, None, 30.0, None, None]
+
+
+def test_align_buckets(hourly_df, offset_df):
+    frames = [AlignFrame("one", hourly_df, "ts", ["a"]), AlignFrame("two", offset_df, "time", ["b"])]
+    aligned = align_frames(frames, every='2h')
+
+    assert aligned[ALIGNED_TSCOL].to_list() == [datetime(2024, 1, 1, h) for h in (0, 2, 4)]
+    assert aligned["one:a"].to_list() == [1.5, 3.5, 5.5]
+    assert aligned["two:b"].to_list() == [10.0, 30.0, None]
+
+
+def test_align_time_zones(hourly_df):
+    utc_df = hourly_df.with_columns(pl.col("ts").dt.replace_time_zone("UTC"))
+    eastern_df = utc_df.with_columns(pl.col("ts").dt.convert_time_zone("America/New_York"))
+    frames = [AlignFrame("utc", utc_df, "ts", ["a"]), AlignFrame("est", eastern_df, "ts", ["a"])]
+    aligned = align_frames(frames)
+
+    assert aligned["utc:a"].to_list() == aligned["est:a"].to_list()
+    assert aligned[ALIGNED_TSCOL][0] == datetime(2024, 1, 1, tzinfo=timezone.utc).replace(tzinfo=None)
+
+
+def test_align_downsamples():
+    ts = pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 1, 1) + timedelta(minutes=3 * MAX_POINTS),
+                           interval='1m', eager=True)
+    df = pl.DataFrame({"ts": ts, "a": range(len(ts))})
+    aligned = align_frames([AlignFrame("one", df, "ts", ["a"]), AlignFrame("two", df, "ts", ["a"])])
+
+    assert len(aligned) <= MAX_POINTS
+
+
+@pytest.mark.parametrize("every, tolerance", [("bogus", None), ("-1h", None), ("0h", None), (None, "5 minutes")])
+def test_align_invalid_durations(hourly_df, every, tolerance):
+    frames = [AlignFrame("h", hourly_df, "ts", ["a"])]
+
+    with pytest.raises(TsApiOperationError):
+        align_frames(frames, every=every, tolerance=tolerance)
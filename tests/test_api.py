@@ -42,6 +42,18 @@ def test_insert_opset():
         assert response.json()['dataset_id'] == opset.dataset_id
 
 
+def test_missing_opset():
+    with TestClient(app) as client:
+        app.dependency_overrides[get_settings] = override_get_settings
+        missing = "0" * 24
+        assert client.get(f"/tsapi/v1/opsets/{missing}").status_code == 404
+        assert client.get(f"/tsapi/v1/tsop/{missing}").status_code == 404
+        assert client.get("/tsapi/v1/tsop/not-an-id/tail").status_code == 404
+        request = {"opset_id": missing, "series_id": "value"}
+        assert client.post("/tsapi/v1/forecast", json=request).status_code == 404
+        assert client.post("/tsapi/v1/backtest", json=request).status_code == 404
+
+
 # def test_forecast():
 #     with TestClient(app) as client:
 #         app.dependency_overrides[get_settings] = override_get_settings
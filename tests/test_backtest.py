@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+import pytest
+
+import tsapi.backtest as backtest_module
+from tsapi.backtest import backtest, fold_errors, fold_origins
+from tsapi.errors import TsApiDataError, TsApiForecastError
+
+
+def test_fold_origins():
+    assert fold_origins(100, 10, 3, min_train=10) == [70, 80, 90]
+
+
+def test_fold_origins_not_enough_data():
+    with pytest.raises(TsApiDataError):
+        fold_origins(30, 10, 3, min_train=9)
+
+    with pytest.raises(TsApiDataError):
+        fold_origins(30, 10, 0, min_train=9)
+
+
+def test_fold_errors():
+    actual = np.array([1.0, 0.0, 4.0])
+    errors = fold_errors(actual, np.array([2.0, 1.0, 4.0]), actual - 1, actual + 0.5)
+
+    assert errors['mae'] == pytest.approx(2 / 3)
+    # The zero actual is left out of the percentage error
+    assert errors['mape'] == pytest.approx(0.5)
+    assert errors['coverage'] == 1.0
+
+
+@pytest.mark.asyncio()
+async def test_backtest():
+    ts = pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 1, 10, 23), interval='1h', eager=True)
+    values = pl.Series("value", np.sin(np.arange(len(ts)) * 2 * np.pi / 24) + 5)
+
+    result = await backtest(values, ts, horizon=12, folds=4)
+
+    assert len(result.folds) == 4
+    assert [f.train_size for f in result.folds] == [192, 204, 216, 228]
+    assert result.folds[-1].end == ts[-1]
+    assert result.mae < 1.0
+    assert result.compute_seconds > 0
+
+
+@pytest.mark.asyncio()
+async def test_backtest_failed_folds(monkeypatch):
+    ts = pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 1, 10, 23), interval='1h', eager=True)
+    values = pl.Series("value", np.sin(np.arange(len(ts)) * 2 * np.pi / 24) + 5)
+    run_fold = backtest_module.run_fold
+
+    def failing_fold(y, origin, *args):
+        if origin == 204:
+            raise ValueError("fit failed")
+        return run_fold(y, origin, *args)
+
+    monkeypatch.setattr(backtest_module, "get_process_pool", lambda: ThreadPoolExecutor(4))
+    monkeypatch.setattr(backtest_module, "run_fold", failing_fold)
+    result = await backtest(values, ts, horizon=12, folds=4)
+
+    assert result.folds[1].error == "fit failed"
+    assert result.folds[1].mae is None
+    assert result.error == "Backtest failed for folds: 1"
+    assert result.mae == pytest.approx(np.mean([result.folds[i].mae for i in (0, 2, 3)]))
+
+    monkeypatch.setattr(backtest_module, "run_fold", lambda *args: 1 / 0)
+    with pytest.raises(TsApiForecastError):
+        await backtest(values, ts, horizon=12, folds=4)
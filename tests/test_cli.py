@@ -0,0 +1,83 @@
+import asyncio
+import io
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+import structlog
+
+from tsapi.cli import Progress, TaskResult, dataset_info, find_files, ingest_file, parser, run_bounded
+from tsapi.dataset_storage import DatasetStorage
+from tsapi.object_store import MemoryStore
+
+
+def make_frame(num_rows=100):
+    return pl.DataFrame({
+        "timestamp": [datetime(2024, 1, 13) + timedelta(hours=i) for i in range(num_rows)],
+        "value": [float(i) for i in range(num_rows)],
+    })
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    make_frame().write_parquet(tmp_path / "hourly.parquet")
+    make_frame(50).write_csv(tmp_path / "small.csv")
+    (tmp_path / "notes.txt").write_text("not a dataset")
+    return tmp_path
+
+
+def test_parser():
+    args = parser().parse_args(["--workers", "8", "ingest", "data", "--compact"])
+    assert (args.command, args.workers, args.directory) == ("ingest", 8, "data")
+    assert (args.compact, args.replace) == (True, False)
+
+    args = parser().parse_args(["rebuild", "a", "b"])
+    assert args.names == ["a", "b"]
+
+
+def test_ingest_file(data_dir):
+    storage = DatasetStorage(MemoryStore())
+    logger = structlog.get_logger()
+
+    assert [path.name for path in find_files(str(data_dir))] == ["hourly.parquet", "small.csv"]
+
+    dataset = ingest_file(data_dir / "hourly.parquet", storage, logger)
+    assert (dataset.name, dataset.max_length, dataset.series_cols) == ("hourly", 100, ["value"])
+
+    dataset = ingest_file(data_dir / "small.csv", storage, logger, compact=True)
+    assert (dataset.name, dataset.max_length) == ("small", 50)
+    assert dataset.compaction is not None
+    assert storage.store.exists("small_source.csv")
+    assert len(storage.read_parquet("small.parquet")) == 50
+
+
+def test_run_bounded():
+    running = 0
+    peak = 0
+
+    async def task(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if i == 3:
+            raise ValueError("bad file")
+        return TaskResult(str(i), rows=10, bytes=1000)
+
+    out = io.StringIO()
+    progress = Progress(6, out)
+    results = asyncio.run(run_bounded([(str(i), i) for i in range(6)], task, 2, progress))
+
+    assert peak == 2
+    assert [r.error for r in results if r.error] == ["bad file"]
+    assert out.getvalue().count("\n") == 6
+    assert progress.summary().startswith("5 done, 1 failed, 0 skipped")
+
+
+def test_dataset_info(data_dir):
+    out = io.StringIO()
+    dataset_info(str(data_dir / "hourly.parquet"), out)
+
+    assert "100 rows" in out.getvalue()
+    assert "max=99.0 nulls=0" in out.getvalue()
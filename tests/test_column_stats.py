@@ -0,0 +1,80 @@
+from datetime import date, datetime
+
+import polars as pl
+import pytest
+
+from tsapi.column_stats import StatsBuilder, chunk_stats, column_stats, dataset_stats
+
+
+@pytest.fixture()
+def stats_df():
+    return pl.DataFrame(
+        {
+            "timestamp": pl.datetime_range(
+                datetime(2024, 1, 1), datetime(2024, 1, 10), interval='1d', eager=True
+            ),
+            "series1": list(range(10)),
+            "series2": [1.0, None, 3.0, float('nan'), 5.0, 6.0, 7.0, 8.0, 9.0, 10.0],
+        }
+    )
+
+
+def test_column_stats(stats_df):
+    stats = column_stats(stats_df, ["series1", "series2"])
+
+    assert [s.name for s in stats] == ["series1", "series2"]
+    assert stats[0].count == 10
+    assert stats[0].min == 0
+    assert stats[0].max == 9
+    assert stats[0].mean == 4.5
+    assert stats[1].null_count == 1
+    assert stats[1].count == 8
+    assert stats[1].min == 1.0
+
+
+def test_chunk_stats(stats_df):
+    chunks = chunk_stats(stats_df.reverse(), "timestamp", ["series1"], num_chunks=5)
+
+    assert len(chunks) == 5
+    assert sum(c.rows for c in chunks) == 10
+    assert chunks[0].start == datetime(2024, 1, 1)
+    assert chunks[0].min["series1"] == 0
+    assert chunks[-1].max["series1"] == 9
+
+
+def test_dataset_stats_dates():
+    df = pl.DataFrame({"day": [date(2024, 1, 2), date(2024, 1, 1)], "x": [1, 2]})
+    stats = dataset_stats(df, "day", ["x"])
+
+    assert stats.rows == 2
+    assert stats.start == datetime(2024, 1, 1)
+    assert stats.end == datetime(2024, 1, 2)
+
+
+def test_dataset_stats_empty():
+    df = pl.DataFrame({"timestamp": [], "x": []}, schema={"timestamp": pl.Datetime, "x": pl.Float64})
+    stats = dataset_stats(df, "timestamp", ["x"])
+
+    assert stats.rows == 0
+    assert stats.start is None
+    assert stats.chunks == []
+
+
+def test_stats_builder():
+    df = pl.DataFrame({
+        "timestamp": pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 1, 1, 16, 39), interval='1m', eager=True),
+        "x": [float(i % 17) if i % 11 else None for i in range(1000)],
+    })
+    builder = StatsBuilder("timestamp", ["x"], num_chunks=10)
+    for i in range(0, 1000, 30):
+        builder.add(df.slice(i, 30))
+    stats = builder.build()
+    expected = dataset_stats(df, "timestamp", ["x"], num_chunks=10)
+
+    assert (stats.rows, stats.start, stats.end) == (expected.rows, expected.start, expected.end)
+    assert stats.columns[0].count == expected.columns[0].count
+    assert stats.columns[0].null_count == expected.columns[0].null_count
+    assert stats.columns[0].mean == pytest.approx(expected.columns[0].mean)
+    assert stats.columns[0].std == pytest.approx(expected.columns[0].std)
+    assert len(stats.chunks) == 10
+    assert sum(c.rows for c in stats.chunks) == 1000
@@ -0,0 +1,70 @@
+import io
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from tsapi.compaction import compact_dataset, compact_frame, downcast_float, downcast_int
+from tsapi.dataset_storage import DatasetStorage
+from tsapi.model.dataset import DataSet, write_dataset
+from tsapi.object_store import MemoryStore
+
+
+@pytest.fixture
+def df():
+    start = datetime(2024, 1, 1)
+    n = 10000
+    return pl.DataFrame({
+        "timestamp": [start + timedelta(minutes=i) for i in range(n)],
+        "count": [i % 100 for i in range(n)],
+        "half": [i * 0.5 for i in range(n)],
+        "value": [i * 0.1 for i in range(n)],
+        "sensor": [f"sensor-{i % 4}" for i in range(n)],
+        "note": [f"note {i}" for i in range(n)],
+    }).reverse()
+
+
+def test_downcast_int():
+    assert downcast_int(pl.Series([1, 200])) == pl.Int16
+    assert downcast_int(pl.Series([-100, 100, None])) == pl.Int8
+    assert downcast_int(pl.Series([0, 300], dtype=pl.UInt64)) == pl.UInt16
+    assert downcast_int(pl.Series([2 ** 40])) == pl.Int64
+
+
+def test_downcast_float():
+    # Exactly representable in Float32
+    assert downcast_float(pl.Series([0.5, 1.25, None, float("nan")])) == pl.Float32
+    # 0.1 isn't, so it is only downcast if allowed
+    assert downcast_float(pl.Series([0.1])) == pl.Float64
+    assert downcast_float(pl.Series([0.1]), allow_float32=True) == pl.Float32
+
+
+def test_compact_frame(df):
+    compacted, dtypes = compact_frame(df, "timestamp", ["sensor", "note"])
+
+    assert dtypes == {"count": "Int8", "half": "Float32", "sensor": "Categorical"}
+    assert compacted["timestamp"].is_sorted()
+    # Lossless: the same values after sorting
+    assert compacted.cast(df.schema).equals(df.sort("timestamp"))
+
+
+def test_compact_dataset(df):
+    compacted_df, data, report = compact_dataset(df, "timestamp", ["sensor", "note"])
+
+    assert report.compacted_bytes == len(data)
+    assert report.compacted_bytes < report.original_bytes
+    assert report.sorted
+    assert pl.read_parquet(io.BytesIO(data)).equals(compacted_df)
+
+
+def test_write_dataset(df):
+    storage = DatasetStorage(MemoryStore())
+    dataset = DataSet.from_dataframe(df, "compact")
+
+    write_dataset(dataset, df, storage, compact=True)
+
+    assert dataset.compaction is not None
+    assert dataset.compaction.dtypes["sensor"] == "Categorical"
+    stored = storage.read_parquet(dataset.file_name)
+    assert stored.schema["count"] == pl.Int8
+    assert stored["timestamp"].is_sorted()
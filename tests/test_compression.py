@@ -0,0 +1,145 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from tsapi.compression import THREAD_COMPRESS_SIZE, CompressedCache, CompressionMiddleware, negotiate_encoding
+from tsapi.settings import Settings
+
+BODY = "0123456789" * 500
+LARGE_BODY = "0123456789" * (THREAD_COMPRESS_SIZE // 5)
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/big")
+    def big():
+        return PlainTextResponse(BODY, headers={"ETag": '"v1"'})
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse(LARGE_BODY)
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("tiny")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([BODY, BODY]), media_type="text/plain")
+
+    @app.get("/encoded")
+    def encoded():
+        return Response(gzip.compress(BODY.encode()), headers={"Content-Encoding": "gzip"})
+
+    return app
+
+
+@pytest.fixture()
+def compressed_app():
+    app = make_app()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+    return app
+
+
+def test_negotiate_encoding():
+    encodings = ['zstd', 'br', 'gzip']
+
+    assert negotiate_encoding('gzip, deflate, br, zstd', encodings) == 'zstd'
+    assert negotiate_encoding('gzip, br;q=0.9', encodings) == 'gzip'
+    assert negotiate_encoding('br, zstd;q=0', encodings) == 'br'
+    assert negotiate_encoding('*', encodings) == 'zstd'
+    assert negotiate_encoding('identity', encodings) is None
+    assert negotiate_encoding('', encodings) is None
+    assert negotiate_encoding('gzip;q=0', encodings) is None
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+def test_compressed_response(compressed_app, encoding):
+    with TestClient(compressed_app) as client:
+        response = client.get("/big", headers={"Accept-Encoding": encoding})
+
+        assert response.headers["content-encoding"] == encoding
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.headers["etag"] == 'W/"v1"'
+        assert int(response.headers["content-length"]) < len(BODY)
+        # httpx decodes gzip, brotli and zstd when the libraries are installed
+        assert response.text == BODY
+
+
+def test_compressed_response_cached():
+    middleware = CompressionMiddleware(make_app(), minimum_size=100, cache_bytes=1024 * 1024)
+
+    with TestClient(middleware) as client:
+        first = client.get("/big", headers={"Accept-Encoding": "gzip"})
+        second = client.get("/big", headers={"Accept-Encoding": "gzip"})
+
+        assert len(middleware.cache.entries) == 1
+        assert first.content == second.content == BODY.encode()
+        # Responses without an ETag aren't cached
+        client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert len(middleware.cache.entries) == 1
+
+
+def test_cached_body_changed(monkeypatch):
+    middleware = CompressionMiddleware(make_app(), minimum_size=100, cache_bytes=1024 * 1024)
+
+    with TestClient(middleware) as client:
+        client.get("/big", headers={"Accept-Encoding": "gzip"})
+        # Other contents under the same ETag aren't served from the cache
+        monkeypatch.setattr(__name__ + ".BODY", "9876543210" * 500)
+        response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+
+        assert response.content == BODY.encode()
+        assert len(middleware.cache.entries) == 2
+
+
+def test_large_response(compressed_app):
+    # Compressed on a thread
+    response = TestClient(compressed_app).get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == LARGE_BODY.encode()
+
+
+def test_configured_from_settings():
+    app = make_app()
+    app.state.settings = Settings(data_dir=".", compression_min_size=100, compression_cache_mb=1)
+    middleware = CompressionMiddleware(app)
+
+    # Starlette puts the app in the scope of the requests it passes to its middleware
+    middleware.configure({'type': 'http', 'app': app})
+
+    assert middleware.minimum_size == 100
+    assert middleware.cache.max_bytes == 1024 * 1024
+
+
+def test_uncompressed_responses(compressed_app):
+    with TestClient(compressed_app) as client:
+        for path in ["/small", "/stream"]:
+            response = client.get(path, headers={"Accept-Encoding": "gzip"})
+            assert "content-encoding" not in response.headers
+
+        response = client.get("/big", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.text == BODY
+
+        response = client.get("/encoded", headers={"Accept-Encoding": "zstd"})
+        assert response.headers["content-encoding"] == "gzip"
+
+
+def test_compressed_cache():
+    cache = CompressedCache(max_bytes=10)
+    cache.put(('"a"', 'gzip', 1), b'12345')
+    cache.put(('"b"', 'gzip', 1), b'12345')
+    assert cache.get(('"a"', 'gzip', 1)) == b'12345'
+
+    cache.put(('"c"', 'gzip', 1), b'123')
+    assert cache.get(('"b"', 'gzip', 1)) is None
+    assert cache.size == 8
+
+    cache.put(('"d"', 'gzip', 1), b'x' * 11)
+    assert cache.get(('"d"', 'gzip', 1)) is None
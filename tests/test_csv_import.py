@@ -0,0 +1,174 @@
+import io
+from datetime import date, datetime
+
+import polars as pl
+import pytest
+import structlog
+
+from tsapi.column_stats import dataset_stats
+from tsapi.csv_import import ERROR_COL, WidenColumns, import_csv, read_chunks, sample_schema
+from tsapi.dataset_storage import DatasetStorage
+from tsapi.errors import TsApiDataError
+from tsapi.model.dataset import convert_csv
+from tsapi.object_store import MemoryStore
+
+
+def make_csv(num_rows, timestamp_format="%Y-%m-%d %H:%M:%S"):
+    lines = ["timestamp,value,name,"]
+    for i in range(num_rows):
+        # From the 13th, so day first and month first formats can be told apart
+        ts = datetime(2024, 1, 13 + i // 1440, (i // 60) % 24, i % 60)
+        lines.append(f"{ts.strftime(timestamp_format)},{i * 0.5},s{i % 3},{i}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def convert(data, **kwargs):
+    sink = io.BytesIO()
+    result = import_csv(io.BytesIO(data), sink, **kwargs)
+    return result, pl.read_parquet(io.BytesIO(sink.getvalue()))
+
+
+def test_sample_schema():
+    schema = sample_schema(make_csv(100, "%d/%m/%Y %H:%M"))
+
+    assert schema.columns == ["timestamp", "value", "name", "Unk:0"]
+    assert schema.dtypes["timestamp"] == pl.Datetime("us")
+    assert schema.formats == {"timestamp": "%d/%m/%Y %H:%M"}
+    assert schema.dtypes["value"] == pl.Float64
+    assert schema.dtypes["name"] == pl.String
+    assert schema.dtypes["Unk:0"] == pl.Int64
+
+
+def test_sample_time_zones():
+    data = b"timestamp,value\n2024-01-01T00:00:00Z,1\n2024-01-01T03:00:00+02:00,2\n2024-01-01 02:00:00.5+0000,3\n"
+    result, df = convert(data)
+    expected = pl.read_csv(io.BytesIO(data), try_parse_dates=True)
+
+    assert df.schema["timestamp"] == pl.Datetime("us", "UTC")
+    assert result.rejected is None
+    assert df["timestamp"].to_list() == expected["timestamp"].to_list()
+
+
+def test_sample_integers():
+    big = 2 ** 53 + 1
+    result, df = convert(f"timestamp,id,value\n2024-01-01,{big},1\n2024-01-02,2,2.5\n".encode())
+
+    # Integers keep their type and precision, a fraction makes the column Float64
+    assert df.schema["id"] == pl.Int64
+    assert df["id"].to_list() == [big, 2]
+    assert df.schema["value"] == pl.Float64
+
+
+def test_sample_bad_value():
+    data = b"timestamp,value\n" + b"".join(f"2024-01-01 00:00:{i:02d},{i}\n".encode() for i in range(20))
+    result, df = convert(data + b"2024-01-01 00:01:00,n/a\n")
+
+    # One bad value in a small sample doesn't make the column a string one
+    assert df.schema["value"] == pl.Int64
+    assert result.rows == 20
+    assert result.rejected_rows == 1
+
+
+def test_widen_integers():
+    lines = [f"2024-01-01 00:00:00,{i}" for i in range(50000)] + ["2024-01-02 00:00:00,1.5"]
+    data = ("timestamp,value\n" + "\n".join(lines) + "\n").encode()
+    with pytest.raises(WidenColumns) as e:
+        convert(data)
+    assert e.value.columns == ["value"]
+
+    storage = DatasetStorage(MemoryStore())
+    dataset = convert_csv("ints", storage, io.BytesIO(data), structlog.get_logger())
+    df = storage.read_parquet(dataset.file_name)
+
+    # The later fraction makes the column Float64 rather than being rejected
+    assert df.schema["value"] == pl.Float64
+    assert len(df) == 50001
+    assert df["value"][-1] == 1.5
+    assert not storage.store.exists("ints_rejected.csv")
+
+
+def test_inferred_timestamps():
+    # Not one of the formats tried, so Polars infers it
+    result, df = convert(b"timestamp,value\n31-01-2024 00:00:00,1\n01-02-2024 00:00:00,2\n")
+
+    assert df["timestamp"].to_list() == [datetime(2024, 1, 31), datetime(2024, 2, 1)]
+
+
+def test_sample_dates():
+    schema = sample_schema(b"day,value\n2024-01-01,1\n2024-01-02,2\n")
+    assert schema.dtypes["day"] == pl.Date
+
+    result, df = convert(b"day,value\n2024-01-01,1\n2024-01-02,2\n")
+    assert df["day"].to_list() == [date(2024, 1, 1), date(2024, 1, 2)]
+
+
+@pytest.mark.parametrize("head", [0, 100, 5000])
+def test_read_chunks(head):
+    data = make_csv(1000)
+    source = io.BytesIO(data)
+    chunks = list(read_chunks(source, chunk_bytes=1000, head=source.read(head)))
+
+    assert len(chunks) > 10
+    assert all(bytes(chunk).endswith(b"\n") for chunk in chunks)
+    assert all(len(chunk) < 1100 for chunk in chunks)
+    # Nothing lost or repeated, and the header is skipped
+    assert b"".join(chunks) == data[data.find(b"\n") + 1:]
+
+
+def test_quoted_line_breaks():
+    lines = ["timestamp,value,note"]
+    for i in range(200):
+        lines.append(f'2024-01-{1 + i // 24:02d} {i % 24:02d}:00:00,{i},"first line\nsecond ""line"" {i}"')
+    data = ("\n".join(lines) + "\n").encode()
+
+    # Chunks shorter than a record as well
+    result, df = convert(data, chunk_bytes=64)
+
+    assert result.rejected is None
+    assert df["note"].to_list() == pl.read_csv(io.BytesIO(data))["note"].to_list()
+
+
+def test_import_matches_read_csv():
+    data = make_csv(5000)
+
+    result, df = convert(data, chunk_bytes=10000, max_workers=4)
+    expected = pl.read_csv(io.BytesIO(data), try_parse_dates=True)
+
+    assert result.rows == 5000
+    assert result.rejected is None
+    assert result.rows_per_second > 0
+    # Built chunk by chunk, without the whole frame
+    assert result.stats.columns == dataset_stats(df, "timestamp", ["value", "Unk:0"]).columns
+    assert result.stats.rows == 5000
+    assert len(result.head) == 5000
+    assert df["timestamp"].to_list() == expected["timestamp"].to_list()
+    assert df["value"].to_list() == expected["value"].to_list()
+    assert df["name"].to_list() == expected["name"].to_list()
+
+
+def test_rejected_rows():
+    data = make_csv(100) + b"not a time,1.0,s1,1\n2024-01-20 00:00:00,abc,s1,1\n2024-01-20 00:01:00,1.0,s1,1,extra\n"
+
+    result, df = convert(data, chunk_bytes=500)
+    rejected = pl.read_csv(io.BytesIO(result.rejected), infer_schema=False)
+
+    assert result.rows == len(df) == 100
+    assert result.rejected_rows == 3
+    assert sorted(rejected[ERROR_COL].to_list()) == [
+        "expected 4 fields, found 5", "invalid timestamp", "invalid value"
+    ]
+
+
+def test_no_valid_rows():
+    with pytest.raises(TsApiDataError):
+        import_csv(io.BytesIO(b"timestamp,value\n"), io.BytesIO())
+
+
+def test_stale_rejected_file():
+    storage = DatasetStorage(MemoryStore())
+    convert_csv("data", storage, io.BytesIO(make_csv(100) + b"not a time,1.0,s1,1\n"), structlog.get_logger())
+    assert storage.store.exists("data_rejected.csv")
+
+    # Uploaded again without the malformed row
+    convert_csv("data", storage, io.BytesIO(make_csv(100)), structlog.get_logger())
+    assert not storage.store.exists("data_rejected.csv")
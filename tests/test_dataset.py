@@ -43,6 +43,8 @@ def test_dataset_parse(dataset_df):
     assert dset.num_series == 2
     assert dset.max_length == 3
     assert dset.file_name == "test.parquet"
+    assert dset.stats.rows == 3
+    assert [c.name for c in dset.stats.columns] == ["series1", "series2"]
 
 
 def test_rename(dataset_df):
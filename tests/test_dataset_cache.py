@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from tsapi.cache_sweeper import is_orphan, live_keys
+from tsapi.dataset_cache import dataset_key, group_key, opset_digest, opset_key, parse_key
+from tsapi.dataset_storage import DatasetStorage
+from tsapi.model.dataset import DataSet, Operation, OperationSet
+from tsapi.object_store import MemoryStore
+
+
+@pytest.fixture
+def dataset():
+    return DataSet(
+        id="ds1", name="test", description="", num_series=1, max_length=10, series_cols=["value"], timestamp_cols=["timestamp"]
+    )
+
+
+@pytest.fixture
+def storage(dataset):
+    storage = DatasetStorage(MemoryStore())
+    storage.write_parquet(dataset.file_name, pl.DataFrame({
+        "timestamp": [datetime(2024, 1, 1) + timedelta(hours=i) for i in range(10)],
+        "value": [float(i) for i in range(10)],
+    }))
+    return storage
+
+
+def test_dataset_key_versions(dataset):
+    key = dataset_key(dataset, "gen1")
+
+    # A new dataset version or new file contents give a new key
+    assert dataset_key(dataset.model_copy(update={"version": 2}), "gen1") != key
+    assert dataset_key(dataset, "gen2") != key
+    assert dataset_key(dataset, "gen1") == key
+
+
+def test_opset_digest():
+    opset = OperationSet(id="op1", dataset_id="ds1", series_ids=["value"], offset=0, limit=100)
+
+    # Without operations only the window matters, so opsets can share frames
+    assert opset_digest(opset) == opset_digest(opset.model_copy(update={"id": "op2", "series_ids": ["other"]}))
+    assert opset_digest(opset) != opset_digest(opset.model_copy(update={"limit": 50}))
+
+    derived = opset.model_copy(update={"operations": [Operation(op="rolling", window=5)]})
+    assert opset_digest(derived) != opset_digest(opset)
+    assert opset_digest(derived) != opset_digest(derived.model_copy(update={"series_ids": ["other"]}))
+
+
+def test_parse_key(dataset):
+    prefix = dataset_key(dataset, "gen1")
+    opset = OperationSet(id="op1", dataset_id="ds1")
+    key = opset_key(prefix, opset)
+
+    assert parse_key(prefix) == ("ds1", prefix, None)
+    assert parse_key(key) == ("ds1", prefix, opset_digest(opset))
+    assert parse_key(group_key(key, "a:b")) == ("ds1", prefix, opset_digest(opset))
+
+
+@pytest.mark.asyncio()
+async def test_orphans(dataset, storage):
+    opset = OperationSet(id="op1", dataset_id="ds1", limit=5)
+    docs = [{**dataset.model_dump(), "ops": [opset.model_dump()]}]
+
+    live = await live_keys(docs, storage)
+    prefix = dataset_key(dataset, storage.store.stat(dataset.file_name).version)
+    key = opset_key(prefix, opset)
+
+    assert not is_orphan(key, live)
+    assert not is_orphan(group_key(key, "a"), live)
+    # Old parameters of the opset
+    assert is_orphan(opset_key(prefix, opset.model_copy(update={"limit": 10})), live)
+    # The file was replaced
+    assert is_orphan(opset_key(dataset_key(dataset, "old"), opset), live)
+    # The dataset was deleted
+    assert is_orphan(key.replace("ds1", "ds2"), live)
+
+    storage.store.delete(dataset.file_name)
+    assert await live_keys(docs, storage) == {}
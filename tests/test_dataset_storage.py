@@ -0,0 +1,185 @@
+import io
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from tsapi.dataset_storage import DatasetStorage
+from tsapi.object_store import GCSStore, LocalStore, MemoryStore
+from tsapi.row_group_cache import RowGroupCache
+
+NUM_ROWS = 100000
+ROW_GROUP_SIZE = 10000
+
+
+@pytest.fixture
+def df():
+    start = datetime(2024, 1, 1)
+    return pl.DataFrame({
+        "timestamp": [start + timedelta(minutes=i) for i in range(NUM_ROWS)],
+        "value": [float(i) for i in range(NUM_ROWS)],
+        "other": [i % 7 for i in range(NUM_ROWS)],
+    })
+
+
+def parquet_bytes(df):
+    buffer = io.BytesIO()
+    df.write_parquet(buffer, row_group_size=ROW_GROUP_SIZE)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(df):
+    store = MemoryStore()
+    store.write("test.parquet", parquet_bytes(df))
+    return store
+
+
+def test_read_rows(df, store):
+    storage = DatasetStorage(store)
+
+    for offset, limit in [(0, 10), (9950, 100), (25000, 30000), (99990, 100), (0, None)]:
+        result = storage.read_parquet("test.parquet", offset, limit)
+        expected = df.slice(offset, limit)
+        assert result.equals(expected), (offset, limit)
+
+
+def test_read_past_end(store):
+    result = DatasetStorage(store).read_parquet("test.parquet", NUM_ROWS + 10, 10)
+    assert len(result) == 0
+    assert result.columns == ["timestamp", "value", "other"]
+
+
+def test_ranged_reads(store):
+    storage = DatasetStorage(store)
+    size = store.stat("test.parquet").size
+
+    storage.read_parquet("test.parquet", 25000, 100)
+
+    # The footer and a single row group, not the whole file
+    assert store.bytes_read < size / 2
+
+    # The footer is only read once
+    store.reads.clear()
+    storage.read_parquet("test.parquet", 55000, 100)
+    assert store.bytes_read < size / 8
+
+
+def test_read_columns(df, store):
+    result = DatasetStorage(store).read_parquet("test.parquet", 10000, 10, columns=["value"])
+    assert result.equals(df.select("value").slice(10000, 10))
+
+
+def test_estimate_size(df, store):
+    storage = DatasetStorage(store)
+
+    # Close to the loaded frame, from the footer alone
+    assert storage.estimate_size("test.parquet") == pytest.approx(df.estimated_size(), rel=0.2)
+    assert storage.estimate_size("test.parquet", 25000, 5000) == pytest.approx(
+        storage.estimate_size("test.parquet") / 20, rel=0.05
+    )
+    assert storage.estimate_size("test.parquet", NUM_ROWS, 10) == 0
+
+
+def test_row_group_cache(df, store, tmp_path):
+    cache = RowGroupCache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    storage = DatasetStorage(store, cache)
+
+    first = storage.read_parquet("test.parquet", 15000, 10000)
+
+    # Another worker, sharing the cache directory
+    store.reads.clear()
+    second = DatasetStorage(store, RowGroupCache(str(tmp_path), max_bytes=10 * 1024 * 1024)).read_parquet(
+        "test.parquet", 15000, 10000
+    )
+
+    assert first.equals(second)
+    # Only the footer is fetched, the row groups come from the cache
+    assert store.bytes_read < store.stat("test.parquet").size / 4
+    assert len(cache.entries()) == 2
+
+
+def test_replaced_object(df, store, tmp_path):
+    storage = DatasetStorage(store, RowGroupCache(str(tmp_path), max_bytes=10 * 1024 * 1024))
+    storage.read_parquet("test.parquet", 0, 10)
+
+    store.write("test.parquet", parquet_bytes(df.with_columns(pl.col("value") * 2)))
+
+    result = storage.read_parquet("test.parquet", 0, 10)
+    assert result["value"].to_list() == [2.0 * i for i in range(10)]
+
+
+def test_cache_eviction(tmp_path):
+    cache = RowGroupCache(str(tmp_path), max_bytes=5000)
+    frame = pl.DataFrame({"value": [float(i) for i in range(200)]})
+
+    for i in range(10):
+        key = RowGroupCache.key("test.parquet", "1", i)
+        cache.put(key, frame)
+        # mtime resolution can be coarse, so make the order explicit
+        os.utime(cache.path(key), (i, i))
+
+    assert cache.size <= 5000
+    assert cache.get(RowGroupCache.key("test.parquet", "1", 0)) is None
+    assert cache.get(RowGroupCache.key("test.parquet", "1", 9)).equals(frame)
+
+
+def test_cache_concurrent_puts(tmp_path):
+    cache = RowGroupCache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    frame = pl.DataFrame({"value": [float(i) for i in range(10000)]})
+    key = RowGroupCache.key("test.parquet", "1", 0)
+
+    # Threads loading the same row group write the same entry
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda _: cache.put(key, frame), range(32)))
+
+    assert cache.get(key).equals(frame)
+    assert os.listdir(tmp_path) == [os.path.basename(cache.path(key))]
+
+
+def test_local_store(df, tmp_path, monkeypatch):
+    storage = DatasetStorage(LocalStore(str(tmp_path)))
+    storage.write_parquet("test.parquet", df)
+    # pyarrow reads the file itself rather than through ranged reads
+    monkeypatch.setattr(LocalStore, "read_range", None)
+
+    assert storage.read_parquet("test.parquet", 10, 5).equals(df.slice(10, 5))
+    assert storage.read_parquet("test.parquet", 25000, 30000, columns=["value"]).equals(
+        df.select("value").slice(25000, 30000)
+    )
+    assert storage.read_parquet("test.parquet").equals(df)
+
+    storage.store.delete("test.parquet")
+    assert not storage.store.exists("test.parquet")
+
+
+@pytest.mark.parametrize("make_store", [MemoryStore, LocalStore])
+def test_open_write(make_store, tmp_path):
+    store = make_store() if make_store is MemoryStore else make_store(str(tmp_path))
+    store.write("test.bin", b"old")
+    with store.open_write("test.bin") as f:
+        f.write(b"new ")
+        f.write(b"data")
+    assert store.read("test.bin") == b"new data"
+
+    # A failed write leaves the object as it was
+    with pytest.raises(ValueError):
+        with store.open_write("test.bin") as f:
+            f.write(b"partial")
+            raise ValueError
+    assert store.read("test.bin") == b"new data"
+
+
+@pytest.mark.skipif("STORAGE_EMULATOR_HOST" not in os.environ, reason="Needs a GCS emulator (fake-gcs-server)")
+def test_gcs_store(df):
+    # The bucket is expected to exist in the emulator
+    store = GCSStore(os.environ.get("TEST_GCS_BUCKET", "tsnext_bucket"), prefix=f"test-{uuid.uuid4()}/")
+    store.write("test.parquet", parquet_bytes(df))
+
+    try:
+        assert DatasetStorage(store).read_parquet("test.parquet", 25000, 100).equals(df.slice(25000, 100))
+    finally:
+        store.delete("test.parquet")
@@ -0,0 +1,119 @@
+import io
+import json
+from datetime import datetime, timedelta
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.flight as flight
+import pytest
+
+from tsapi.dataset_storage import DatasetStorage
+from tsapi.flight import FlightService, split_row_groups
+from tsapi.model.dataset import DataSet, Operation, OperationSet
+from tsapi.object_store import MemoryStore
+
+NUM_ROWS = 10_000
+
+
+class MemoryCatalog:
+    """Stands in for MongoCatalog."""
+
+    def __init__(self, datasets, opsets):
+        self.by_name = {ds.name: ds for ds in datasets}
+        self.opsets = {ops.id: ops for ops in opsets}
+
+    def resolve(self, request):
+        if request.opset is not None:
+            opset = self.opsets[request.opset]
+            return next(ds for ds in self.by_name.values() if ds.id == opset.dataset_id), opset
+        return self.by_name[request.dataset], None
+
+    def datasets(self):
+        return list(self.by_name.values())
+
+
+@pytest.fixture
+def frame():
+    return pl.DataFrame({
+        "timestamp": [datetime(2024, 1, 1) + timedelta(minutes=i) for i in range(NUM_ROWS)],
+        "value": [float(i) for i in range(NUM_ROWS)],
+        "other": [i % 7 for i in range(NUM_ROWS)],
+    })
+
+
+@pytest.fixture
+def client(frame):
+    dataset = DataSet(
+        id="ds1", name="big", description="", num_series=2, max_length=NUM_ROWS, series_cols=["value", "other"],
+        timestamp_cols=["timestamp"]
+    )
+    opsets = [
+        OperationSet(id="op1", dataset_id="ds1", series_ids=["value"], offset=1500, limit=5000),
+        OperationSet(
+            id="op2", dataset_id="ds1", series_ids=["value"], offset=0, limit=100,
+            operations=[Operation(op="diff", columns=["value"])]
+        ),
+    ]
+    storage = DatasetStorage(MemoryStore())
+    # 20 row groups
+    buffer = io.BytesIO()
+    frame.write_parquet(buffer, row_group_size=500)
+    storage.store.write(dataset.file_name, buffer.getvalue())
+
+    server = FlightService("grpc://127.0.0.1:0", storage, MemoryCatalog([dataset], opsets), num_streams=4)
+    client = flight.connect(f"grpc://127.0.0.1:{server.port}")
+    yield client
+    client.close()
+    server.shutdown()
+
+
+def fetch(client, **request) -> tuple[flight.FlightInfo, pl.DataFrame]:
+    info = client.get_flight_info(flight.FlightDescriptor.for_command(json.dumps(request, default=str)))
+    tables = [client.do_get(endpoint.ticket).read_all() for endpoint in info.endpoints]
+    return info, pl.from_arrow(pa.concat_tables(tables))
+
+
+def test_split_row_groups():
+    assert split_row_groups(list(range(10)), 4) == [[0, 1, 2], [3, 4, 5], [6, 7], [8, 9]]
+    assert split_row_groups([3], 4) == [[3]]
+    assert split_row_groups([], 4) == [[]]
+
+
+def test_dataset(client, frame):
+    info, df = fetch(client, dataset="big")
+
+    assert len(info.endpoints) == 4
+    assert info.total_records == NUM_ROWS
+    assert df.equals(frame)
+
+
+def test_projection_and_time_range(client, frame):
+    start, end = datetime(2024, 1, 2), datetime(2024, 1, 3)
+    info, df = fetch(client, dataset="big", columns=["timestamp", "value"], start=start, end=end)
+
+    assert info.schema.names == ["timestamp", "value"]
+    # Row groups outside the range aren't read at all
+    assert sum(len(json.loads(e.ticket.ticket)["row_groups"]) for e in info.endpoints) == 4
+    expected = frame.filter((pl.col("timestamp") >= start) & (pl.col("timestamp") < end)).select("timestamp", "value")
+    assert df.equals(expected)
+
+
+def test_opsets(client, frame):
+    _, df = fetch(client, opset="op1")
+    assert df.equals(frame.slice(1500, 5000).select("timestamp", "value"))
+
+    info, df = fetch(client, opset="op2")
+    assert len(info.endpoints) == 1
+    assert df["value"].to_list()[1:3] == [1.0, 1.0]
+
+
+def test_errors(client):
+    with pytest.raises(flight.FlightServerError, match="Not found"):
+        fetch(client, dataset="missing")
+    with pytest.raises(flight.FlightServerError, match="Unknown columns"):
+        fetch(client, dataset="big", columns=["nope"])
+
+
+def test_list_flights(client):
+    flights = list(client.list_flights())
+    assert [json.loads(f.descriptor.command) for f in flights] == [{"dataset": "big"}]
@@ -0,0 +1,106 @@
+from datetime import date, datetime, timedelta
+
+import polars as pl
+import pytest
+from pydantic import ValidationError
+
+from tsapi.forecast import (
+    ModelCache, fit_model, forecast, forecast_frame, forecast_groups, future_timestamps, model_cache
+)
+from tsapi.model.forecast import BacktestRequest, ForecastRequest
+
+
+@pytest.fixture()
+def forecast_df():
+    ts = pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 1, 4, 23), interval='1h', eager=True)
+    return pl.DataFrame({
+        "timestamp": ts,
+        "value": [float(i % 24) for i in range(len(ts))],
+    })
+
+
+def test_forecast(forecast_df):
+    result = forecast(forecast_df["value"], forecast_df["timestamp"], horizon=5)
+
+    assert len(result) == 5
+    assert result[0][0] == datetime(2024, 1, 5)
+    assert set(result[0][1].keys()) == {"point", "lower", "upper"}
+
+
+def test_forecast_long_horizon(forecast_df):
+    result = forecast_frame(forecast_df["value"], forecast_df["timestamp"], horizon=20000)
+
+    assert len(result) == 20000
+    assert result["timestamp"][-1] == datetime(2024, 1, 5) + timedelta(hours=19999)
+    assert (result["lower"] <= result["upper"]).all()
+
+
+def test_future_timestamps_dates():
+    timestamp = pl.Series("day", [date(2024, 1, 1), date(2024, 1, 2)])
+    future = future_timestamps(timestamp, timedelta(days=1), 3)
+
+    assert future.name == "day"
+    assert future.to_list() == [date(2024, 1, 3), date(2024, 1, 4), date(2024, 1, 5)]
+
+
+def test_future_timestamps_time_zone():
+    timestamp = pl.Series("ts", [datetime(2024, 1, 1), datetime(2024, 1, 1, 1)]).dt.replace_time_zone("UTC")
+    future = future_timestamps(timestamp, timedelta(hours=1), 2)
+
+    assert future.dtype == timestamp.dtype
+    assert future.dt.replace_time_zone(None).to_list() == [datetime(2024, 1, 1, 2), datetime(2024, 1, 1, 3)]
+
+
+@pytest.mark.asyncio()
+async def test_forecast_groups(forecast_df):
+    df = pl.concat([
+        forecast_df.with_columns(pl.lit("a").alias("symbol")),
+        forecast_df.with_columns(pl.lit("b").alias("symbol"), pl.col("value") * 2),
+        forecast_df.head(2).with_columns(pl.lit("c").alias("symbol")),
+    ])
+
+    results = await forecast_groups(df, "value", "timestamp", "symbol", horizon=3)
+
+    assert list(results.keys()) == ["a", "b", "c"]
+    assert len(results["a"]) == 3
+    assert results["b"]["point"].mean() > results["a"]["point"].mean()
+    # Too little data to fit a model
+    assert isinstance(results["c"], Exception)
+
+
+def test_model_cache(forecast_df):
+    model_cache.models.clear()
+    y = forecast_df["value"].to_numpy()
+
+    model = fit_model(y, [3, 4], model_key=("opset", "value"))
+    assert fit_model(y, [3, 4], model_key=("opset", "value")) is model
+    # Different parameters or data mean a new fit, replacing the old one
+    assert fit_model(y, [24], model_key=("opset", "value")) is not model
+    assert fit_model(y * 2, [24], model_key=("opset", "value")) is not model
+    assert len(model_cache.models) == 1
+    # Without a key nothing is cached
+    assert fit_model(y, [3, 4]) is not model
+
+
+def test_model_cache_eviction():
+    cache = ModelCache(max_models=2)
+    for key in ["a", "b", "c"]:
+        cache.put((key,), (), "fp", key)
+
+    assert cache.get(("a",), (), "fp") is None
+    assert cache.get(("c",), (), "fp") == "c"
+    assert cache.get(("c",), (), "other") is None
+
+
+@pytest.mark.parametrize("fields", [{"horizon": 0}, {"horizon": -5}, {"level": 0}, {"level": 1}, {"level": 95}])
+def test_forecast_request_validation(fields):
+    with pytest.raises(ValidationError):
+        ForecastRequest(opset_id="o", series_id="s", **fields)
+
+
+@pytest.mark.parametrize(
+    "fields", [{"horizon": 0}, {"folds": 0}, {"folds": -1}, {"level": 0}, {"level": 1}, {"level": 95}]
+)
+def test_backtest_request_validation(fields):
+    with pytest.raises(ValidationError):
+        BacktestRequest(opset_id="o", series_id="s", **fields)
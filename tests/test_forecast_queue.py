@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import polars as pl
+import pytest
+
+from tsapi.errors import TsApiForecastError
+from tsapi.forecast import forecast_frame, forecast_groups
+from tsapi.forecast_queue import ForecastJob, decode_job, decode_result, encode_job, run_job
+
+
+@pytest.fixture()
+def forecast_df():
+    ts = pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 1, 4, 23), interval='1h', eager=True)
+    return pl.DataFrame({
+        "timestamp": ts,
+        "value": [float(i % 24) for i in range(len(ts))],
+    })
+
+
+def make_job(df, **kwargs):
+    params = dict(
+        id="job1", series=df["value"], timestamp=df["timestamp"], horizon=5, level=0.9,
+        model_key=("opset", "value", None), periods=[24], deadline=1e10
+    )
+    return ForecastJob(**{**params, **kwargs})
+
+
+def to_fields(job):
+    return {key.encode(): value for key, value in encode_job(job).items()}
+
+
+def test_job_round_trip(forecast_df):
+    job = make_job(forecast_df)
+    decoded = decode_job("job1", to_fields(job))
+
+    assert decoded.series.equals(job.series)
+    assert decoded.timestamp.equals(job.timestamp)
+    assert decoded.model_key == ("opset", "value", None)
+    assert decoded._replace(series=None, timestamp=None) == job._replace(series=None, timestamp=None)
+
+
+def test_run_job(forecast_df):
+    result = decode_result(run_job("job1", to_fields(make_job(forecast_df))))
+    local = forecast_frame(forecast_df["value"], forecast_df["timestamp"], horizon=5, level=0.9, periods=[24])
+
+    assert result.equals(local)
+
+    # Too little data to fit, the error comes back instead of a frame
+    payload = run_job("job2", to_fields(make_job(forecast_df.head(2))))
+    with pytest.raises(TsApiForecastError):
+        decode_result(payload)
+
+
+@pytest.mark.asyncio()
+async def test_forecast_groups_fit(forecast_df):
+    df = pl.concat([
+        forecast_df.with_columns(pl.lit("a").alias("symbol")),
+        forecast_df.with_columns(pl.lit("b").alias("symbol")),
+    ])
+    keys = []
+
+    async def fit(series, timestamp, horizon, level, model_key, periods):
+        keys.append(model_key)
+        return forecast_frame(series, timestamp, horizon, level, None, periods)
+
+    results = await forecast_groups(df, "value", "timestamp", "symbol", horizon=3, model_key=("op",), fit=fit)
+
+    assert sorted(keys) == [("op", "a"), ("op", "b")]
+    assert len(results["a"]) == 3
@@ -84,3 +84,27 @@ def test_adjust_frequency():
     adjusted_df = adjust_frequency(df, "timestamp")
     assert len(adjusted_df) < len(df)
     assert len(adjusted_df) <= MAX_POINTS
+
+
+def test_adjust_frequency_groups():
+    ts = pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 2, 1), interval='5m', eager=True)
+    df = pl.concat([
+        pl.DataFrame({"timestamp": ts, "symbol": name, "price": float(i)})
+        for i, name in enumerate(["a", "b", "c"])
+    ])
+
+    adjusted_df = adjust_frequency(df, "timestamp", group_col="symbol")
+    assert len(adjusted_df) <= MAX_POINTS
+    assert adjusted_df["symbol"].unique().sort().to_list() == ["a", "b", "c"]
+    assert adjusted_df.filter(pl.col("symbol") == "b")["price"].unique().to_list() == [1.0]
+
+
+def test_adjust_frequency_small_groups():
+    df = pl.DataFrame({
+        "timestamp": [datetime(2024, 1, 2), datetime(2024, 1, 1)] * 2,
+        "symbol": ["a", "a", "b", "b"],
+        "price": [1.0, 2.0, 3.0, 4.0],
+    })
+
+    adjusted_df = adjust_frequency(df, "timestamp", group_col="symbol")
+    assert adjusted_df["price"].to_list() == [2.0, 1.0, 4.0, 3.0]
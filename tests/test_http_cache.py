@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from tsapi.http_cache import cache_headers, is_not_modified, make_etag, not_modified_response
+
+
+def make_request(**headers):
+    return Request({
+        "type": "http",
+        "headers": [(k.replace('_', '-').encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+def test_make_etag():
+    assert make_etag("opset", 1) == make_etag("opset", 1)
+    assert make_etag("opset", 1) != make_etag("opset", 2)
+    assert make_etag("opset", 1).startswith('"')
+
+
+def test_if_none_match():
+    etag = make_etag("opset", 1)
+
+    assert is_not_modified(make_request(if_none_match=etag), etag)
+    assert is_not_modified(make_request(if_none_match=f'"other", W/{etag}'), etag)
+    assert is_not_modified(make_request(if_none_match='*'), etag)
+    assert not is_not_modified(make_request(if_none_match=make_etag("opset", 2)), etag)
+    assert not is_not_modified(make_request(), etag)
+
+
+def test_if_modified_since():
+    etag = make_etag("opset", 1)
+    updated_at = datetime(2024, 1, 1, 12, 0, 0, 500000)
+    header = cache_headers(etag, updated_at)['Last-Modified']
+
+    assert header == 'Mon, 01 Jan 2024 12:00:00 GMT'
+    assert is_not_modified(make_request(if_modified_since=header), etag, updated_at)
+    assert not is_not_modified(make_request(if_modified_since=header), etag, updated_at + timedelta(seconds=1))
+    assert not is_not_modified(make_request(if_modified_since='garbage'), etag, updated_at)
+    # If-None-Match wins when both are sent
+    assert not is_not_modified(
+        make_request(if_none_match='"other"', if_modified_since=header), etag, updated_at
+    )
+
+
+def test_not_modified_response():
+    etag = make_etag("datasets", 3)
+    response = not_modified_response(etag, datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+    assert isinstance(response, Response)
+    assert response.status_code == 304
+    assert response.headers['etag'] == etag
+    assert response.body == b''
@@ -0,0 +1,102 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from tsapi.dataset_storage import DatasetStorage
+from tsapi.live_tail import MAX_QUEUED_MESSAGES, TailHub, tail_channel, tail_frame, tail_message
+from tsapi.model.dataset import DataSet, Operation, OperationSet
+from tsapi.object_store import MemoryStore
+from tsapi.settings import Settings
+
+
+@pytest.fixture
+def df():
+    start = datetime(2024, 1, 1)
+    return pl.DataFrame({
+        "timestamp": [start + timedelta(minutes=i) for i in range(120)],
+        "value": [float(i) for i in range(120)],
+        "sensor": ["a", "b"] * 60,
+    })
+
+
+@pytest.fixture
+def storage(df):
+    storage = DatasetStorage(MemoryStore())
+    storage.write_parquet("live.parquet", df)
+    return storage
+
+
+@pytest.fixture
+def dataset(df):
+    return DataSet(
+        id="ds", name="live", num_series=1, max_length=len(df),
+        series_cols=["value"], timestamp_cols=["timestamp"], other_cols=["sensor"]
+    )
+
+
+def test_tail_new_rows(storage, dataset, df):
+    opset = OperationSet(id="op", dataset_id="ds", series_ids=["value"])
+
+    tail = tail_frame(storage, dataset, opset, 100, 120)
+
+    assert tail.columns == ["timestamp", "value"]
+    assert tail.equals(df.select("timestamp", "value").slice(100, 20))
+
+
+def test_tail_derived_series(storage, dataset):
+    opset = OperationSet(
+        id="op", dataset_id="ds", series_ids=["value"], operations=[Operation(op="rolling", window=10)]
+    )
+
+    tail = tail_frame(storage, dataset, opset, 100, 120)
+
+    # The rolling window reaches back into rows the subscribers already have
+    assert len(tail) == 20
+    assert tail["value"][0] == pytest.approx(sum(range(91, 101)) / 10)
+
+
+def test_tail_resample_updates_bucket(storage, dataset):
+    opset = OperationSet(
+        id="op", dataset_id="ds", series_ids=["value"], operations=[Operation(op="resample", every="1h")]
+    )
+
+    # Rows 100-119 are in the second hour, which already had rows 60-99
+    tail = tail_frame(storage, dataset, opset, 100, 120)
+
+    assert tail["timestamp"].to_list() == [datetime(2024, 1, 1, 1)]
+    assert tail["value"][0] == pytest.approx(sum(range(60, 120)) / 60)
+
+
+def test_tail_message(storage, dataset):
+    opset = OperationSet(id="op", dataset_id="ds", series_ids=["value"], group_by="sensor")
+
+    tail = tail_frame(storage, dataset, opset, 118, 120)
+    message = json.loads(tail_message(tail, dataset.tscol, opset, 120))
+
+    assert message["rows"] == 120
+    assert message["since"] == "2024-01-01T01:58:00"
+    assert message["data"] == [
+        {"timestamp": "2024-01-01T01:58:00", "data": {"value": 118.0}, "group": "a"},
+        {"timestamp": "2024-01-01T01:59:00", "data": {"value": 119.0}, "group": "b"},
+    ]
+
+
+def test_hub_dispatch():
+    # Only the fan-out, it doesn't connect to Redis
+    hub = TailHub(Settings(data_dir="."), None)
+    first, second, other = asyncio.Queue(MAX_QUEUED_MESSAGES), asyncio.Queue(MAX_QUEUED_MESSAGES), asyncio.Queue()
+    hub.queues = {tail_channel("op"): {first, second}, tail_channel("other"): {other}}
+
+    hub.dispatch(tail_channel("op"), "rows")
+    assert first.get_nowait() == second.get_nowait() == "rows"
+    assert other.empty()
+
+    # A subscriber that falls behind is closed, the others carry on
+    for i in range(MAX_QUEUED_MESSAGES):
+        first.put_nowait("old")
+    hub.dispatch(tail_channel("op"), "new")
+    assert first.qsize() == 1 and first.get_nowait() is None
+    assert second.get_nowait() == "new"
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from tsapi.errors import TsApiMemoryBudgetError
+from tsapi.memory_budget import MemoryBudget
+
+
+@pytest.mark.asyncio()
+async def test_reserve_and_resize():
+    budget = MemoryBudget(1000)
+
+    async with budget.reserve(600) as reservation:
+        assert budget.in_flight == 600
+        # Actual sizes are accounted even over the budget
+        reservation.resize(1200)
+        with budget.track(100):
+            assert budget.in_flight == 1300
+
+    assert budget.in_flight == 0
+    assert budget.stats.peak_bytes == 1300
+    assert budget.stats.admitted == 1
+
+
+@pytest.mark.asyncio()
+async def test_queued_in_order():
+    budget = MemoryBudget(1000)
+    order = []
+
+    async def load(name, nbytes, seconds):
+        async with budget.reserve(nbytes):
+            order.append(name)
+            await asyncio.sleep(seconds)
+
+    first = asyncio.create_task(load("first", 800, 0.05))
+    await asyncio.sleep(0)
+    # The large one waits for the first, and the small one behind it even though it would fit
+    await asyncio.gather(first, load("large", 900, 0.01), load("small", 100, 0))
+
+    assert order == ["first", "large", "small"]
+    assert budget.stats.queued == 2
+    assert budget.stats.peak_bytes == 1000
+    assert budget.in_flight == 0
+
+
+@pytest.mark.asyncio()
+async def test_larger_than_budget_runs_alone():
+    budget = MemoryBudget(1000)
+
+    async with budget.reserve(5000):
+        assert budget.in_flight == 5000
+    assert budget.stats.largest_bytes == 5000
+
+
+@pytest.mark.asyncio()
+async def test_rejected():
+    budget = MemoryBudget(1000, wait_seconds=0.05)
+
+    async with budget.reserve(800):
+        with pytest.raises(TsApiMemoryBudgetError):
+            async with budget.reserve(500):
+                pass
+
+        # A cancelled waiter gives up its place
+        waiter = asyncio.create_task(budget.acquire(500))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    assert budget.stats.rejected == 1
+    assert budget.in_flight == 0
+    assert not budget.waiters
+
+    # Without a wait, rejected right away
+    budget = MemoryBudget(1000, wait_seconds=0)
+    async with budget.reserve(800):
+        with pytest.raises(TsApiMemoryBudgetError):
+            await budget.acquire(500)
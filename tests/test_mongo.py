@@ -24,3 +24,23 @@ async def test_insert_dataset(async_mongodb):
 
     doc = await async_mongodb.get_dataset(doc_id)
     assert doc['id'] == doc_id
+
+
+@pytest.mark.asyncio()
+async def test_save_dataset_replaces(async_mongodb):
+    doc_id = await async_mongodb.save_dataset({"name": "replaced", "description": "old"})
+    opset_id = await async_mongodb.insert_opset({"id": None, "dataset_id": doc_id, "title": "ops"})
+
+    assert await async_mongodb.save_dataset({"name": "replaced", "description": "new"}) == doc_id
+
+    doc = await async_mongodb.get_dataset(doc_id)
+    assert doc['description'] == "new"
+    assert doc['version'] == 2
+    assert (await async_mongodb.get_opset(opset_id))['dataset_id'] == doc_id
+
+
+@pytest.mark.asyncio()
+async def test_invalid_ids(async_mongodb):
+    assert await async_mongodb.get_dataset("not-an-id") is None
+    assert await async_mongodb.get_dataset_stats("not-an-id") is None
+    assert await async_mongodb.get_opset("not-an-id") is None
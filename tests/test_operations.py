@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import polars as pl
+import pytest
+
+from tsapi.errors import TsApiOperationError
+from tsapi.model.dataset import Operation
+from tsapi.operations import apply_operations
+
+
+@pytest.fixture()
+def ops_df():
+    return pl.DataFrame(
+        {
+            "timestamp": pl.datetime_range(
+                datetime(2024, 1, 1), datetime(2024, 1, 1, 23), interval='1h', eager=True
+            ),
+            "series1": [float(i) for i in range(24)],
+            "series2": [1.0] * 24,
+            "label": ["a"] * 24,
+        }
+    )
+
+
+def test_no_operations(ops_df):
+    assert apply_operations(ops_df, [], "timestamp", ["series1"]) is ops_df
+
+
+def test_rolling(ops_df):
+    result = apply_operations(ops_df, [Operation(op='rolling', window=3)], "timestamp", ["series1"])
+
+    assert result["series1"][0] is None
+    assert result["series1"][2] == 1.0
+    assert result["series2"].equals(ops_df["series2"])
+
+
+def test_diff_then_zscore(ops_df):
+    ops = [Operation(op='diff'), Operation(op='zscore', columns=['series2'])]
+    result = apply_operations(ops_df, ops, "timestamp", ["series1", "series2"])
+
+    assert result["series1"].drop_nulls().to_list() == [1.0] * 23
+    # Constant series have no spread, so the z-score is undefined
+    assert result["series2"].null_count() == 24
+
+
+def test_pct_change_and_ewm(ops_df):
+    ops = [Operation(op='pct_change', periods=2), Operation(op='ewm', span=3)]
+    result = apply_operations(ops_df, ops, "timestamp", ["series1"])
+
+    assert len(result) == 24
+    # The change from zero is infinite, which is treated as missing
+    assert result["series1"][:3].to_list() == [None, None, None]
+    assert result["series1"][3:].null_count() == 0
+
+
+def test_resample(ops_df):
+    result = apply_operations(ops_df, [Operation(op='resample', every='6h', agg='sum')], "timestamp", ["series1"])
+
+    assert len(result) == 4
+    assert result["series1"].to_list() == [15.0, 51.0, 87.0, 123.0]
+    assert "label" not in result.columns
+
+
+def test_invalid_operations(ops_df):
+    with pytest.raises(TsApiOperationError):
+        apply_operations(ops_df, [Operation(op='rolling')], "timestamp", ["series1"])
+
+    with pytest.raises(TsApiOperationError):
+        apply_operations(ops_df, [Operation(op='diff', columns=['nope'])], "timestamp", [])
+
+    with pytest.raises(TsApiOperationError):
+        apply_operations(ops_df, [Operation(op='resample')], "timestamp", [])
+
+
+@pytest.mark.parametrize("op, series_ids", [
+    (Operation(op='resample', every='bogus'), []),
+    (Operation(op='ewm', span=0.5), ["series1"]),
+    (Operation(op='zscore'), ["label"]),
+])
+def test_failing_operations(ops_df, op, series_ids):
+    with pytest.raises(TsApiOperationError):
+        apply_operations(ops_df, [op], "timestamp", series_ids)
+
+
+def test_grouped_operations(ops_df):
+    df = pl.concat([ops_df.with_columns(pl.lit(name).alias("label")) for name in ["a", "b"]]).reverse()
+    result = apply_operations(df, [Operation(op='diff')], "timestamp", ["series1"], group_col="label")
+
+    assert result["series1"].null_count() == 2
+    assert result.filter(pl.col("label") == "b")["series1"].drop_nulls().to_list() == [1.0] * 23
+
+
+def test_grouped_resample(ops_df):
+    df = pl.concat([ops_df.with_columns(pl.lit(name).alias("label")) for name in ["a", "b"]])
+    result = apply_operations(df, [Operation(op='resample', every='12h')], "timestamp", [], group_col="label")
+
+    assert len(result) == 4
+    assert result["label"].to_list() == ["a", "a", "b", "b"]
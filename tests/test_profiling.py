@@ -0,0 +1,81 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from tsapi.model.profile import ProfileReport
+from tsapi.object_store import MemoryStore
+from tsapi.profiling import ProfileBudget, ProfilingMiddleware, load_profiler, report_name, speedscope_name, stage
+
+TOKEN = "secret"
+
+
+def make_app(store, budget=None):
+    app = FastAPI()
+
+    @app.get("/tsapi/v1/tsop/{opset_id}")
+    async def tsop(opset_id: str):
+        with stage("load"):
+            data = list(range(1000))
+        with stage("records"):
+            return {"id": opset_id, "total": sum(data)}
+
+    app.add_middleware(
+        ProfilingMiddleware, token=TOKEN, budget=budget or ProfileBudget(10, 1.0), store=store,
+        interval_seconds=0.001, max_seconds=5
+    )
+    return app
+
+
+def test_budget():
+    budget = ProfileBudget(max_per_minute=2, max_fraction=0.1)
+
+    assert budget.try_start(now=0)
+    # One at a time
+    assert not budget.try_start(now=0)
+    budget.finish(1.0, now=1)
+
+    assert budget.try_start(now=2)
+    budget.finish(1.0, now=3)
+    assert not budget.try_start(now=4)
+    # The first ones have left the window
+    assert budget.try_start(now=70)
+    budget.finish(7.0, now=77)
+    # 7 seconds of the last minute is over the fraction
+    assert not budget.try_start(now=80)
+
+
+def test_profile_request():
+    store = MemoryStore()
+    client = TestClient(make_app(store))
+
+    response = client.get("/tsapi/v1/tsop/op1", headers={"X-Profile": "1", "X-Profile-Token": TOKEN})
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+
+    report = ProfileReport.model_validate_json(store.read(report_name(profile_id)))
+    assert report.path == "/tsapi/v1/tsop/op1"
+    assert report.status_code == 200
+    assert [s.name for s in report.stages] == ["load", "records"]
+    assert report.flamegraph == (load_profiler() is not None)
+    assert store.exists(speedscope_name(profile_id)) == report.flamegraph
+
+    # The query flag works too
+    response = client.get("/tsapi/v1/tsop/op1?profile=true", headers={"X-Profile-Token": TOKEN})
+    assert "x-profile-id" in response.headers
+
+
+def test_profile_not_allowed():
+    store = MemoryStore()
+    client = TestClient(make_app(store, ProfileBudget(max_per_minute=0, max_fraction=1.0)))
+
+    assert client.get("/tsapi/v1/tsop/op1", headers={"X-Profile": "1"}).status_code == 403
+    assert client.get("/tsapi/v1/tsop/op1", headers={"X-Profile": "1", "X-Profile-Token": "x"}).status_code == 403
+
+    # Over the budget the request is served, just not profiled
+    response = client.get("/tsapi/v1/tsop/op1", headers={"X-Profile": "1", "X-Profile-Token": TOKEN})
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+
+    # Without the flag nothing happens
+    response = client.get("/tsapi/v1/tsop/op1")
+    assert "x-profile-id" not in response.headers
+    assert len(store.objects) == 0
@@ -0,0 +1,113 @@
+import io
+import json
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+import structlog
+
+from tsapi.column_stats import dataset_stats
+from tsapi.dataset_storage import DatasetStorage
+from tsapi.frequency import adjust_frequency
+from tsapi.model.dataset import DataSet, OperationSet
+from tsapi.object_store import MemoryStore
+from tsapi.progressive import RowGroupSampler, progressive_refinements, stats_preview, window_row_groups
+
+NUM_ROWS = 100_000
+
+
+@pytest.fixture
+def frame():
+    return pl.DataFrame({
+        "timestamp": [datetime(2024, 1, 1) + timedelta(minutes=i) for i in range(NUM_ROWS)],
+        "value": [float(i % 1000) for i in range(NUM_ROWS)],
+    })
+
+
+@pytest.fixture
+def dataset(frame):
+    return DataSet(
+        id="ds1", name="big", description="", num_series=1, max_length=NUM_ROWS, series_cols=["value"],
+        timestamp_cols=["timestamp"], stats=dataset_stats(frame, "timestamp", ["value"])
+    )
+
+
+@pytest.fixture
+def storage(frame, dataset):
+    storage = DatasetStorage(MemoryStore())
+    # 50 row groups
+    buffer = io.BytesIO()
+    frame.write_parquet(buffer, row_group_size=2000)
+    storage.store.write(dataset.file_name, buffer.getvalue())
+    return storage
+
+
+class MemoryCache:
+    """Stands in for DatasetCache, keeping frames in a dict."""
+
+    def __init__(self, storage, dataset):
+        self.frames = {}
+        self.storage = storage
+        self.dataset = dataset
+
+    async def opset_key(self, opset):
+        return f"{opset.offset}:{opset.limit}"
+
+    async def get_cached_dataset(self, key):
+        return self.frames.get(key)
+
+    async def cache_dataset(self, key, df):
+        self.frames[key] = df
+
+    async def get_operation_set(self, opset):
+        return await self.dataset.load_async(self.storage, opset.offset, opset.limit)
+
+
+def test_stats_preview(dataset):
+    opset = OperationSet(id="op1", dataset_id="ds1", series_ids=["value"], offset=0, limit=NUM_ROWS // 2)
+    preview = stats_preview(dataset, opset)
+
+    # Half of the 100 chunks
+    assert len(preview) == 50
+    assert preview["value"].max() <= 999
+
+    assert stats_preview(dataset, opset.model_copy(update={"group_by": "symbol"})) is None
+
+
+def test_sampler(storage, dataset, frame):
+    opset = OperationSet(id="op1", dataset_id="ds1", series_ids=["value"], offset=1000, limit=50_000)
+    info, metadata = storage.metadata(dataset.file_name)
+    assert [i for i, _ in window_row_groups(metadata, 1000, 50_000)] == list(range(26))
+
+    sampler = RowGroupSampler(storage, dataset, opset)
+    coarse, fraction = sampler.read(16)
+    assert 0 < fraction < 0.1
+
+    full, fraction = sampler.read(1)
+    assert fraction == 1.0
+    assert full.equals(frame.slice(1000, 50_000))
+
+
+@pytest.mark.asyncio()
+async def test_progressive_refinements(storage, dataset, frame):
+    opset = OperationSet(id="op1", dataset_id="ds1", series_ids=["value"], offset=0, limit=NUM_ROWS)
+    cache = MemoryCache(storage, dataset)
+    logger = structlog.get_logger()
+
+    lines = [json.loads(line) async for line in progressive_refinements(
+        dataset, opset, None, cache, storage, logger, max_points=1000
+    )]
+
+    assert [line["source"] for line in lines] == ["stats", "sample", "sample", "full"]
+    assert [line["final"] for line in lines] == [False, False, False, True]
+    # Each sample is finer than the one before
+    sizes = [len(line["data"]) for line in lines[1:]]
+    assert sizes == sorted(sizes)
+    assert sizes[-1] == len(adjust_frequency(frame, "timestamp", max_points=1000))
+    assert "0:100000" in cache.frames
+
+    # Once the window is cached it is sent whole
+    lines = [json.loads(line) async for line in progressive_refinements(
+        dataset, opset, None, cache, storage, logger, max_points=1000
+    )]
+    assert [line["source"] for line in lines] == ["stats", "full"]
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+import pytest
+
+from tsapi.seasonality import autocorrelation, calendar_periods, dataset_periods, detect_periods, series_periods
+
+
+@pytest.fixture()
+def hourly():
+    t = np.arange(24 * 7 * 6)
+    rng = np.random.default_rng(0)
+    return np.sin(2 * np.pi * t / 24) + 0.8 * np.sin(2 * np.pi * t / 168) + rng.normal(0, 0.2, len(t)) + 0.01 * t
+
+
+def test_calendar_periods():
+    assert calendar_periods(timedelta(hours=1)) == [24, 168, 8766]
+    assert calendar_periods(timedelta(days=1)) == [7, 365]
+    assert calendar_periods(timedelta(days=400)) == []
+
+
+def test_autocorrelation():
+    acf = autocorrelation(np.sin(2 * np.pi * np.arange(200) / 10))
+
+    assert acf[0] == 1.0
+    assert acf[10] > 0.9
+    assert acf[5] < -0.9
+
+
+def test_detect_periods(hourly):
+    assert detect_periods(hourly, timedelta(hours=1)) == [24, 168]
+    assert detect_periods(hourly) == [24]
+
+
+def test_detect_no_periods():
+    rng = np.random.default_rng(0)
+
+    assert detect_periods(rng.normal(size=500), timedelta(hours=1)) == []
+    assert detect_periods(np.arange(100.0)) == []
+    assert detect_periods(np.ones(5)) == []
+
+
+def test_series_periods(hourly):
+    ts = pl.datetime_range(datetime(2024, 1, 1), datetime(2024, 1, 1) + timedelta(hours=len(hourly) - 1),
+                           interval='1h', eager=True)
+    df = pl.DataFrame({"ts": ts, "y": hourly, "z": np.random.default_rng(1).normal(size=len(hourly))})
+
+    assert series_periods(df["y"], df["ts"]) == [24, 168]
+    assert dataset_periods(df.reverse(), "ts", ["y", "z"]) == {"y": [24, 168], "z": []}
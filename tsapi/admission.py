@@ -0,0 +1,342 @@
+import asyncio
+import heapq
+import itertools
+import math
+import re
+import time
+from typing import NamedTuple
+
+import structlog
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from tsapi.model.admission import AdmissionStats
+
+# Weight of the latest request in the average time a slot is held
+HOLD_SECONDS_WEIGHT = 0.2
+
+RATE_LIMIT_PREFIX = 'tsapi:rate'
+
+# Refill the client's bucket for the time since its last request and take the
+# cost of this one.  Returns how long to wait (as a string, since Lua numbers
+# are truncated to integers in replies), 0 if the request may go ahead.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('time')
+local t = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local bucket = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or t
+tokens = math.min(burst, tokens + math.max(0, t - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(t))
+redis.call('expire', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RouteClass(NamedTuple):
+    name: str
+    # Lower goes first when requests are waiting for a worker slot
+    priority: int
+    # Tokens taken from the client's bucket
+    cost: int
+
+
+EXEMPT = RouteClass('exempt', 0, 0)
+DEFAULT = RouteClass('default', 1, 1)
+TSOP = RouteClass('tsop', 2, 2)
+INGEST = RouteClass('ingest', 2, 5)
+FORECAST = RouteClass('forecast', 3, 5)
+
+# Health checks, CORS preflights and long-lived streams never wait or hold a slot
+EXEMPT_ROUTES = [
+    (None, re.compile(r'^/(health)?$')),
+    ('OPTIONS', re.compile(r'')),
+    ('GET', re.compile(r'^/tsapi/v1/tsop/[^/]+/tail$')),
+    ('GET', re.compile(r'^/tsapi/v1/admission$')),
+]
+
+ROUTE_CLASSES = [
+    ('POST', re.compile(r'^/tsapi/v1/(forecast|backtest)$'), FORECAST),
+    ('POST', re.compile(r'^/tsapi/v1/tsop/align$'), TSOP),
+    ('GET', re.compile(r'^/tsapi/v1/tsop/[^/]+$'), TSOP),
+    ('POST', re.compile(r'^/tsapi/v1/(datasets|files)$'), INGEST),
+    ('PUT', re.compile(r'^/tsapi/v1/upload$'), INGEST),
+]
+
+
+def route_class(method: str, path: str) -> RouteClass:
+    for route_method, pattern in EXEMPT_ROUTES:
+        if route_method in (None, method) and pattern.match(path):
+            return EXEMPT
+    for route_method, pattern, cls in ROUTE_CLASSES:
+        if route_method == method and pattern.match(path):
+            return cls
+    return DEFAULT
+
+
+class Overloaded(Exception):
+    """Raised when a request can't be admitted."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """
+    A concurrency limit with a bounded queue.  Waiters are granted slots in
+    order of priority, then arrival.
+    """
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters = []
+        self.counter = itertools.count()
+        self.hold_seconds = 1.0
+
+    @property
+    def queued(self) -> int:
+        return len(self.waiters)
+
+    def retry_after(self) -> int:
+        """Roughly how long until the queue has drained."""
+        return max(1, math.ceil(self.hold_seconds * (self.queued + 1) / self.limit))
+
+    async def acquire(self, priority: int = 0, timeout: float = None) -> float:
+        """
+        Wait for a slot.
+
+        :return: The time spent queued
+        :raises Overloaded: If the queue is full or no slot is free within timeout
+        """
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return 0.0
+        if self.queued >= self.max_queue:
+            raise Overloaded('queue_full', self.retry_after())
+
+        start = time.monotonic()
+        waiter = (priority, next(self.counter), asyncio.get_running_loop().create_future())
+        heapq.heappush(self.waiters, waiter)
+        try:
+            async with asyncio.timeout(timeout):
+                await waiter[2]
+        except BaseException as e:
+            if waiter[2].done() and not waiter[2].cancelled():
+                # Granted just as we gave up, so pass the slot on
+                self.release()
+            else:
+                waiter[2].cancel()
+                self.waiters.remove(waiter)
+                heapq.heapify(self.waiters)
+            if isinstance(e, TimeoutError):
+                raise Overloaded('timeout', self.retry_after()) from None
+            raise
+        return time.monotonic() - start
+
+    def release(self, held_seconds: float = None):
+        if held_seconds is not None:
+            self.hold_seconds += HOLD_SECONDS_WEIGHT * (held_seconds - self.hold_seconds)
+        # The slot goes straight to the next waiter, so nothing can jump the queue
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+def client_id(scope: Scope) -> str:
+    """The caller, as seen through the load balancer."""
+    forwarded = Headers(scope=scope).get('x-forwarded-for')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    client = scope.get('client')
+    return client[0] if client else 'unknown'
+
+
+class AdmissionController:
+    """
+    Admission of requests in one worker: a token bucket per client (shared by
+    the workers through Redis), a concurrency limit per route class and a limit
+    on all requests, whose queue is ordered by route class priority.
+    """
+
+    def __init__(
+            self, max_concurrency: int, route_limits: dict[str, int], max_queue: int, max_queue_seconds: float,
+            rate: float = 0, burst: int = 0, redis_host: str = None, logger=None
+    ):
+        self.limiter = Limiter(max_concurrency, max_queue) if max_concurrency > 0 else None
+        self.route_limiters = {
+            name: Limiter(limit, max_queue) for name, limit in route_limits.items() if limit > 0
+        }
+        self.max_queue_seconds = max_queue_seconds
+        self.rate = rate
+        self.burst = burst
+        self.client = None
+        if rate > 0:
+            # Only imported if there are rate limits
+            import redis.asyncio as redis
+            self.client = redis.Redis(host=redis_host, port=6379, db=0)
+        self.logger = logger or structlog.get_logger()
+        self.stats: dict[str, AdmissionStats] = {}
+
+    def class_stats(self, name: str) -> AdmissionStats:
+        stats = self.stats.get(name)
+        if stats is None:
+            limiter = self.route_limiters.get(name)
+            stats = self.stats[name] = AdmissionStats(route_class=name, limit=limiter.limit if limiter else 0)
+        return stats
+
+    async def check_rate(self, client: str, cls: RouteClass) -> float:
+        """
+        :return: How long the client has to wait, 0 if it is within its rate
+        """
+        if self.client is None:
+            return 0.0
+        from redis import RedisError
+
+        try:
+            wait = await self.client.eval(
+                TOKEN_BUCKET_SCRIPT, 1, f'{RATE_LIMIT_PREFIX}:{client}', self.rate, self.burst,
+                min(cls.cost, self.burst)
+            )
+            return float(wait)
+        except RedisError as e:
+            # Better to serve without rate limits than not at all
+            self.logger.warning("Rate limit check failed", error=str(e))
+            return 0.0
+
+    async def admit(self, client: str, cls: RouteClass) -> list[Limiter]:
+        """
+        Wait for the request's slots.
+
+        :return: The limiters to release when the request is done
+        :raises Overloaded: If the request is rejected
+        """
+        stats = self.class_stats(cls.name)
+
+        wait = await self.check_rate(client, cls)
+        if wait > 0:
+            stats.rate_limited += 1
+            raise Overloaded('rate_limited', wait)
+
+        # The route limit comes first, so requests held back by it don't take up the shared queue
+        limiters = [limiter for limiter in (self.route_limiters.get(cls.name), self.limiter) if limiter]
+        deadline = time.monotonic() + self.max_queue_seconds
+        acquired = []
+        queue_seconds = 0.0
+        stats.queued += 1
+        try:
+            for limiter in limiters:
+                queue_seconds += await limiter.acquire(cls.priority, max(0.0, deadline - time.monotonic()))
+                acquired.append(limiter)
+        except Overloaded as e:
+            for limiter in acquired:
+                limiter.release()
+            if e.reason == 'queue_full':
+                stats.rejected_queue_full += 1
+            else:
+                stats.rejected_timeout += 1
+            raise
+        except BaseException:
+            for limiter in acquired:
+                limiter.release()
+            raise
+        finally:
+            stats.queued -= 1
+
+        stats.admitted += 1
+        stats.in_flight += 1
+        stats.queue_seconds_total += queue_seconds
+        stats.queue_seconds_max = max(stats.queue_seconds_max, queue_seconds)
+        return acquired
+
+    def release(self, cls: RouteClass, limiters: list[Limiter], held_seconds: float):
+        self.class_stats(cls.name).in_flight -= 1
+        for limiter in reversed(limiters):
+            limiter.release(held_seconds)
+
+
+def rejection_response(e: Overloaded) -> JSONResponse:
+    # Too many requests from this client is 429, too many from everyone is 503
+    status_code = 429 if e.reason == 'rate_limited' else 503
+    return JSONResponse(
+        {'detail': f'Request rejected ({e.reason}), retry later'},
+        status_code=status_code,
+        headers={'Retry-After': str(max(1, math.ceil(e.retry_after)))},
+    )
+
+
+class AdmissionMiddleware:
+    """
+    Queue or reject requests before they reach the handlers (see
+    AdmissionController).  A request holds its slots until its response has
+    been sent.
+
+    The controller is built from the app settings (app.state.settings) on the
+    first request, unless one is given, and is kept in app.state.admission for
+    the stats endpoint.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController = None):
+        self.app = app
+        self.controller = controller
+        self.configured = False
+
+    def configure(self, scope: Scope):
+        if self.controller is None:
+            settings = scope['app'].state.settings
+            self.controller = AdmissionController(
+                settings.max_concurrent_requests,
+                settings.route_concurrency,
+                settings.max_queued_requests,
+                settings.max_queue_seconds,
+                settings.rate_limit_per_second,
+                settings.rate_limit_burst,
+                settings.redis_host,
+            )
+        if 'app' in scope:
+            scope['app'].state.admission = self.controller
+        self.configured = True
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        if not self.configured:
+            self.configure(scope)
+
+        cls = route_class(scope['method'], scope['path'])
+        if cls is EXEMPT:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            limiters = await self.controller.admit(client_id(scope), cls)
+        except Overloaded as e:
+            self.controller.logger.warning(
+                "Rejected request", path=scope['path'], route_class=cls.name, reason=e.reason
+            )
+            await rejection_response(e)(scope, receive, send)
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cls, limiters, time.monotonic() - start)
@@ -0,0 +1,99 @@
+from datetime import datetime
+from typing import NamedTuple
+
+import polars as pl
+
+from tsapi.errors import TsApiOperationError
+from tsapi.frequency import adjust_frequency
+
+ALIGNED_TSCOL = 'timestamp'
+
+
+class AlignFrame(NamedTuple):
+    name: str
+    df: pl.DataFrame
+    tscol: str
+    series_cols: list[str]
+
+
+def _check_duration(name: str, duration: str, allow_zero: bool = False):
+    start = datetime(2000, 1, 1)
+    try:
+        end = pl.select(pl.lit(start).dt.offset_by(duration)).item()
+    except (pl.exceptions.PolarsError, ValueError):
+        raise TsApiOperationError(f"Invalid {name}: {duration!r}")
+    if end < start or (end == start and not allow_zero):
+        raise TsApiOperationError(f"The {name} has to be positive: {duration!r}")
+
+
+def check_durations(every: str = None, tolerance: str = None):
+    """
+    :raises TsApiOperationError: If every or tolerance isn't a duration (e.g. '1h') Polars can use
+    """
+    if every is not None:
+        _check_duration('every', every)
+    if tolerance is not None:
+        _check_duration('tolerance', tolerance, allow_zero=True)
+
+
+def _normalize(frame: AlignFrame) -> pl.LazyFrame:
+    """
+    Put a frame into a common shape: a naive microsecond `timestamp` column
+    (timezone-aware data is converted to UTC) and float series columns named
+    `<frame name>:<column>` so that columns from different opsets can't clash.
+    """
+    dtype = frame.df.schema[frame.tscol]
+    ts = pl.col(frame.tscol)
+    if isinstance(dtype, pl.Datetime) and dtype.time_zone is not None:
+        ts = ts.dt.convert_time_zone('UTC').dt.replace_time_zone(None)
+
+    series_cols = frame.series_cols or [
+        col for col, dtype in frame.df.schema.items() if dtype.is_numeric()
+    ]
+
+    return (
+        frame.df.lazy()
+        .select(
+            ts.cast(pl.Datetime('us')).alias(ALIGNED_TSCOL),
+            *[
+                pl.col(col).cast(pl.Float64).fill_nan(None).alias(f'{frame.name}:{col}')
+                for col in series_cols
+            ]
+        )
+        .drop_nulls(ALIGNED_TSCOL)
+        .sort(ALIGNED_TSCOL)
+    )
+
+
+def align_frames(frames: list[AlignFrame], every: str = None, tolerance: str = None) -> pl.DataFrame:
+    """
+    Join the frames on their timestamps.
+
+    With `every`, each frame is averaged into time buckets of that size and the
+    buckets are outer joined.  Otherwise the first frame's timestamps are the
+    timeline, and the other frames are joined as-of (the latest value at or
+    before each timestamp, optionally no older than `tolerance`).
+
+    The joined frame is downsampled once, after alignment.
+    """
+    check_durations(every=every, tolerance=tolerance)
+    if len(frames) == 0:
+        return pl.DataFrame(schema={ALIGNED_TSCOL: pl.Datetime('us')})
+
+    lazy_frames = [_normalize(frame) for frame in frames]
+
+    if every is not None:
+        lazy_frames = [
+            lf.group_by_dynamic(ALIGNED_TSCOL, every=every).agg(pl.all().exclude(ALIGNED_TSCOL).mean())
+            for lf in lazy_frames
+        ]
+        aligned = lazy_frames[0]
+        for lf in lazy_frames[1:]:
+            aligned = aligned.join(lf, on=ALIGNED_TSCOL, how='full', coalesce=True)
+        aligned = aligned.sort(ALIGNED_TSCOL)
+    else:
+        aligned = lazy_frames[0]
+        for lf in lazy_frames[1:]:
+            aligned = aligned.join_asof(lf, on=ALIGNED_TSCOL, strategy='backward', tolerance=tolerance)
+
+    return adjust_frequency(aligned.collect(), ALIGNED_TSCOL)
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import numpy as np
+import polars as pl
+
+from tsapi.errors import TsApiDataError, TsApiForecastError
+from tsapi.forecast import fit_model, get_process_pool, model_periods
+from tsapi.model.forecast import BacktestFold, BacktestResponse
+
+
+def fold_origins(num_points: int, horizon: int, folds: int, min_train: int) -> list[int]:
+    """
+    Rolling-origin folds: the last `folds` windows of `horizon` points are each
+    forecast from a model fit to all the data before them.
+
+    :return: The index of the first forecast point of each fold
+    """
+    if folds < 1 or horizon < 1:
+        raise TsApiDataError("Backtest needs at least one fold and a positive horizon")
+
+    origins = [num_points - (folds - i) * horizon for i in range(folds)]
+    if origins[0] < min_train:
+        raise TsApiDataError(
+            f"Not enough data for {folds} folds of {horizon} points (need {min_train + folds * horizon})"
+        )
+
+    return origins
+
+
+def fold_errors(actual: np.ndarray, point: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> dict:
+    errors = np.abs(actual - point)
+
+    # Percentage errors are undefined where the actual value is zero
+    nonzero = actual != 0
+    mape = float(np.mean(errors[nonzero] / np.abs(actual[nonzero]))) if nonzero.any() else None
+
+    return {
+        'mae': float(np.mean(errors)),
+        'mape': mape,
+        'coverage': float(np.mean((lower <= actual) & (actual <= upper))),
+    }
+
+
+def run_fold(y: np.ndarray, origin: int, horizon: int, periods: list[int], level: float) -> dict:
+    """
+    Fit to the data before origin and score the forecast of the following horizon points.
+    This runs in a worker process.
+    """
+    start = time.perf_counter()
+
+    model = fit_model(y[:origin], periods)
+    predictions = model.predict(horizon, level=level)
+
+    errors = fold_errors(y[origin:origin + horizon], predictions.point(), predictions.lower(), predictions.upper())
+    errors['fit_seconds'] = time.perf_counter() - start
+
+    return errors
+
+
+def _mean(values: list[float | None]) -> float | None:
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
+async def backtest(
+        series: pl.Series,
+        timestamp: pl.Series,
+        horizon: int = 10,
+        folds: int = 5,
+        level: float = 0.95,
+        periods: list[int] = None
+) -> BacktestResponse:
+    """
+    Evaluate the forecast model with rolling-origin cross validation.  The
+    folds are fit in parallel in the forecast process pool.  A fold that
+    fails is reported with its error and left out of the averages.
+
+    :raises TsApiForecastError: If every fold fails
+    """
+    start = time.perf_counter()
+
+    y = series.cast(pl.Float64).to_numpy()
+    # MSTL needs at least two full cycles of the longest period in every fold
+    periods = model_periods(periods, len(y) - folds * horizon)
+    origins = fold_origins(len(y), horizon, folds, min_train=2 * max(periods) + 1)
+
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    results = await asyncio.gather(
+        *[loop.run_in_executor(pool, run_fold, y, origin, horizon, periods, level) for origin in origins],
+        return_exceptions=True
+    )
+
+    fold_results = [
+        BacktestFold(
+            fold=i,
+            train_size=origin,
+            start=timestamp[origin],
+            end=timestamp[origin + horizon - 1],
+            **({'error': str(result)} if isinstance(result, Exception) else result)
+        )
+        for i, (origin, result) in enumerate(zip(origins, results))
+    ]
+
+    failed = [str(f.fold) for f in fold_results if f.error is not None]
+    if len(failed) == len(fold_results):
+        raise TsApiForecastError(f"Every fold failed: {fold_results[0].error}")
+
+    return BacktestResponse(
+        folds=fold_results,
+        mae=_mean([f.mae for f in fold_results]),
+        mape=_mean([f.mape for f in fold_results]),
+        coverage=_mean([f.coverage for f in fold_results]),
+        compute_seconds=time.perf_counter() - start,
+        error=f"Backtest failed for folds: {', '.join(failed)}" if failed else None
+    )
@@ -0,0 +1,84 @@
+import asyncio
+from typing import TYPE_CHECKING
+
+from tsapi.dataset_cache import CACHE_PREFIX, dataset_key, opset_digest, parse_key
+from tsapi.dataset_storage import DatasetStorage, get_storage
+from tsapi.model.dataset import DataSet, OperationSet
+from tsapi.mongo_client import MongoClient
+
+if TYPE_CHECKING:
+    import redis.asyncio as redis
+
+SWEEP_LOCK_KEY = 'tsapi:sweeper'
+SCAN_COUNT = 1000
+
+
+async def live_keys(datasets: list[dict], storage: DatasetStorage) -> dict[str, set[str]]:
+    """
+    The current key of each dataset, with the digests of its opsets.  A
+    dataset whose file is gone has no live keys.
+    """
+    live = {}
+    for doc in datasets:
+        dataset = DataSet(**doc)
+        try:
+            info = await asyncio.to_thread(storage.store.stat, dataset.file_name)
+        except FileNotFoundError:
+            continue
+        live[dataset_key(dataset, info.version)] = {opset_digest(OperationSet(**ops)) for ops in doc['ops']}
+    return live
+
+
+def is_orphan(key: str, live: dict[str, set[str]]) -> bool:
+    """
+    A key is an orphan if it is for a deleted dataset, an old version of the
+    dataset or parameters that no opset has any more.
+    """
+    _, dataset_prefix, digest = parse_key(key)
+    digests = live.get(dataset_prefix)
+    return digests is None or (digest is not None and digest not in digests)
+
+
+async def sweep_orphans(client: 'redis.Redis', settings, logger, dry_run: bool = False) -> int:
+    """
+    Delete the cached frames that no dataset or opset refers to.  They would
+    expire eventually, but the TTL is long.
+
+    :return: The number of orphaned keys
+    """
+    datasets = await MongoClient(settings).get_all_datasets()
+    live = await live_keys(datasets, get_storage(settings))
+
+    deleted = 0
+    orphans = []
+    async for key in client.scan_iter(match=f'{CACHE_PREFIX}:*', count=SCAN_COUNT):
+        if is_orphan(key.decode(), live):
+            orphans.append(key)
+        if len(orphans) == SCAN_COUNT:
+            deleted += len(orphans) if dry_run else await client.unlink(*orphans)
+            orphans = []
+    if orphans:
+        deleted += len(orphans) if dry_run else await client.unlink(*orphans)
+
+    logger.info("Swept cache", datasets=len(live), deleted=deleted, dry_run=dry_run)
+    return deleted
+
+
+async def run_sweeper(settings, logger):
+    """
+    Sweep the cache every cache_sweep_seconds.  Every worker runs this loop,
+    but a Redis lock that lasts for the interval lets only one of them sweep.
+    """
+    import redis.asyncio as redis
+
+    client = redis.Redis(host=settings.redis_host, port=6379, db=0)
+    try:
+        while True:
+            await asyncio.sleep(settings.cache_sweep_seconds)
+            try:
+                if await client.set(SWEEP_LOCK_KEY, 1, nx=True, ex=settings.cache_sweep_seconds):
+                    await sweep_orphans(client, settings, logger)
+            except Exception as e:
+                logger.error("Cache sweep failed", error=str(e))
+    finally:
+        await client.aclose()
@@ -0,0 +1,313 @@
+"""
+Bulk dataset administration.
+
+    python -m tsapi.cli ingest data/ --compact
+    python -m tsapi.cli rebuild
+    python -m tsapi.cli warm
+    python -m tsapi.cli purge --dry-run
+
+Each command runs its work items (files, datasets or opsets) on a bounded
+pool, prints a line per item and a throughput summary at the end.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, NamedTuple
+
+import pyarrow.parquet as pq
+import redis.asyncio as redis
+import structlog
+
+from tsapi.cache_sweeper import sweep_orphans
+from tsapi.dataset_cache import DatasetCache
+from tsapi.dataset_storage import DatasetStorage, get_storage
+from tsapi.model.dataset import DataSet, OperationSet, save_dataset, save_dataset_source
+from tsapi.mongo_client import MongoClient
+from tsapi.settings import load_settings
+
+INGEST_SUFFIXES = ('.csv', '.parquet')
+
+# Fields of a dataset derived from its file, which rebuild recomputes
+METADATA_FIELDS = [
+    'num_series', 'max_length', 'series_cols', 'timestamp_cols', 'other_cols', 'conditions', 'stats', 'periods'
+]
+
+
+class TaskResult(NamedTuple):
+    name: str
+    rows: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    error: str | None = None
+    skipped: bool = False
+
+
+class Progress:
+    """
+    Prints a line as each item finishes, then the totals and throughput.
+    """
+
+    def __init__(self, total: int, out=sys.stderr):
+        self.total = total
+        self.out = out
+        self.results: list[TaskResult] = []
+        self.start = time.perf_counter()
+
+    def update(self, result: TaskResult):
+        self.results.append(result)
+        if result.error is not None:
+            status = f"FAILED: {result.error}"
+        elif result.skipped:
+            status = "skipped"
+        else:
+            status = f"{result.rows:,} rows, {result.bytes / 1e6:.1f} MB in {result.seconds:.2f} s"
+        print(f"[{len(self.results)}/{self.total}] {result.name}: {status}", file=self.out, flush=True)
+
+    def summary(self) -> str:
+        seconds = max(time.perf_counter() - self.start, 1e-9)
+        done = [r for r in self.results if r.error is None and not r.skipped]
+        failed = sum(1 for r in self.results if r.error is not None)
+        skipped = sum(1 for r in self.results if r.skipped)
+        rows = sum(r.rows for r in done)
+        mb = sum(r.bytes for r in done) / 1e6
+        return (
+            f"{len(done)} done, {failed} failed, {skipped} skipped in {seconds:.1f} s: "
+            f"{rows:,} rows ({rows / seconds:,.0f} rows/s), {mb:.1f} MB ({mb / seconds:.1f} MB/s)"
+        )
+
+
+async def run_bounded(
+        items: list[tuple[str, Any]], task: Callable[[Any], Awaitable[TaskResult]], workers: int, progress: Progress
+) -> list[TaskResult]:
+    """
+    Run task on each (name, item), at most workers at a time.  A failed item
+    is reported and doesn't stop the others.
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def run(name: str, item: Any) -> TaskResult:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await task(item)
+            except Exception as e:
+                result = TaskResult(name, seconds=time.perf_counter() - start, error=str(e) or type(e).__name__)
+        progress.update(result)
+        return result
+
+    return await asyncio.gather(*(run(name, item) for name, item in items))
+
+
+def find_files(directory: str, pattern: str = '*') -> list[Path]:
+    return sorted(
+        path for path in Path(directory).glob(pattern) if path.is_file() and path.suffix.lower() in INGEST_SUFFIXES
+    )
+
+
+def ingest_file(
+        path: Path, storage: DatasetStorage, logger, compact: bool = False, allow_float32: bool = False
+) -> DataSet:
+    """
+    Store a CSV or parquet file as a dataset named after it, the same way as
+    an upload through the API.
+    """
+    data = path.read_bytes()
+    if path.suffix.lower() == '.csv':
+        return save_dataset_source(path.stem, storage, data, logger, compact, allow_float32)
+    return save_dataset(path.stem, storage, data, logger, compact, allow_float32)
+
+
+def dataset_info(path: str, out=sys.stdout):
+    """
+    Describe a parquet file from its footer, without reading the data.
+    """
+    metadata = pq.read_metadata(path)
+    print(f"{metadata.num_rows:,} rows in {metadata.num_row_groups} row groups", file=out)
+    print(metadata.schema.to_arrow_schema(), file=out)
+
+    for i in range(metadata.num_columns):
+        column = metadata.schema.column(i).name
+        minimum = maximum = None
+        nulls = 0
+        for rg in range(metadata.num_row_groups):
+            stats = metadata.row_group(rg).column(i).statistics
+            if stats is None or not stats.has_min_max:
+                continue
+            minimum = stats.min if minimum is None else min(minimum, stats.min)
+            maximum = stats.max if maximum is None else max(maximum, stats.max)
+            nulls += stats.null_count or 0
+        print(f"{column}: min={minimum} max={maximum} nulls={nulls}", file=out)
+
+
+class Admin:
+    """
+    The settings, storage and MongoDB client shared by the commands.
+    """
+
+    def __init__(self, settings, logger, workers: int):
+        self.settings = settings
+        self.logger = logger
+        self.workers = workers
+        self.storage = get_storage(settings)
+        self.mongo = MongoClient(settings)
+
+    async def ingest(self, directory: str, pattern: str, compact: bool, allow_float32: bool, replace: bool) -> Progress:
+        files = find_files(directory, pattern)
+        progress = Progress(len(files))
+
+        async def task(path: Path) -> TaskResult:
+            start = time.perf_counter()
+            existing = await self.mongo.get_dataset_by_name(path.stem)
+            if existing is not None and not replace:
+                return TaskResult(path.stem, skipped=True)
+
+            dataset = await asyncio.to_thread(ingest_file, path, self.storage, self.logger, compact, allow_float32)
+            if existing is not None:
+                # In place, so the id and the opsets are kept, with the version incremented
+                await self.mongo.replace_dataset(existing['id'], dataset.model_dump())
+                dataset.id = existing['id']
+            else:
+                dataset.id = await self.mongo.insert_dataset(dataset.model_dump())
+            return TaskResult(path.stem, dataset.max_length, path.stat().st_size, time.perf_counter() - start)
+
+        await run_bounded([(path.stem, path) for path in files], task, self.workers, progress)
+        return progress
+
+    async def rebuild(self, names: list[str]) -> Progress:
+        datasets = [DataSet(**doc) for doc in await self.mongo.get_all_datasets()]
+        if names:
+            datasets = [dataset for dataset in datasets if dataset.name in names]
+        progress = Progress(len(datasets))
+
+        async def task(dataset: DataSet) -> TaskResult:
+            start = time.perf_counter()
+            df = await dataset.load_async(self.storage)
+            rebuilt = await asyncio.to_thread(DataSet.from_dataframe, df, dataset.name)
+            await self.mongo.update_dataset_metadata(dataset.id, rebuilt.model_dump(include=set(METADATA_FIELDS)))
+            size = (await asyncio.to_thread(self.storage.store.stat, dataset.file_name)).size
+            return TaskResult(dataset.name, len(df), size, time.perf_counter() - start)
+
+        await run_bounded([(dataset.name, dataset) for dataset in datasets], task, self.workers, progress)
+        return progress
+
+    async def warm(self, names: list[str]) -> Progress:
+        docs = await self.mongo.get_all_datasets()
+        items = []
+        for doc in docs:
+            dataset = DataSet(**doc)
+            if names and dataset.name not in names:
+                continue
+            items.extend((f'{dataset.name}/{opset.id}', (dataset, opset)) for opset in dataset.ops)
+        progress = Progress(len(items))
+
+        async def task(item: tuple[DataSet, OperationSet]) -> TaskResult:
+            dataset, opset = item
+            start = time.perf_counter()
+            df = await DatasetCache(dataset, self.settings, self.logger).get_operation_set(opset)
+            return TaskResult(f'{dataset.name}/{opset.id}', len(df), df.estimated_size(), time.perf_counter() - start)
+
+        await run_bounded(items, task, self.workers, progress)
+        return progress
+
+    async def purge(self, dry_run: bool) -> tuple[int, int]:
+        """
+        :return: The number of orphaned opsets and cache keys
+        """
+        opsets = await self.mongo.delete_orphan_opsets(dry_run)
+        client = redis.Redis(host=self.settings.redis_host, port=6379, db=0)
+        try:
+            keys = await sweep_orphans(client, self.settings, self.logger, dry_run)
+        finally:
+            await client.aclose()
+        return opsets, keys
+
+    async def delete(self, name: str) -> bool:
+        doc = await self.mongo.get_dataset_by_name(name)
+        if doc is None:
+            return False
+        dataset = DataSet(**doc)
+        await self.mongo.delete_dataset(dataset.id)
+        await dataset.delete(self.storage, self.logger)
+        await DatasetCache(dataset, self.settings, self.logger).delete_dataset()
+        return True
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='tsapi', description="Time Series API dataset administration")
+    parser.add_argument('--workers', type=int, default=4, help="Items processed at a time (default 4)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help="Add every CSV and parquet file in a directory as a dataset")
+    ingest.add_argument('directory')
+    ingest.add_argument('--pattern', default='*', help="Glob for the files to ingest (default *)")
+    ingest.add_argument('--compact', action='store_true', help="Downcast, encode and sort the datasets")
+    ingest.add_argument('--allow-float32', action='store_true', help="Let compaction lose float precision")
+    ingest.add_argument(
+        '--replace', action='store_true', help="Replace datasets that already exist, keeping their opsets"
+    )
+
+    rebuild = commands.add_parser('rebuild', help="Recompute the metadata and statistics of datasets")
+    rebuild.add_argument('names', nargs='*', help="Datasets to rebuild (default all)")
+
+    warm = commands.add_parser('warm', help="Load the opsets of datasets into the cache")
+    warm.add_argument('names', nargs='*', help="Datasets to warm (default all)")
+
+    purge = commands.add_parser('purge', help="Delete orphaned opsets and cache entries")
+    purge.add_argument('--dry-run', action='store_true', help="Only count the orphans")
+
+    commands.add_parser('list', help="List the datasets")
+
+    delete = commands.add_parser('delete', help="Delete a dataset by name")
+    delete.add_argument('name')
+
+    info = commands.add_parser('info', help="Describe a parquet file from its footer")
+    info.add_argument('path')
+
+    return parser
+
+
+async def run(args: argparse.Namespace) -> int:
+    # Conversions run in threads, so the pool bounds them as well as the semaphore
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.workers))
+    admin = Admin(load_settings(), structlog.get_logger(), args.workers)
+
+    if args.command == 'ingest':
+        progress = await admin.ingest(args.directory, args.pattern, args.compact, args.allow_float32, args.replace)
+    elif args.command == 'rebuild':
+        progress = await admin.rebuild(args.names)
+    elif args.command == 'warm':
+        progress = await admin.warm(args.names)
+    elif args.command == 'purge':
+        opsets, keys = await admin.purge(args.dry_run)
+        print(f"{'Found' if args.dry_run else 'Deleted'} {opsets} orphaned opsets and {keys} cache keys")
+        return 0
+    elif args.command == 'list':
+        for doc in await admin.mongo.get_datasets():
+            print(f"{doc['id']}  {doc['name']}  {doc['max_length']:,} rows  {len(doc['ops'])} opsets")
+        return 0
+    elif args.command == 'delete':
+        if not await admin.delete(args.name):
+            print(f"No dataset named {args.name}", file=sys.stderr)
+            return 1
+        return 0
+    else:
+        raise ValueError(f"Unknown command: {args.command}")
+
+    print(progress.summary(), file=sys.stderr)
+    return 1 if any(result.error is not None for result in progress.results) else 0
+
+
+def main(argv: list[str] = None) -> int:
+    args = parser().parse_args(argv)
+    if args.command == 'info':
+        # Doesn't need the settings or any services
+        dataset_info(args.path)
+        return 0
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
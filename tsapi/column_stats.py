@@ -0,0 +1,239 @@
+import math
+
+import polars as pl
+
+from tsapi.constants import NUM_STATS_CHUNKS
+from tsapi.model.stats import ChunkStats, ColumnStats, DatasetStats
+
+
+def _timestamp_expr(df: pl.DataFrame, tscol: str) -> pl.Expr:
+    # Dates can't be stored in MongoDB, so promote them to datetimes
+    if df.schema[tscol] == pl.Date:
+        return pl.col(tscol).cast(pl.Datetime)
+    return pl.col(tscol)
+
+
+def _float_expr(col: str) -> pl.Expr:
+    # NaN isn't valid JSON, so treat it the same as a missing value
+    return pl.col(col).cast(pl.Float64).fill_nan(None)
+
+
+def column_stats(df: pl.DataFrame, series_cols: list[str]) -> list[ColumnStats]:
+    """
+    Compute summary statistics for each of the series columns in a single pass.
+    """
+    if len(series_cols) == 0:
+        return []
+
+    exprs = []
+    for i, col in enumerate(series_cols):
+        exprs.extend([
+            pl.col(col).null_count().alias(f'{i}:null_count'),
+            _float_expr(col).count().alias(f'{i}:count'),
+            _float_expr(col).min().alias(f'{i}:min'),
+            _float_expr(col).max().alias(f'{i}:max'),
+            _float_expr(col).mean().alias(f'{i}:mean'),
+            _float_expr(col).std().alias(f'{i}:std'),
+        ])
+
+    row = df.select(exprs).row(0, named=True)
+
+    return [
+        ColumnStats(
+            name=col,
+            dtype=str(df.schema[col]),
+            count=row[f'{i}:count'],
+            null_count=row[f'{i}:null_count'],
+            min=row[f'{i}:min'],
+            max=row[f'{i}:max'],
+            mean=row[f'{i}:mean'],
+            std=row[f'{i}:std'],
+        )
+        for i, col in enumerate(series_cols)
+    ]
+
+
+def chunk_stats(
+        df: pl.DataFrame,
+        tscol: str,
+        series_cols: list[str],
+        num_chunks: int = NUM_STATS_CHUNKS
+) -> list[ChunkStats]:
+    """
+    Split the time-ordered data into roughly equal sized chunks and compute the
+    min/max of each series in each chunk.  This is enough to draw a coarse
+    envelope of the data without reading the file.
+    """
+    num_rows = len(df) - df[tscol].null_count()
+    if num_rows == 0:
+        return []
+
+    chunk_size = math.ceil(num_rows / num_chunks)
+
+    chunks_df = (
+        df.lazy()
+        .select(_timestamp_expr(df, tscol), *[_float_expr(col) for col in series_cols])
+        .filter(pl.col(tscol).is_not_null())
+        .sort(tscol)
+        .with_row_index('_row')
+        .group_by((pl.col('_row') // chunk_size).alias('_chunk'), maintain_order=True)
+        .agg(
+            pl.col(tscol).first().alias('_start'),
+            pl.col(tscol).last().alias('_end'),
+            pl.len().alias('_rows'),
+            *[pl.col(col).min().alias(f'{i}:min') for i, col in enumerate(series_cols)],
+            *[pl.col(col).max().alias(f'{i}:max') for i, col in enumerate(series_cols)],
+        )
+        .collect()
+    )
+
+    return [
+        ChunkStats(
+            start=row['_start'],
+            end=row['_end'],
+            rows=row['_rows'],
+            min={col: row[f'{i}:min'] for i, col in enumerate(series_cols)},
+            max={col: row[f'{i}:max'] for i, col in enumerate(series_cols)},
+        )
+        for row in chunks_df.iter_rows(named=True)
+    ]
+
+
+def dataset_stats(
+        df: pl.DataFrame, tscol: str, series_cols: list[str], num_chunks: int = NUM_STATS_CHUNKS
+) -> DatasetStats:
+    """
+    Compute the statistics stored with the dataset metadata.
+    """
+    start, end = None, None
+    if len(df) > 0:
+        start, end = df.select(
+            _timestamp_expr(df, tscol).min().alias('start'),
+            _timestamp_expr(df, tscol).max().alias('end'),
+        ).row(0)
+
+    return DatasetStats(
+        rows=len(df),
+        start=start,
+        end=end,
+        columns=column_stats(df, series_cols),
+        chunks=chunk_stats(df, tscol, series_cols, num_chunks),
+    )
+
+
+def split_columns(schema: pl.Schema) -> tuple[list[str], list[str], list[str]]:
+    """
+    :return: The series (numeric), timestamp and other columns of a dataset
+    """
+    series, times, others = [], [], []
+    for col, dtype in schema.items():
+        if dtype.is_numeric():
+            series.append(col)
+        elif dtype.is_temporal():
+            times.append(col)
+        else:
+            others.append(col)
+    return series, times, others
+
+
+def _merge_columns(a: ColumnStats, b: ColumnStats) -> ColumnStats:
+    count = a.count + b.count
+    if a.count == 0 or b.count == 0:
+        mean, std = (b.mean, b.std) if a.count == 0 else (a.mean, a.std)
+    else:
+        # Chan et al.'s pairwise update of the sums of squared deviations
+        m2 = (a.std or 0.0) ** 2 * (a.count - 1) + (b.std or 0.0) ** 2 * (b.count - 1)
+        delta = b.mean - a.mean
+        mean = a.mean + delta * b.count / count
+        m2 += delta ** 2 * a.count * b.count / count
+        std = math.sqrt(m2 / (count - 1))
+    return ColumnStats(
+        name=a.name,
+        dtype=a.dtype,
+        count=count,
+        null_count=a.null_count + b.null_count,
+        min=min((v for v in (a.min, b.min) if v is not None), default=None),
+        max=max((v for v in (a.max, b.max) if v is not None), default=None),
+        mean=mean,
+        std=std,
+    )
+
+
+def _merge_chunks(chunks: list[ChunkStats]) -> ChunkStats:
+    cols = chunks[0].min.keys()
+    return ChunkStats(
+        start=min(chunk.start for chunk in chunks),
+        end=max(chunk.end for chunk in chunks),
+        rows=sum(chunk.rows for chunk in chunks),
+        min={col: min((c.min[col] for c in chunks if c.min[col] is not None), default=None) for col in cols},
+        max={col: max((c.max[col] for c in chunks if c.max[col] is not None), default=None) for col in cols},
+    )
+
+
+class StatsBuilder:
+    """
+    Dataset statistics built a frame at a time, for files that are never
+    loaded whole.  The column statistics are exact.  Each frame adds chunks
+    of its own, which are merged in time order into num_chunks at the end.
+    They are close to dataset_stats when the frames come in time order, and
+    a coarser envelope when their times overlap.
+    """
+
+    def __init__(self, tscol: str, series_cols: list[str], num_chunks: int = NUM_STATS_CHUNKS):
+        self.tscol = tscol
+        self.series_cols = series_cols
+        self.num_chunks = num_chunks
+        self.rows = 0
+        self.start = None
+        self.end = None
+        self.columns: list[ColumnStats] = []
+        self.chunks: list[ChunkStats] = []
+
+    def add(self, df: pl.DataFrame):
+        if len(df) > 0:
+            self.merge(dataset_stats(df, self.tscol, self.series_cols, self.num_chunks))
+
+    def merge(self, stats: DatasetStats):
+        """Add the statistics of a frame, e.g. computed on another thread."""
+        if stats.rows == 0:
+            return
+        self.rows += stats.rows
+        if stats.start is not None:
+            self.start = stats.start if self.start is None else min(self.start, stats.start)
+            self.end = stats.end if self.end is None else max(self.end, stats.end)
+        if not self.columns:
+            self.columns = stats.columns
+        else:
+            self.columns = [_merge_columns(a, b) for a, b in zip(self.columns, stats.columns)]
+
+        self.chunks.extend(stats.chunks)
+        if len(self.chunks) > 8 * self.num_chunks:
+            # Keep a bounded number, coarser but still finer than the final ones
+            self.chunks = self.merge_chunks(4 * self.num_chunks)
+
+    def merge_chunks(self, num_chunks: int) -> list[ChunkStats]:
+        """Merge the chunks in time order into about num_chunks with the same number of rows."""
+        chunks = sorted(self.chunks, key=lambda chunk: chunk.start)
+        chunk_size = sum(chunk.rows for chunk in chunks) / num_chunks
+
+        merged = []
+        pending = []
+        rows = 0
+        for chunk in chunks:
+            pending.append(chunk)
+            rows += chunk.rows
+            if rows >= (len(merged) + 1) * chunk_size:
+                merged.append(_merge_chunks(pending))
+                pending = []
+        if pending:
+            merged.append(_merge_chunks(pending))
+        return merged
+
+    def build(self) -> DatasetStats:
+        return DatasetStats(
+            rows=self.rows,
+            start=self.start,
+            end=self.end,
+            columns=self.columns,
+            chunks=self.merge_chunks(self.num_chunks),
+        )
@@ -0,0 +1,144 @@
+import io
+import time
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from tsapi.constants import ROW_GROUP_SIZE
+from tsapi.model.compaction import CompactionReport
+
+# Columns with fewer distinct values than this fraction of rows are stored as categoricals
+CATEGORICAL_RATIO = 0.5
+
+INT_TYPES = [pl.Int8, pl.Int16, pl.Int32, pl.Int64]
+UINT_TYPES = [pl.UInt8, pl.UInt16, pl.UInt32, pl.UInt64]
+
+
+def downcast_int(s: pl.Series) -> pl.DataType:
+    """The smallest integer type of the same signedness that holds every value."""
+    if s.null_count() == len(s):
+        return s.dtype
+
+    types = UINT_TYPES if s.dtype in UINT_TYPES else INT_TYPES
+    for dtype in types[:types.index(s.dtype)]:
+        # Values that don't fit become null
+        if s.cast(dtype, strict=False).null_count() == s.null_count():
+            return dtype
+    return s.dtype
+
+
+def downcast_float(s: pl.Series, allow_float32: bool = False) -> pl.DataType:
+    """
+    Float32 if every value survives the round trip, or if the precision loss
+    has been allowed.
+    """
+    if s.dtype != pl.Float64:
+        return s.dtype
+    if allow_float32:
+        return pl.Float32
+
+    # NaN != NaN, so compare the finite values and the positions of the rest
+    roundtrip = s.cast(pl.Float32).cast(pl.Float64)
+    same = (roundtrip == s) | (s.is_nan() & roundtrip.is_nan())
+    return pl.Float32 if same.fill_null(True).all() else s.dtype
+
+
+def compact_frame(
+        df: pl.DataFrame, tscol: str, other_cols: list[str], allow_float32: bool = False
+) -> tuple[pl.DataFrame, dict[str, str]]:
+    """
+    Downcast numeric columns, store low-cardinality other columns as
+    categoricals and sort by timestamp.
+
+    :return: The compacted frame and the new type of each column that changed
+    """
+    casts = {}
+    for col, dtype in df.schema.items():
+        s = df[col]
+        if dtype.is_integer():
+            new_dtype = downcast_int(s)
+        elif dtype.is_float():
+            new_dtype = downcast_float(s, allow_float32)
+        elif col in other_cols and dtype == pl.String and s.n_unique() < CATEGORICAL_RATIO * max(len(s), 1):
+            new_dtype = pl.Categorical
+        else:
+            continue
+
+        if new_dtype != dtype:
+            casts[col] = new_dtype
+
+    df = df.cast(casts)
+    if not df[tscol].is_sorted():
+        # Stable, so rows with the same timestamp (e.g. groups) keep their order
+        df = df.sort(tscol, maintain_order=True)
+
+    return df, {col: str(dtype) for col, dtype in casts.items()}
+
+
+def column_encoding(dtype: pl.DataType) -> str | None:
+    """
+    The parquet encoding for a column type, or None for a dictionary.
+    """
+    if dtype == pl.Categorical:
+        return None
+    if dtype.is_temporal() or dtype.is_integer():
+        # Timestamps are sorted and evenly spaced, so the deltas pack into a few bits
+        return 'DELTA_BINARY_PACKED'
+    if dtype == pl.Float32:
+        # Splitting the bytes into streams lets zstd find the shared exponents
+        return 'BYTE_STREAM_SPLIT'
+    if dtype == pl.String:
+        return 'DELTA_BYTE_ARRAY'
+    return 'PLAIN'
+
+
+def compacted_parquet(df: pl.DataFrame) -> bytes:
+    """
+    Write with encodings chosen per column type.  Row groups are the unit
+    fetched from storage, and their min/max statistics let readers skip them
+    when filtering on time.
+    """
+    encodings = {col: column_encoding(dtype) for col, dtype in df.schema.items()}
+
+    buffer = io.BytesIO()
+    pq.write_table(
+        df.to_arrow(), buffer,
+        row_group_size=ROW_GROUP_SIZE,
+        compression='zstd',
+        compression_level=3,
+        use_dictionary=[col for col, encoding in encodings.items() if encoding is None],
+        column_encoding={col: encoding for col, encoding in encodings.items() if encoding is not None},
+        write_statistics=True,
+    )
+    return buffer.getvalue()
+
+
+def load_seconds(data: bytes) -> float:
+    start = time.perf_counter()
+    pl.read_parquet(io.BytesIO(data))
+    return time.perf_counter() - start
+
+
+def compact_dataset(
+        df: pl.DataFrame, tscol: str, other_cols: list[str], allow_float32: bool = False
+) -> tuple[pl.DataFrame, bytes, CompactionReport]:
+    """
+    Compact a dataset and write it with the tuned parquet encodings, measuring
+    the size and load time against the uncompacted file.
+    """
+    buffer = io.BytesIO()
+    df.write_parquet(buffer, row_group_size=ROW_GROUP_SIZE)
+    original = buffer.getvalue()
+
+    compacted_df, dtypes = compact_frame(df, tscol, other_cols, allow_float32)
+    compacted = compacted_parquet(compacted_df)
+
+    report = CompactionReport(
+        original_bytes=len(original),
+        compacted_bytes=len(compacted),
+        original_load_seconds=load_seconds(original),
+        compacted_load_seconds=load_seconds(compacted),
+        dtypes=dtypes,
+        sorted=not df[tscol].is_sorted(),
+    )
+    return compacted_df, compacted, report
@@ -0,0 +1,217 @@
+import asyncio
+import gzip
+import importlib.util
+import zlib
+from collections import OrderedDict
+from functools import cache
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# brotli and zstd are optional (pip install tsapi[compression]), gzip is always available.
+# They are only imported when a response is first compressed with them.
+CODEC_MODULES = {'zstd': 'zstandard', 'br': 'brotli'}
+
+MIN_COMPRESS_SIZE = 1024  # Smaller bodies aren't worth the CPU or the extra headers
+# Larger bodies are compressed on a thread, so they don't hold up the event loop
+THREAD_COMPRESS_SIZE = 256 * 1024
+
+# Streamed responses are passed through, but these are never worth buffering
+UNCOMPRESSED_TYPES = ('text/event-stream', 'application/vnd.apache.arrow')
+
+
+def available_encodings() -> list[str]:
+    """Supported encodings, in order of preference."""
+    encodings = [
+        encoding for encoding, module in CODEC_MODULES.items() if importlib.util.find_spec(module) is not None
+    ]
+    encodings.append('gzip')
+    return encodings
+
+
+@cache
+def codec(encoding: str):
+    """The module of an optional encoding, imported on first use."""
+    return importlib.import_module(CODEC_MODULES[encoding])
+
+
+def negotiate_encoding(accept_encoding: str, encodings: list[str]) -> str | None:
+    """
+    Pick the encoding with the highest quality value in Accept-Encoding, breaking
+    ties with the server preference order of encodings.
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[name] = q
+
+    candidates = [
+        (qualities.get(encoding, qualities.get('*', 0.0)), -i, encoding)
+        for i, encoding in enumerate(encodings)
+    ]
+    q, _, encoding = max(candidates)
+
+    return encoding if q > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    # Moderate levels: these responses are compressed on the request path
+    if encoding == 'zstd':
+        return codec('zstd').ZstdCompressor(level=3).compress(body)
+    if encoding == 'br':
+        return codec('br').compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class CompressedCache:
+    """
+    Compressed bodies keyed by ETag, encoding and a checksum of the body,
+    bounded by total size.  With the checksum an entry can't be served for
+    other contents under the same ETag, it just stops being requested.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key: tuple[str, str, int]) -> bytes | None:
+        body = self.entries.get(key)
+        if body is not None:
+            self.entries.move_to_end(key)
+        return body
+
+    def put(self, key: tuple[str, str, int], body: bytes):
+        if len(body) > self.max_bytes or key in self.entries:
+            return
+        self.entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class CompressionMiddleware:
+    """
+    Compress complete responses with gzip, brotli or zstd, according to
+    Accept-Encoding.  Streaming responses are passed through unchanged.  With
+    cache_bytes, compressed bodies of responses that have an ETag are kept so
+    hot responses aren't compressed again for each request.
+
+    Options that aren't given are read from the app settings
+    (app.state.settings) on the first request, since the settings are only
+    loaded at startup.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = None, cache_bytes: int = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache_bytes = cache_bytes
+        self.cache = None
+        self.configured = False
+        self.encodings = available_encodings()
+
+    def configure(self, scope: Scope):
+        settings = getattr(scope['app'].state, 'settings', None) if 'app' in scope else None
+
+        if self.minimum_size is None:
+            self.minimum_size = getattr(settings, 'compression_min_size', MIN_COMPRESS_SIZE)
+        if self.cache_bytes is None:
+            self.cache_bytes = getattr(settings, 'compression_cache_mb', 0) * 1024 * 1024
+        if self.cache_bytes > 0:
+            self.cache = CompressedCache(self.cache_bytes)
+
+        self.configured = True
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        if not self.configured:
+            self.configure(scope)
+
+        encoding = negotiate_encoding(Headers(scope=scope).get('accept-encoding', ''), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(send, encoding, self.minimum_size, self.cache)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int, cache: CompressedCache | None):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.cache = cache
+        self.start_message = None
+        self.passthrough = False
+
+    async def send(self, message: Message):
+        if message['type'] == 'http.response.start':
+            # Hold the start until we know whether the body will be compressed
+            self.start_message = message
+            return
+
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self._send(message)
+            return
+
+        if self.start_message is None:
+            # Already started, e.g. a second body message after passing through
+            await self._send(message)
+            return
+
+        headers = MutableHeaders(raw=self.start_message['headers'])
+        body = message.get('body', b'')
+
+        if (
+            message.get('more_body', False)
+            or 'content-encoding' in headers
+            or headers.get('content-type', '').startswith(UNCOMPRESSED_TYPES)
+            or len(body) < self.minimum_size
+        ):
+            self.passthrough = True
+            await self._send(self.start_message)
+            self.start_message = None
+            await self._send(message)
+            return
+
+        etag = headers.get('etag')
+        cache_key = None
+        if self.cache is not None and etag and self.start_message['status'] == 200:
+            # crc32 is much cheaper than compressing, and guards against an ETag that missed a change
+            cache_key = (etag.removeprefix('W/'), self.encoding, zlib.crc32(body))
+
+        compressed = self.cache.get(cache_key) if cache_key is not None else None
+        if compressed is None:
+            if len(body) >= THREAD_COMPRESS_SIZE:
+                compressed = await asyncio.to_thread(compress, body, self.encoding)
+            else:
+                compressed = compress(body, self.encoding)
+            if cache_key is not None:
+                self.cache.put(cache_key, compressed)
+
+        headers['Content-Encoding'] = self.encoding
+        headers['Content-Length'] = str(len(compressed))
+        headers.add_vary_header('Accept-Encoding')
+        if etag and not etag.startswith('W/'):
+            # The compressed body isn't byte-identical, so the validator becomes weak
+            headers['ETag'] = f'W/{etag}'
+
+        await self._send(self.start_message)
+        self.start_message = None
+        await self._send({'type': 'http.response.body', 'body': compressed})
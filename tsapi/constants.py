@@ -1 +1,5 @@
 MAX_POINTS = 10000  # TODO: make this a setting
+NUM_STATS_CHUNKS = 100  # Number of time-ordered chunks summarized for zoom previews
+MAX_CACHED_MODELS = 64  # Fitted forecast models kept by each worker process
+ROW_GROUP_SIZE = 50000  # Rows per parquet row group, the unit fetched from storage and cached
+CACHE_TTL_SECONDS = 7 * 24 * 3600  # Cache keys are versioned, so this only bounds memory use
@@ -0,0 +1,435 @@
+import csv
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Collection, Iterator, NamedTuple
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from tsapi.column_stats import StatsBuilder, dataset_stats, split_columns
+from tsapi.constants import ROW_GROUP_SIZE
+from tsapi.errors import TsApiDataError, TsApiNoTimestampError
+from tsapi.model.stats import DatasetStats
+
+SAMPLE_BYTES = 1024 * 1024  # The head of the file used to infer the schema
+CHUNK_BYTES = 32 * 1024 * 1024  # Parsed by one worker thread at a time
+HEAD_ROWS = 200_000  # Rows kept to detect the conditions and periods of the dataset
+
+# Tried in order, the first that parses every sampled value is used.  %#z
+# takes Z as well as offsets like +00:00, and the values are converted to UTC.
+DATETIME_FORMATS = [
+    '%Y-%m-%dT%H:%M:%S%.f',
+    '%Y-%m-%d %H:%M:%S%.f',
+    '%Y-%m-%dT%H:%M:%S%.f%#z',
+    '%Y-%m-%d %H:%M:%S%.f%#z',
+    '%Y-%m-%dT%H:%M',
+    '%Y-%m-%d %H:%M',
+    '%Y/%m/%d %H:%M:%S',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d.%m.%Y %H:%M:%S',
+]
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%m/%d/%Y', '%d/%m/%Y', '%d.%m.%Y']
+
+# Sampled values that may fail to parse as a type, for the column to still be inferred as it
+BAD_SAMPLE_FRACTION = 0.01
+
+ERROR_COL = 'error'
+
+
+class CsvSchema(NamedTuple):
+    columns: list[str]
+    dtypes: dict[str, pl.DataType]
+    # strptime format of each Date or Datetime column, None if Polars infers it
+    formats: dict[str, str | None]
+
+
+class CsvImport(NamedTuple):
+    # The first HEAD_ROWS valid rows
+    head: pl.DataFrame
+    # Of all the valid rows
+    stats: DatasetStats
+    # The malformed rows as CSV, with the reason in ERROR_COL, or None
+    rejected: bytes | None
+    rows: int
+    rejected_rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return (self.rows + self.rejected_rows) / self.seconds if self.seconds > 0 else 0.0
+
+
+def column_names(header: list[str]) -> list[str]:
+    # Blank columns are renamed as in rename_blank_columns
+    names = []
+    iblank = 0
+    for col in header:
+        if col.strip() == '':
+            col = f'Unk:{iblank}'
+            iblank += 1
+        names.append(col)
+    return names
+
+
+class WidenColumns(Exception):
+    """
+    Raised when a chunk has fractions in columns the sample had as integers.
+    The import has to start again with them as Float64.
+    """
+    def __init__(self, columns: list[str]):
+        super().__init__(f"Columns with fractions: {', '.join(columns)}")
+        self.columns = columns
+
+
+def _parses(parsed: pl.Series) -> bool:
+    # One bad value in a small sample shouldn't decide the type either
+    bad = parsed.null_count()
+    return bad <= max(1, BAD_SAMPLE_FRACTION * len(parsed)) and bad < len(parsed) / 2
+
+
+def infer_format(values: pl.Series, formats: list[str], to_date: bool) -> str | None:
+    """
+    The format that parses the most values, if it parses nearly all of them.
+    """
+    best = None
+    best_nulls = None
+    for fmt in formats:
+        parsed = values.str.to_date(fmt, strict=False) if to_date else values.str.to_datetime(fmt, strict=False)
+        if best_nulls is None or parsed.null_count() < best_nulls:
+            best, best_nulls = fmt, parsed.null_count()
+            if best_nulls == 0:
+                break
+
+    return best if best_nulls is not None and best_nulls <= BAD_SAMPLE_FRACTION * len(values) else None
+
+
+def infer_datetime(values: pl.Series) -> pl.Series | None:
+    """Parse timestamps in a format Polars infers from the first of them, None if it can't."""
+    try:
+        return values.str.strip_chars().str.to_datetime(time_unit='us', strict=False)
+    except pl.exceptions.ComputeError:
+        return None
+
+
+def datetime_dtype(fmt: str) -> pl.Datetime:
+    return pl.Datetime('us', 'UTC') if fmt.endswith('z') else pl.Datetime('us')
+
+
+def infer_schema(sample: pl.DataFrame, float_columns: Collection[str] = ()) -> CsvSchema:
+    """
+    Infer the column types from a sample read as strings.  Numeric columns
+    are Int64 if every sampled value is an integer and Float64 otherwise, or
+    if they are in float_columns, and
+    timestamp columns get the strptime format that parses the sample, or
+    failing that are left to Polars' own inference.  A few malformed values
+    don't change the type, their rows are rejected later.
+    """
+    dtypes = {}
+    formats = {}
+    for col in sample.columns:
+        values = sample[col].str.strip_chars()
+        values = values.filter(values.str.len_chars() > 0)
+
+        dtypes[col] = pl.String
+        if len(values) == 0:
+            continue
+
+        floats = values.cast(pl.Float64, strict=False)
+        if _parses(floats):
+            # Only as wide as the values need, so integer ids keep their precision
+            integers = values.cast(pl.Int64, strict=False)
+            is_int = col not in float_columns and integers.null_count() == floats.null_count()
+            dtypes[col] = pl.Int64 if is_int else pl.Float64
+        elif (fmt := infer_format(values, DATETIME_FORMATS, to_date=False)) is not None:
+            dtypes[col] = datetime_dtype(fmt)
+            formats[col] = fmt
+        elif (fmt := infer_format(values, DATE_FORMATS, to_date=True)) is not None:
+            dtypes[col] = pl.Date
+            formats[col] = fmt
+        elif (inferred := infer_datetime(values)) is not None and _parses(inferred):
+            dtypes[col] = inferred.dtype
+            formats[col] = None
+
+    return CsvSchema(columns=list(sample.columns), dtypes=dtypes, formats=formats)
+
+
+def sample_schema(data: bytes, sample_bytes: int = SAMPLE_BYTES, float_columns: Collection[str] = ()) -> CsvSchema:
+    """
+    Infer the schema from the head of a CSV file, once, rather than from every batch.
+    """
+    sample = data[:sample_bytes]
+    if len(data) > sample_bytes:
+        # Only complete records
+        sample = sample[:max(last_record_end(sample, 0, len(sample)), 0)]
+
+    # Malformed rows are rejected later, they shouldn't stop the inference
+    df = pl.read_csv(io.BytesIO(sample), has_header=True, infer_schema=False, truncate_ragged_lines=True)
+    df.columns = column_names(df.columns)
+    return infer_schema(df, float_columns)
+
+
+def first_record_end(data: bytes) -> int:
+    """The position after the first record of data (the header), or -1 if it isn't complete."""
+    quotes = 0
+    pos = 0
+    while (newline := data.find(b'\n', pos)) != -1:
+        quotes += data.count(b'"', pos, newline)
+        if quotes % 2 == 0:
+            return newline + 1
+        pos = newline + 1
+    return -1
+
+
+def last_record_end(data: bytes, start: int, end: int) -> int:
+    """
+    The position after the last line break in data[start:end] that is outside
+    quotes, so ends a record, or -1 if there is none.  A record starts at start.
+    """
+    # Escaped quotes are doubled, so a line break is quoted if an odd number of quotes precede it
+    quotes = data.count(b'"', start, end)
+    pos = end
+    while (newline := data.rfind(b'\n', start, pos)) != -1:
+        quotes -= data.count(b'"', newline, pos)
+        if quotes % 2 == 0:
+            return newline + 1
+        pos = newline
+    return -1
+
+
+def read_chunks(source: BinaryIO, chunk_bytes: int = CHUNK_BYTES, head: bytes = b'') -> Iterator[memoryview]:
+    """
+    Read the records after the header in chunks of about chunk_bytes, so
+    that the file is never in memory whole.  Quoted values can have line
+    breaks in them.  head is what has already been read from source.
+    """
+    buffer = head
+    in_header = True
+    eof = False
+    while not eof:
+        data = source.read(chunk_bytes)
+        eof = not data
+        buffer = buffer + data if buffer else data
+        if in_header:
+            end = first_record_end(buffer)
+            if end == -1:
+                if eof:
+                    # Only a header
+                    return
+                continue
+            buffer = buffer[end:]
+            in_header = False
+
+        start = 0
+        while len(buffer) - start >= chunk_bytes:
+            end = last_record_end(buffer, start, start + chunk_bytes)
+            if end == -1:
+                # A record longer than a chunk, if it is complete
+                end = last_record_end(buffer, start, len(buffer))
+                if end == -1:
+                    break
+            yield memoryview(buffer)[start:end]
+            start = end
+        buffer = buffer[start:]
+
+    # The last record may not end with a line break
+    if buffer:
+        yield memoryview(buffer)
+
+
+def _parse_lines(chunk: bytes, columns: list[str]) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Slow path for a chunk that has lines with too many fields.
+    """
+    good = []
+    ragged = []
+    for fields in csv.reader(io.StringIO(chunk.decode('utf-8', errors='replace'))):
+        if len(fields) == 0:
+            continue
+        if len(fields) > len(columns):
+            ragged.append(fields[:len(columns)] + [f'expected {len(columns)} fields, found {len(fields)}'])
+        else:
+            good.append(fields + [None] * (len(columns) - len(fields)))
+
+    schema = {col: pl.String for col in columns}
+    raw = pl.DataFrame(good, schema=schema, orient='row').with_columns(
+        # As read_csv, empty fields are null
+        pl.when(pl.col(col) != '').then(pl.col(col)).alias(col) for col in columns
+    )
+    rejected = pl.DataFrame(ragged, schema=schema | {ERROR_COL: pl.String}, orient='row')
+    return raw, rejected
+
+
+def read_schema(schema: CsvSchema) -> dict[str, pl.DataType]:
+    # Timestamps are read as strings and parsed with their format afterwards
+    return {col: pl.String if col in schema.formats else dtype for col, dtype in schema.dtypes.items()}
+
+
+def convert_chunk(raw: pl.DataFrame, schema: CsvSchema) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Convert a chunk to the schema types.  Rows with a value that doesn't
+    convert are returned separately, as strings.
+
+    :raises WidenColumns: If an integer column has fractions in this chunk
+    """
+    exprs = []
+    failed = []
+    inferred = []
+    widen = []
+    for col in schema.columns:
+        dtype = schema.dtypes[col]
+        if raw.schema[col] == dtype:
+            exprs.append(pl.col(col))
+            continue
+
+        if dtype == pl.Int64:
+            values = raw[col].str.strip_chars()
+            integers = values.cast(pl.Int64, strict=False)
+            if (integers.is_null() & values.cast(pl.Float64, strict=False).is_not_null()).any():
+                widen.append(col)
+                continue
+
+        value = pl.col(col).str.strip_chars()
+        if dtype == pl.Date:
+            converted = value.str.to_date(schema.formats[col], strict=False)
+        elif col in schema.formats and schema.formats[col] is None:
+            # The format is inferred again for each chunk, if it can't be none of the chunk converts
+            parsed = infer_datetime(raw[col])
+            parsed = pl.Series([None] * len(raw), dtype=dtype) if parsed is None else parsed.cast(dtype)
+            inferred.append(parsed.alias(f'{col}:parsed'))
+            converted = pl.col(f'{col}:parsed')
+        elif col in schema.formats:
+            converted = value.str.to_datetime(schema.formats[col], time_unit='us', strict=False).cast(dtype)
+        else:
+            converted = value.cast(dtype, strict=False)
+        exprs.append(converted.alias(col))
+        failed.append(pl.when(converted.is_null() & (value.str.len_chars() > 0)).then(pl.lit(f'invalid {col}')))
+
+    if len(widen) > 0:
+        raise WidenColumns(widen)
+
+    if len(failed) == 0:
+        return raw, raw.clear().with_columns(pl.lit(None, pl.String).alias(ERROR_COL))
+
+    checked = raw.with_columns(*inferred).with_columns(pl.coalesce(failed).alias(ERROR_COL))
+    rejected = checked.filter(pl.col(ERROR_COL).is_not_null()).select(
+        pl.col(*schema.columns, ERROR_COL).cast(pl.String)
+    )
+    good = checked.filter(pl.col(ERROR_COL).is_null()).select(exprs)
+    return good, rejected
+
+
+def _read_chunk(chunk: memoryview, columns: list[str], dtypes: dict[str, pl.DataType]) -> pl.DataFrame:
+    return pl.read_csv(io.BytesIO(chunk), has_header=False, new_columns=columns, schema=dtypes)
+
+
+def parse_chunk(chunk: memoryview, schema: CsvSchema) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Parse a chunk with the numeric columns typed, which is the common case.
+    If that fails the chunk is read again as strings so the malformed rows
+    can be picked out.
+    """
+    ragged = None
+    try:
+        raw = _read_chunk(chunk, schema.columns, read_schema(schema))
+    except (pl.exceptions.ComputeError, pl.exceptions.SchemaError):
+        try:
+            raw = _read_chunk(chunk, schema.columns, {col: pl.String for col in schema.columns})
+        except (pl.exceptions.ComputeError, pl.exceptions.SchemaError):
+            # Lines with too many fields
+            raw, ragged = _parse_lines(bytes(chunk), schema.columns)
+
+    good, rejected = convert_chunk(raw, schema)
+    if ragged is not None and len(ragged) > 0:
+        rejected = pl.concat([rejected, ragged])
+    return good, rejected
+
+
+def _parse_with_stats(chunk: memoryview, schema: CsvSchema, tscol: str, series_cols: list[str]):
+    good, rejected = parse_chunk(chunk, schema)
+    return good, rejected, dataset_stats(good, tscol, series_cols)
+
+
+def _parse_in_order(chunks: Iterator[memoryview], max_workers: int, *args):
+    # Only a few chunks are in flight, so memory use is a few chunks per worker, whatever the file size
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = []
+        for chunk in chunks:
+            pending.append(executor.submit(_parse_with_stats, chunk, *args))
+            if len(pending) > 2 * max_workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def import_csv(
+        source: BinaryIO, sink: BinaryIO, chunk_bytes: int = CHUNK_BYTES, max_workers: int = None,
+        float_columns: Collection[str] = ()
+) -> CsvImport:
+    """
+    Convert a CSV file to parquet, streaming it from source to sink.  The
+    schema and timestamp formats are inferred from the head of the file,
+    then chunks of rows are parsed in parallel threads and written as parquet
+    row groups in file order, with the dataset statistics built as they go.
+    Malformed rows (values that don't match the inferred types, or too many
+    fields) are collected rather than failing the import.  float_columns are
+    Float64 even if the sample only has integers in them.
+
+    :raises WidenColumns: If a column sampled as integers has fractions later on
+    :raises TsApiNoTimestampError: If no column of the sample is a timestamp
+    :raises TsApiDataError: If there are no valid rows
+    """
+    start = time.perf_counter()
+    max_workers = max_workers or os.cpu_count() or 1
+
+    # One more byte tells sample_schema whether there is more to the file
+    head = source.read(SAMPLE_BYTES + 1)
+    schema = sample_schema(head, float_columns=float_columns)
+    arrow_schema = pl.DataFrame(schema=schema.dtypes).to_arrow().schema
+
+    series_cols, times, _ = split_columns(pl.Schema(schema.dtypes))
+    if len(times) == 0:
+        raise TsApiNoTimestampError("No timestamp columns found")
+    stats = StatsBuilder(times[0], series_cols)
+
+    head_frames = []
+    head_rows = 0
+    rejected_frames = []
+    rows = 0
+    # Dictionary encoding only pays off for the string columns, on floats it is slow and larger
+    string_cols = [col for col, dtype in schema.dtypes.items() if dtype == pl.String]
+    chunks = read_chunks(source, chunk_bytes, head)
+    with pq.ParquetWriter(sink, arrow_schema, compression='zstd', use_dictionary=string_cols) as writer:
+        for good, rejected, chunk_stats in _parse_in_order(chunks, max_workers, schema, times[0], series_cols):
+            if len(good) > 0:
+                writer.write_table(good.to_arrow().cast(arrow_schema), row_group_size=ROW_GROUP_SIZE)
+                stats.merge(chunk_stats)
+                rows += len(good)
+                if head_rows < HEAD_ROWS:
+                    head_frames.append(good.head(HEAD_ROWS - head_rows))
+                    head_rows += len(head_frames[-1])
+            if len(rejected) > 0:
+                rejected_frames.append(rejected)
+
+    if rows == 0:
+        raise TsApiDataError("No valid rows in CSV file")
+
+    rejected_csv = None
+    rejected_rows = sum(len(df) for df in rejected_frames)
+    if rejected_rows > 0:
+        buffer = io.BytesIO()
+        pl.concat(rejected_frames).write_csv(buffer)
+        rejected_csv = buffer.getvalue()
+
+    return CsvImport(
+        head=pl.concat(head_frames),
+        stats=stats.build(),
+        rejected=rejected_csv,
+        rows=rows,
+        rejected_rows=rejected_rows,
+        seconds=time.perf_counter() - start,
+    )
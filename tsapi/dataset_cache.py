@@ -1,23 +1,89 @@
+import asyncio
+import hashlib
 import io
+from typing import TYPE_CHECKING
 
-import redis.asyncio as redis
 import polars as pl
 
+from tsapi.constants import CACHE_TTL_SECONDS
+from tsapi.dataset_storage import get_storage
 from tsapi.model.dataset import DataSet, OperationSet
+from tsapi.operations import apply_operations
+
+if TYPE_CHECKING:
+    import redis.asyncio as redis
+
+CACHE_PREFIX = 'tsapi:frame'
+
+
+def digest(*parts) -> str:
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+
+def dataset_key(dataset: DataSet, content_version: str) -> str:
+    """
+    The key prefix for frames of a dataset.  It changes with the dataset
+    version and with the contents of its file (e.g. a re-upload under the
+    same name), so cached frames never have to be invalidated in place.
+    """
+    return f'{CACHE_PREFIX}:{dataset.id}:{digest(dataset.version, content_version)}'
+
+
+def opset_digest(opset: OperationSet) -> str:
+    """
+    A digest of the opset parameters that determine its frame.  Opsets with
+    the same parameters share cached frames.
+    """
+    if not opset.operations:
+        return digest(opset.offset, opset.limit)
+
+    operations = [op.model_dump_json() for op in opset.operations]
+    return digest(opset.offset, opset.limit, operations, opset.series_ids, opset.group_by)
+
+
+def opset_key(dataset_prefix: str, opset: OperationSet) -> str:
+    return f'{dataset_prefix}:{opset_digest(opset)}'
+
+
+def group_key(opset_prefix: str, group: str) -> str:
+    return f'{opset_prefix}:{digest(group)}'
+
+
+def parse_key(key: str) -> tuple[str, str, str | None]:
+    """
+    :return: The dataset id, dataset key and opset digest (if any) of a cache key
+    """
+    parts = key[len(CACHE_PREFIX) + 1:].split(':')
+    dataset_id, dataset_digest = parts[:2]
+    return dataset_id, f'{CACHE_PREFIX}:{dataset_id}:{dataset_digest}', parts[2] if len(parts) > 2 else None
 
 
 class DatasetCache:
 
     def __init__(self, dataset: DataSet, settings, logger):
+        # Imported on first use, it is slow to import
+        import redis.asyncio as redis
+
         # TODO: pool?
         self.client = redis.Redis(host=settings.redis_host, port=6379, db=0)
         self.logger = logger
         self.settings = settings
+        self.storage = get_storage(settings)
         self.dataset = dataset
+        self._dataset_key = None
+
+    async def dataset_key(self) -> str:
+        if self._dataset_key is None:
+            info = await asyncio.to_thread(self.storage.store.stat, self.dataset.file_name)
+            self._dataset_key = dataset_key(self.dataset, info.version)
+        return self._dataset_key
+
+    async def opset_key(self, opset: OperationSet) -> str:
+        return opset_key(await self.dataset_key(), opset)
 
     async def get_cached_dataset(self, dataset_key) -> pl.DataFrame:
         """
-        Retrieve a cached dataset by its ID or an opset ID.
+        Retrieve a cached frame by its key.
         """
         try:
             cached_data = await self.client.get(dataset_key)
@@ -33,54 +99,103 @@ class DatasetCache:
 
     async def cache_dataset(self, dataset_key: str, dataframe: pl.DataFrame):
         """
-        Cache a dataset by its ID or and opset ID.
+        Cache a frame by its key.  The keys are versioned, so an entry is never
+        stale and only expires to free memory.
         """
         try:
             datasetio = io.BytesIO()
             dataframe.write_ipc(datasetio, compression='zstd')
-            # Cache with an expiration time of 1 hour
-            await self.client.set(dataset_key, datasetio.getvalue(), ex=3600)
+            # A view rather than a copy of the buffer
+            data = datasetio.getbuffer()
+            with self.storage.memory.track(data.nbytes):
+                await self.client.set(dataset_key, data, ex=CACHE_TTL_SECONDS)
         except Exception as e:
             self.logger.error(f"Error caching dataset: {e}")
 
     async def get_operation_set(self, opset: OperationSet) -> pl.DataFrame:
         """
-        Retrieve a dataset by its ID or opset ID.
+        Retrieve the frame of an opset, from the cache or from storage.
+
+        :raises TsApiMemoryBudgetError: If a load doesn't fit in the memory budget in time
         """
-        dataset_df = await self.get_cached_dataset(opset.id)
+        key = await self.opset_key(opset)
+        dataset_df = await self.get_cached_dataset(key)
 
         if dataset_df is None:
-            dataset_df = await self.get_cached_dataset(self.dataset.id)
-            if dataset_df is None:
-                # Load the dataset from the source
-                self.logger.info("Loading dataset from source")
-                dataset_df = await self.dataset.load_async(self.settings.data_dir)
-                self.logger.info('Loaded dataframe', rows=len(dataset_df))
-                await self.cache_dataset(opset.dataset_id, dataset_df)
-
-            dataset_df = dataset_df.slice(opset.offset, opset.limit)
-            self.logger.info("Sliced dataframe", rows=len(dataset_df))
-            await self.cache_dataset(opset.id, dataset_df)
+            estimate = await asyncio.to_thread(
+                self.storage.estimate_size, self.dataset.file_name, opset.offset, opset.limit
+            )
+            # The frames are held against the memory budget until they're cached
+            async with self.storage.memory.reserve(estimate) as reservation:
+                # Only the row groups covering the opset window are read from storage
+                self.logger.info("Loading dataset from source", estimated_bytes=estimate)
+                dataset_df = await self.dataset.load_async(self.storage, opset.offset, opset.limit)
+                loaded_bytes = dataset_df.estimated_size()
+                reservation.resize(loaded_bytes)
+                self.logger.info('Loaded dataframe', rows=len(dataset_df), bytes=loaded_bytes)
+                if opset.operations:
+                    dataset_df = apply_operations(
+                        dataset_df, opset.operations, self.dataset.tscol, opset.series_ids, opset.group_by
+                    )
+                    reservation.resize(loaded_bytes + dataset_df.estimated_size())
+                    self.logger.info("Applied operations", rows=len(dataset_df), operations=len(opset.operations))
+                await self.cache_dataset(key, dataset_df)
         else:
             self.logger.info("Using cached dataset", rows=len(dataset_df))
 
         return dataset_df
 
-    async def update_operation_set(self, new_opset: OperationSet, opset: OperationSet) -> pl.DataFrame:
+    async def get_operation_set_group(self, opset: OperationSet, group: str) -> pl.DataFrame:
+        """
+        Retrieve the data for a single group of a grouped opset.  Each group is
+        cached separately so that clients can page through the groups without
+        transferring the whole opset from the cache each time.
         """
-        Update an existing operation set with new parameters.
+        key = group_key(await self.opset_key(opset), group)
+        group_df = await self.get_cached_dataset(key)
+
+        if group_df is None:
+            dataset_df = await self.get_operation_set(opset)
+            group_df = dataset_df.filter(pl.col(opset.group_by).cast(pl.String) == group)
+            self.logger.info("Filtered group", group=group, rows=len(group_df))
+            await self.cache_dataset(key, group_df)
+        else:
+            self.logger.info("Using cached group", group=group, rows=len(group_df))
+
+        return group_df
+
+    async def update_operation_set(self, new_opset: OperationSet, opset: OperationSet):
         """
-        dataset_df = await self.get_cached_dataset(opset.id)
-
-        if dataset_df is not None:
-            try:
-                sub_offset, sub_limit = self.get_new_slice(opset.offset, opset.limit, new_opset.offset, new_opset.limit)
-                # Take a sub-slice so that we don't have to reload from cloud storage
-                new_df = dataset_df.slice(sub_offset, sub_limit)
-                await self.cache_dataset(opset.id, new_df)
-            except ValueError:
-                # Just remove anything from the cache for this opset and it'll get recached with the new parameters
-                await self.client.delete(opset.id)
+        Seed the cache for the new parameters of an opset from the frame of the
+        old ones, when it is a sub-slice of it.  The old entries are left for
+        other opsets with the same parameters, or for the sweeper.
+        """
+        if opset.operations or new_opset.operations:
+            # Derived series depend on the whole window, so they can't be sub-sliced
+            return
+
+        new_key = await self.opset_key(new_opset)
+        if new_key == await self.opset_key(opset):
+            return
+
+        dataset_df = await self.get_cached_dataset(await self.opset_key(opset))
+        if dataset_df is None:
+            return
+
+        try:
+            sub_offset, sub_limit = self.get_new_slice(opset.offset, opset.limit, new_opset.offset, new_opset.limit)
+        except ValueError:
+            # It'll get cached with the new parameters when it is next requested
+            return
+
+        # Take a sub-slice so that we don't have to reload from cloud storage
+        await self.cache_dataset(new_key, dataset_df.slice(sub_offset, sub_limit))
+
+    async def delete_dataset(self) -> int:
+        """
+        Delete every cached frame of the dataset, whatever its version.
+        """
+        return await delete_keys(self.client, f'{CACHE_PREFIX}:{self.dataset.id}:*')
 
     @staticmethod
     def get_new_slice(prior_offset: int, prior_limit: int, new_offset: int, new_limit: int) -> tuple[int, int]:
@@ -92,3 +207,16 @@ class DatasetCache:
             return relative_offset, new_limit
         else:
             raise ValueError("The new range is not a subset of the prior range")
+
+
+async def delete_keys(client: 'redis.Redis', pattern: str) -> int:
+    deleted = 0
+    batch = []
+    async for key in client.scan_iter(match=pattern, count=1000):
+        batch.append(key)
+        if len(batch) == 1000:
+            deleted += await client.unlink(*batch)
+            batch = []
+    if batch:
+        deleted += await client.unlink(*batch)
+    return deleted
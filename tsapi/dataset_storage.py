@@ -1,37 +1,206 @@
 import asyncio
-import functools
-import os
+import io
+import threading
+from collections import OrderedDict
 
 import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
 
+from tsapi.constants import ROW_GROUP_SIZE
+from tsapi.memory_budget import MemoryBudget
+from tsapi.object_store import GCSStore, LocalStore, ObjectInfo, ObjectStore
+from tsapi.row_group_cache import RowGroupCache
 
-async def load_async(file_path: str) -> pl.DataFrame:
-    """Reads a Parquet file asynchronously using Polars."""
-    loop = asyncio.get_running_loop()
-    # Run the blocking read_parquet in a separate thread
-    df = await loop.run_in_executor(None, pl.read_parquet, file_path)
-    return df
+MAX_CACHED_FOOTERS = 256
 
 
-async def load_csv_async(file_path: str) -> pl.DataFrame:
-    """Reads a CSV file asynchronously using Polars."""
-    loop = asyncio.get_running_loop()
-    # Run the blocking read_csv in a separate thread
-    kwargs = {
-        "has_header": True,
-        "try_parse_dates": True,
-    }
-    rd_csv = functools.partial(pl.read_csv, file_path, **kwargs)
-    df = await loop.run_in_executor(None, rd_csv)
-    return df
+class DatasetStorage:
+    """
+    Reads and writes dataset files in an object store.  Parquet files are read
+    with ranged reads: the footer first, then only the row groups covering the
+    requested rows, which are kept in the row group cache if there is one.
+    Local files are read by pyarrow directly, still only those row groups.
+    At most max_loads files are loaded asynchronously at a time, so a burst of
+    cold requests can't take every thread, and the frames loaded through
+    it are accounted against the memory budget of the worker.
+    """
+
+    def __init__(
+            self, store: ObjectStore, cache: RowGroupCache = None, max_loads: int = 4, memory: MemoryBudget = None
+    ):
+        self.store = store
+        self.cache = cache
+        self.loads = asyncio.Semaphore(max_loads)
+        self.loads_waiting = 0
+        self.memory = memory or MemoryBudget(0)
+        # Parsed footers by name, along with the version they were read from
+        self.footers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def metadata(self, name: str) -> tuple[ObjectInfo, pq.FileMetaData]:
+        info = self.store.stat(name)
+
+        with self._lock:
+            cached = self.footers.get(name)
+            if cached is not None and cached[0] == info:
+                self.footers.move_to_end(name)
+                return cached
+
+        path = self.store.local_path(name)
+        if path is not None:
+            metadata = pq.read_metadata(path)
+        else:
+            with self.store.open(name) as f:
+                metadata = pq.read_metadata(f)
+
+        with self._lock:
+            self.footers[name] = (info, metadata)
+            self.footers.move_to_end(name)
+            while len(self.footers) > MAX_CACHED_FOOTERS:
+                self.footers.popitem(last=False)
+
+        return info, metadata
+
+    def read_row_group(
+            self, name: str, info: ObjectInfo, metadata: pq.FileMetaData, row_group: int, columns: list[str] = None
+    ) -> pl.DataFrame:
+        key = RowGroupCache.key(name, info.version, row_group, columns)
+        if self.cache is not None:
+            df = self.cache.get(key)
+            if df is not None:
+                return df
+
+        with self.store.open(name) as f:
+            parquet_file = pq.ParquetFile(f, metadata=metadata, pre_buffer=True)
+            df = pl.from_arrow(parquet_file.read_row_group(row_group, columns=columns))
+
+        if self.cache is not None:
+            self.cache.put(key, df)
+        return df
+
+    def estimate_size(self, name: str, offset: int = 0, limit: int = None) -> int:
+        """
+        The approximate in-memory size of rows offset to offset + limit, from
+        the footer: fixed width columns by their type, the others by their
+        uncompressed size in the file.
+        """
+        _, metadata = self.metadata(name)
+        row_width = 0
+        variable = []
+        for i, field in enumerate(metadata.schema.to_arrow_schema()):
+            try:
+                row_width += field.type.bit_width // 8
+            except ValueError:
+                variable.append(i)
+
+        end = metadata.num_rows if limit is None else min(offset + limit, metadata.num_rows)
+        size = 0
+        row = 0
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            overlap = min(end, row + row_group.num_rows) - max(offset, row)
+            if overlap > 0:
+                variable_size = sum(row_group.column(col).total_uncompressed_size for col in variable)
+                size += overlap * row_width + variable_size * overlap // row_group.num_rows
+            row += row_group.num_rows
+        return size
 
+    def read_parquet(self, name: str, offset: int = 0, limit: int = None, columns: list[str] = None) -> pl.DataFrame:
+        """
+        Read rows offset to offset + limit (or the end) of a parquet file.
+        """
+        info, metadata = self.metadata(name)
 
-async def delete_dataset_from_storage(file_path: str, logger):
+        end = metadata.num_rows if limit is None else min(offset + limit, metadata.num_rows)
+        row_groups = []
+        first_row = None
+        row = 0
+        for i in range(metadata.num_row_groups):
+            num_rows = metadata.row_group(i).num_rows
+            if row < end and row + num_rows > offset:
+                if first_row is None:
+                    first_row = row
+                row_groups.append(i)
+            row += num_rows
+
+        if len(row_groups) == 0:
+            schema = metadata.schema.to_arrow_schema()
+            if columns is not None:
+                schema = pa.schema([schema.field(col) for col in columns])
+            return pl.from_arrow(schema.empty_table())
+
+        path = self.store.local_path(name)
+        if path is not None and self.cache is None:
+            # pyarrow reads local files itself, all the row groups in one go
+            parquet_file = pq.ParquetFile(path, metadata=metadata)
+            df = pl.from_arrow(parquet_file.read_row_groups(row_groups, columns=columns))
+        else:
+            frames = [self.read_row_group(name, info, metadata, i, columns) for i in row_groups]
+            df = pl.concat(frames) if len(frames) > 1 else frames[0]
+        return df.slice(offset - first_row, end - offset)
+
+    def write_parquet(self, name: str, df: pl.DataFrame):
+        buffer = io.BytesIO()
+        df.write_parquet(buffer, row_group_size=ROW_GROUP_SIZE)
+        self.store.write(name, buffer.getvalue())
+
+    async def load_async(
+            self, name: str, offset: int = 0, limit: int = None, columns: list[str] = None
+    ) -> pl.DataFrame:
+        """Reads a Parquet file asynchronously."""
+        self.loads_waiting += 1
+        try:
+            await self.loads.acquire()
+        finally:
+            self.loads_waiting -= 1
+        try:
+            # The ranged reads block, so run them in a separate thread
+            return await asyncio.to_thread(self.read_parquet, name, offset, limit, columns)
+        finally:
+            self.loads.release()
+
+    async def delete(self, name: str, logger):
+        """
+        Delete a dataset from storage
+        """
+        try:
+            await asyncio.to_thread(self.store.delete, name)
+            logger.info(f"File '{name}' deleted successfully.")
+        except FileNotFoundError:
+            logger.info(f"Error: File '{name}' not found.")
+
+
+_storages: dict[tuple, DatasetStorage] = {}
+
+
+def get_storage(settings) -> DatasetStorage:
     """
-    Delete a dataset from storage
+    The dataset storage for the settings.  It is created once per process, so
+    the parsed footers are reused across requests.
     """
-    try:
-        await asyncio.to_thread(os.remove, file_path)
-        logger.info(f"File '{file_path}' deleted successfully.")
-    except FileNotFoundError:
-        logger.info(f"Error: File '{file_path}' not found.")
+    key = (
+        settings.storage_backend, settings.data_dir, settings.gcs_bucket, settings.gcs_prefix,
+        settings.row_group_cache_dir, settings.row_group_cache_mb, settings.max_parquet_loads,
+        settings.memory_budget_mb, settings.memory_wait_seconds
+    )
+    storage = _storages.get(key)
+    if storage is None:
+        if settings.storage_backend == 'gcs':
+            store = GCSStore(settings.gcs_bucket, settings.gcs_prefix)
+        elif settings.storage_backend == 'local':
+            store = LocalStore(settings.data_dir)
+        else:
+            raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+
+        # Local files are already on disk, so only remote row groups are cached
+        cache = None
+        if settings.storage_backend != 'local' and settings.row_group_cache_mb > 0:
+            cache = RowGroupCache(settings.row_group_cache_dir, settings.row_group_cache_mb * 1024 * 1024)
+
+        storage = _storages[key] = DatasetStorage(
+            store, cache, settings.max_parquet_loads,
+            MemoryBudget(settings.memory_budget_mb * 1024 * 1024, settings.memory_wait_seconds)
+        )
+
+    return storage
@@ -13,3 +13,22 @@ class TsApiNoTimestampError(TsApiDataError):
     """Raised when there is no timestamp column in the data."""
     pass
 
+
+class TsApiOperationError(TsApiDataError):
+    """Raised when an opset operation can't be applied to the data."""
+    pass
+
+
+class TsApiForecastError(TsApiError):
+    """Raised when a forecast fails, e.g. a queued one on a forecast worker."""
+    pass
+
+
+class TsApiForecastTimeoutError(TsApiForecastError):
+    """Raised when a queued forecast isn't done within the timeout."""
+    pass
+
+
+class TsApiMemoryBudgetError(TsApiError):
+    """Raised when a frame doesn't fit in the worker's memory budget in time."""
+    pass
@@ -0,0 +1,270 @@
+"""
+An Arrow Flight service for bulk export of datasets and opsets, run as a
+process of its own (one per host, next to the API workers):
+
+    python -m tsapi.flight
+
+A client describes what it wants with a JSON command (see FlightRequest),
+gets the flight info and reads its endpoints in parallel.  Each endpoint is
+a contiguous range of row groups of the dataset file, streamed as record
+batches without going through JSON.
+
+    client = flight.connect('grpc://localhost:8815')
+    info = client.get_flight_info(flight.FlightDescriptor.for_command(json.dumps({'dataset': 'sales'})))
+    tables = [client.do_get(endpoint.ticket).read_all() for endpoint in info.endpoints]
+"""
+import asyncio
+import threading
+from datetime import datetime
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.flight as flight
+import structlog
+
+from tsapi.dataset_storage import DatasetStorage, get_storage
+from tsapi.model.dataset import DataSet, OperationSet
+from tsapi.model.flight import FlightRequest, FlightTicket
+from tsapi.mongo_client import MongoClient
+from tsapi.operations import apply_operations
+from tsapi.progressive import window_row_groups
+
+CHANGED = "The dataset has changed, get the flight info again"
+
+
+def parse_descriptor(descriptor: flight.FlightDescriptor) -> FlightRequest:
+    if descriptor.descriptor_type == flight.DescriptorType.PATH:
+        # A path is a dataset name
+        return FlightRequest(dataset='/'.join(p.decode() for p in descriptor.path))
+    try:
+        return FlightRequest.model_validate_json(descriptor.command)
+    except ValueError as e:
+        raise flight.FlightServerError(f"Invalid request: {e}")
+
+
+def split_row_groups(row_groups: list[int], num_streams: int) -> list[list[int]]:
+    """Split row groups into at most num_streams contiguous ranges of about the same size."""
+    num_streams = max(min(num_streams, len(row_groups)), 1)
+    size, extra = divmod(len(row_groups), num_streams)
+    ranges = []
+    start = 0
+    for i in range(num_streams):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(row_groups[start:end])
+        start = end
+    return ranges
+
+
+def in_time_range(statistics, start: datetime | None, end: datetime | None) -> bool:
+    """
+    Whether a row group might have timestamps in [start, end), going by its
+    statistics.  Without usable statistics it has to be read.
+    """
+    if statistics is None or not statistics.has_min_max:
+        return True
+    try:
+        return (start is None or statistics.max >= start) and (end is None or statistics.min < end)
+    except TypeError:
+        # e.g. a naive bound and a column with a time zone
+        return True
+
+
+def filter_time(df: pl.DataFrame, tscol: str, start: datetime | None, end: datetime | None) -> pl.DataFrame:
+    if start is not None:
+        df = df.filter(pl.col(tscol) >= start)
+    if end is not None:
+        df = df.filter(pl.col(tscol) < end)
+    return df
+
+
+def request_columns(request: FlightRequest, dataset: DataSet, opset: OperationSet | None) -> list[str] | None:
+    """The columns to send, None for all of them."""
+    if request.columns:
+        return request.columns
+    if opset is not None and opset.series_ids:
+        group_by = [opset.group_by] if opset.group_by else []
+        return list(dict.fromkeys([dataset.tscol, *opset.series_ids, *group_by]))
+    return None
+
+
+class FlightService(flight.FlightServerBase):
+    """
+    Serves the datasets of a catalog, which has resolve(request) returning
+    the dataset and opset (or None) of a request, raising KeyError if there
+    isn't one, and datasets() listing them.
+    """
+
+    def __init__(
+            self, location: str, storage: DatasetStorage, catalog, num_streams: int = 8,
+            endpoint_location: str = None, logger=None, **kwargs
+    ):
+        super().__init__(location, **kwargs)
+        self.storage = storage
+        self.catalog = catalog
+        self.num_streams = num_streams
+        # Without one, clients read the streams from the server they asked
+        self.endpoint_locations = [endpoint_location] if endpoint_location else []
+        self.logger = logger or structlog.get_logger()
+
+    def resolve(self, request: FlightRequest) -> tuple[DataSet, OperationSet | None]:
+        try:
+            return self.catalog.resolve(request)
+        except KeyError as e:
+            raise flight.FlightServerError(f"Not found: {e}")
+
+    def plan(self, request: FlightRequest) -> tuple[pa.Schema, list[FlightTicket], int]:
+        """
+        :return: The schema, the tickets of the streams, and the number of rows (-1 if unknown)
+        """
+        dataset, opset = self.resolve(request)
+        info, metadata = self.storage.metadata(dataset.file_name)
+        schema = metadata.schema.to_arrow_schema()
+
+        offset, limit = (opset.offset, opset.limit) if opset is not None else (0, metadata.num_rows)
+        ticket = FlightTicket(
+            request=request, name=dataset.file_name, version=info.version, start_row=offset,
+            end_row=min(offset + limit, metadata.num_rows),
+            columns=request_columns(request, dataset, opset) or schema.names
+        )
+
+        if opset is not None and opset.operations:
+            # Derived series need the whole window, so they are a single stream
+            df = self.read_derived(ticket.model_copy(update={'operations': True, 'end_row': offset}))
+            return df.to_arrow().schema, [ticket.model_copy(update={'operations': True})], -1
+
+        missing = [col for col in ticket.columns if col not in schema.names]
+        if missing:
+            raise flight.FlightServerError(f"Unknown columns: {', '.join(missing)}")
+
+        tscol = schema.names.index(dataset.tscol)
+        row_groups = [
+            i for i, _ in window_row_groups(metadata, offset, limit)
+            if in_time_range(metadata.row_group(i).column(tscol).statistics, request.start, request.end)
+        ]
+        tickets = [
+            ticket.model_copy(update={'row_groups': ranges})
+            for ranges in split_row_groups(row_groups, self.num_streams)
+        ]
+        num_rows = ticket.end_row - offset if request.start is None and request.end is None else -1
+        return pa.schema([schema.field(col) for col in ticket.columns]), tickets, num_rows
+
+    def get_flight_info(self, context, descriptor):
+        request = parse_descriptor(descriptor)
+        schema, tickets, num_rows = self.plan(request)
+        self.logger.info("Flight info", dataset=request.dataset, opset=request.opset, streams=len(tickets))
+        endpoints = [
+            flight.FlightEndpoint(ticket.model_dump_json().encode(), self.endpoint_locations) for ticket in tickets
+        ]
+        return flight.FlightInfo(schema, descriptor, endpoints, num_rows, -1)
+
+    def list_flights(self, context, criteria):
+        for dataset in self.catalog.datasets():
+            request = FlightRequest(dataset=dataset.name)
+            descriptor = flight.FlightDescriptor.for_command(request.model_dump_json(exclude_none=True))
+            try:
+                schema, tickets, num_rows = self.plan(request)
+            except (flight.FlightServerError, FileNotFoundError):
+                continue
+            yield flight.FlightInfo(schema, descriptor, [], num_rows, -1)
+
+    def read_frames(self, ticket: FlightTicket):
+        info, metadata = self.storage.metadata(ticket.name)
+        if info.version != ticket.version:
+            raise flight.FlightServerError(CHANGED)
+
+        dataset, _ = self.resolve(ticket.request)
+        start, end = ticket.request.start, ticket.request.end
+        columns = list(dict.fromkeys([*ticket.columns, dataset.tscol]))
+
+        first_rows = dict(window_row_groups(metadata, ticket.start_row, ticket.end_row - ticket.start_row))
+        for i in ticket.row_groups:
+            df = self.storage.read_row_group(ticket.name, info, metadata, i, columns)
+            # Only the part inside the window
+            skip = max(ticket.start_row - first_rows[i], 0)
+            df = df.slice(skip, ticket.end_row - first_rows[i] - skip)
+            yield filter_time(df, dataset.tscol, start, end).select(ticket.columns)
+
+    def read_derived(self, ticket: FlightTicket) -> pl.DataFrame:
+        dataset, opset = self.resolve(ticket.request)
+        info, _ = self.storage.metadata(ticket.name)
+        if info.version != ticket.version:
+            raise flight.FlightServerError(CHANGED)
+
+        df = self.storage.read_parquet(ticket.name, ticket.start_row, ticket.end_row - ticket.start_row)
+        df = apply_operations(df, opset.operations, dataset.tscol, opset.series_ids, opset.group_by)
+        df = filter_time(df, dataset.tscol, ticket.request.start, ticket.request.end)
+        # The derived columns are only known now
+        return df.select(ticket.columns) if ticket.request.columns else df
+
+    def do_get(self, context, ticket):
+        ticket = FlightTicket.model_validate_json(ticket.ticket)
+
+        if ticket.operations:
+            return flight.RecordBatchStream(self.read_derived(ticket).to_arrow())
+
+        frames = self.read_frames(ticket)
+        first = next(frames, None)
+        if first is None:
+            _, metadata = self.storage.metadata(ticket.name)
+            return flight.RecordBatchStream(metadata.schema.to_arrow_schema().empty_table().select(ticket.columns))
+
+        # Row groups are read one at a time as the client takes them, in the types of the first
+        table = first.to_arrow()
+
+        def batches():
+            yield from table.to_batches()
+            for df in frames:
+                yield from df.to_arrow().cast(table.schema).to_batches()
+
+        return flight.GeneratorStream(table.schema, batches())
+
+
+class MongoCatalog:
+    """
+    The datasets and opsets in MongoDB.  The Flight handlers run on threads,
+    so the async client runs on an event loop of its own.
+    """
+
+    def __init__(self, settings):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.client = MongoClient(settings)
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def resolve(self, request: FlightRequest) -> tuple[DataSet, OperationSet | None]:
+        if request.opset is not None:
+            # None if it is missing or not an ObjectId
+            doc = self.run(self.client.get_opset(request.opset))
+            if doc is None:
+                raise KeyError(request.opset)
+            opset = OperationSet(**doc)
+            doc = self.run(self.client.get_dataset(opset.dataset_id))
+            if doc is None:
+                raise KeyError(opset.dataset_id)
+            return DataSet(**doc), opset
+
+        doc = self.run(self.client.get_dataset_by_name(request.dataset)) if request.dataset else None
+        if doc is None:
+            raise KeyError(request.dataset)
+        return DataSet(**doc), None
+
+    def datasets(self) -> list[DataSet]:
+        return [DataSet(**doc) for doc in self.run(self.client.get_all_datasets())]
+
+
+def main():
+    from tsapi.settings import load_settings
+
+    settings = load_settings()
+    location = f'grpc://{settings.flight_host}:{settings.flight_port}'
+    server = FlightService(
+        location, get_storage(settings), MongoCatalog(settings), settings.flight_streams, settings.flight_location
+    )
+    structlog.get_logger().info("Serving Flight", location=location, streams=settings.flight_streams)
+    server.serve()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,210 @@
-import augurs as aug
+import asyncio
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+import numpy as np
 import polars as pl
 
+from tsapi.constants import MAX_CACHED_MODELS
 from tsapi.frequency import infer_freq
 
+DEFAULT_PERIODS = [3, 4]
+
+
+class ModelCache:
+    """
+    Fitted models, at most one per key (e.g. opset and series), so that a
+    forecast for the same data with a different horizon or interval level
+    only has to predict.  The augurs models can't be serialized, so each
+    worker process keeps its own cache.
+    """
+
+    def __init__(self, max_models: int = MAX_CACHED_MODELS):
+        self.max_models = max_models
+        self.models = OrderedDict()
+
+    def get(self, key: tuple, params: tuple, fingerprint: str):
+        entry = self.models.get(key)
+        if entry is None or entry[0] != (params, fingerprint):
+            return None
+
+        self.models.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: tuple, params: tuple, fingerprint: str, model):
+        # Replaces any model fit to older data for the same key
+        self.models[key] = ((params, fingerprint), model)
+        self.models.move_to_end(key)
+        while len(self.models) > self.max_models:
+            self.models.popitem(last=False)
+
+
+# The fits run in the spawned pool processes (or on the forecast workers), so
+# each of them has a cache of its own.  A fit can go to any of them, so a
+# repeated grouped forecast only finds some of its models cached.
+model_cache = ModelCache()
+
+
+def data_fingerprint(y: np.ndarray) -> str:
+    return hashlib.blake2b(y.tobytes(), digest_size=16).hexdigest()
+
+
+def model_periods(periods: list[int] | None, num_points: int) -> list[int]:
+    """
+    MSTL needs at least one period, and two full cycles of each period.
+    Without a usable detected period, fall back to the defaults.
+    """
+    periods = [p for p in periods or [] if 2 * p < num_points]
+    return periods or DEFAULT_PERIODS
+
+
+def fit_model(y: np.ndarray, periods: list[int], model_key: tuple = None):
+    """
+    Fit an MSTL model, or reuse the cached one if it was fit with the same
+    parameters to the same data.  MSTL/ETS fits can't be updated
+    incrementally, so any change to the data means a full refit.
+    """
+    params = ('mstl_ets', tuple(periods))
+    fingerprint = None
+
+    if model_key is not None:
+        fingerprint = data_fingerprint(y)
+        model = model_cache.get(model_key, params, fingerprint)
+        if model is not None:
+            return model
+
+    # augurs is slow to import, so only import it when a model is actually fit
+    import augurs as aug
+
+    model = aug.MSTL.ets(periods)
+    model.fit(y)
+
+    if model_key is not None:
+        model_cache.put(model_key, params, fingerprint, model)
+
+    return model
+
 
-def forecast(series, timestamp, horizon=10):
+def future_timestamps(timestamp: pl.Series, freq: timedelta, horizon: int) -> pl.Series:
+    """
+    The horizon timestamps following the last timestamp, at the given frequency.
+    """
+    last = timestamp.max()
+    if timestamp.dtype == pl.Date:
+        future = pl.date_range(last + freq, last + horizon * freq, interval=freq, eager=True)
+    else:
+        future = pl.datetime_range(
+            last + freq, last + horizon * freq, interval=freq, time_unit=timestamp.dtype.time_unit, eager=True
+        )
+
+    return future.alias(timestamp.name)
+
+
+def forecast_frame(
+        series: pl.Series,
+        timestamp: pl.Series,
+        horizon: int = 10,
+        level: float = 0.95,
+        model_key: tuple = None,
+        periods: list[int] = None
+) -> pl.DataFrame:
+    """
+    Fit a model to the series and forecast horizon steps ahead.
+
+    :param model_key: If given, the fitted model is cached under this key
+        (e.g. opset and series id) and reused while the data is unchanged
+    :param periods: Seasonal periods of the series (see tsapi.seasonality)
+    :return: DataFrame with the future timestamps and the point, lower and upper predictions
+    """
     if series.dtype != pl.Float64:
         series = series.cast(pl.Float64)
 
     y = series.to_numpy()
-    periods = [3, 4]
-    model = aug.MSTL.ets(periods)
-    model.fit(y)
-    predictions = model.predict(horizon, level=0.95)
+    model = fit_model(y, model_periods(periods, len(y)), model_key)
+    predictions = model.predict(horizon, level=level)
 
-    pred_records = []
     freq = infer_freq(timestamp)
-    for i in range(horizon):
-        pred_records.append(
-            (
-                timestamp[-1] + (i + 1) * freq,
-                {
-                    "point": predictions.point()[i],
-                    "lower": predictions.lower()[i],
-                    "upper": predictions.upper()[i]
-                }
-            )
-        )
 
-    return pred_records
+    # Each of these accessors copies the prediction arrays, so only call them once
+    return pl.DataFrame({
+        'timestamp': future_timestamps(timestamp, freq, horizon),
+        'point': predictions.point(),
+        'lower': predictions.lower(),
+        'upper': predictions.upper(),
+    })
+
+
+def forecast_records(forecast_df: pl.DataFrame) -> list[tuple[datetime, dict[str, float]]]:
+    """
+    Convert a forecast frame into (timestamp, {point, lower, upper}) records.
+    """
+    return list(zip(
+        forecast_df['timestamp'].to_list(),
+        forecast_df.select('point', 'lower', 'upper').to_dicts()
+    ))
+
 
+def forecast(series, timestamp, horizon=10, level=0.95, model_key=None, periods=None):
+    return forecast_records(forecast_frame(series, timestamp, horizon, level, model_key, periods))
+
+
+_process_pool = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Model fits are CPU bound, so they run in a shared pool of worker processes.
+    Spawn (rather than fork) so the workers don't inherit the event loop or
+    open client connections.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+    return _process_pool
+
+
+async def pooled_forecast_frame(*args) -> pl.DataFrame:
+    """forecast_frame in the shared process pool."""
+    return await asyncio.get_running_loop().run_in_executor(get_process_pool(), forecast_frame, *args)
+
+
+async def forecast_groups(
+        df: pl.DataFrame,
+        series_id: str,
+        tscol: str,
+        group_col: str,
+        horizon: int = 10,
+        level: float = 0.95,
+        model_key: tuple = None,
+        periods: list[int] = None,
+        fit: Callable[..., Awaitable[pl.DataFrame]] = None
+) -> dict[str, pl.DataFrame | Exception]:
+    """
+    Forecast each group of a grouped dataframe in parallel.
+
+    :param model_key: If given, each group's model is cached under this key plus the group
+    :param fit: Runs forecast_frame, by default in the process pool (see
+        tsapi.forecast_queue for running it on other nodes)
+    :return: The forecast frame (or the exception raised fitting it) for each group
+    """
+    fit = fit or pooled_forecast_frame
+
+    groups = df.drop_nulls(series_id).sort(tscol).partition_by(group_col, as_dict=True, maintain_order=True)
+    futures = {
+        str(key[0]): fit(
+            group_df[series_id],
+            group_df[tscol],
+            horizon,
+            level,
+            None if model_key is None else (*model_key, str(key[0])),
+            periods
+        )
+        for key, group_df in groups.items()
+    }
+    results = await asyncio.gather(*futures.values(), return_exceptions=True)
 
+    return dict(zip(futures.keys(), results))
@@ -0,0 +1,334 @@
+"""
+A Redis queue of forecast fits, so that forecasts can run on workers that
+scale independently of the API replicas.
+
+The API pushes each fit (one per group for grouped opsets) as a job, and
+waits on the job's result list.  Workers, started with
+
+    python -m tsapi.forecast_queue
+
+move jobs to a processing list of their own, run tsapi.forecast.forecast_frame
+in a process pool and push the result.  A job that isn't done by its deadline
+is abandoned by both sides.  The jobs of a worker that goes away are put back
+in the queue by the others.
+"""
+import asyncio
+import io
+import json
+import math
+import multiprocessing
+import signal
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import polars as pl
+import redis.asyncio as redis
+import structlog
+
+from tsapi.errors import TsApiForecastError, TsApiForecastTimeoutError
+from tsapi.forecast import forecast_frame
+
+QUEUE_KEY = 'tsapi:forecast:queue'
+JOB_PREFIX = 'tsapi:forecast:job'
+RESULT_PREFIX = 'tsapi:forecast:result'
+PROCESSING_PREFIX = 'tsapi:forecast:processing'
+WORKER_PREFIX = 'tsapi:forecast:worker'
+
+# How long a worker blocks waiting for a job, so that it notices it is stopping
+POLL_SECONDS = 5
+# A worker that hasn't renewed its key for this long is gone, and its jobs are requeued
+WORKER_SECONDS = 30
+
+OK = b'ok\n'
+ERROR = b'error\n'
+
+
+def job_key(job_id: str) -> str:
+    return f'{JOB_PREFIX}:{job_id}'
+
+
+def result_key(job_id: str) -> str:
+    return f'{RESULT_PREFIX}:{job_id}'
+
+
+def processing_key(worker_id: str) -> str:
+    return f'{PROCESSING_PREFIX}:{worker_id}'
+
+
+def worker_key(worker_id: str) -> str:
+    return f'{WORKER_PREFIX}:{worker_id}'
+
+
+class ForecastJob(NamedTuple):
+    id: str
+    series: pl.Series
+    timestamp: pl.Series
+    horizon: int
+    level: float
+    model_key: tuple | None
+    periods: list[int] | None
+    # Epoch seconds after which nobody is waiting for the result
+    deadline: float
+
+
+def encode_job(job: ForecastJob) -> dict[str, bytes]:
+    buffer = io.BytesIO()
+    # The series name might be the same as the timestamp name
+    pl.DataFrame({'timestamp': job.timestamp, 'series': job.series}).write_ipc(buffer)
+    params = {
+        'series_name': job.series.name,
+        'timestamp_name': job.timestamp.name,
+        'horizon': job.horizon,
+        'level': job.level,
+        'model_key': None if job.model_key is None else list(job.model_key),
+        'periods': job.periods,
+        'deadline': job.deadline,
+    }
+    return {'params': json.dumps(params).encode(), 'data': buffer.getvalue()}
+
+
+def decode_job(job_id: str, fields: dict[bytes, bytes]) -> ForecastJob:
+    params = json.loads(fields[b'params'])
+    df = pl.read_ipc(io.BytesIO(fields[b'data']))
+    return ForecastJob(
+        id=job_id,
+        series=df['series'].alias(params['series_name']),
+        timestamp=df['timestamp'].alias(params['timestamp_name']),
+        horizon=params['horizon'],
+        level=params['level'],
+        model_key=None if params['model_key'] is None else tuple(params['model_key']),
+        periods=params['periods'],
+        deadline=params['deadline'],
+    )
+
+
+def encode_result(df: pl.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.write_ipc(buffer)
+    return OK + buffer.getvalue()
+
+
+def encode_error(message: str) -> bytes:
+    return ERROR + message.encode()
+
+
+def decode_result(payload: bytes) -> pl.DataFrame:
+    """
+    :raises TsApiForecastError: If the forecast failed on the worker
+    """
+    if payload.startswith(ERROR):
+        raise TsApiForecastError(payload[len(ERROR):].decode())
+    return pl.read_ipc(io.BytesIO(payload[len(OK):]))
+
+
+def run_job(job_id: str, fields: dict[bytes, bytes]) -> bytes:
+    """
+    Decode, fit and encode a job.  This runs in a worker process, so only
+    bytes cross the process boundary.
+    """
+    try:
+        job = decode_job(job_id, fields)
+        return encode_result(
+            forecast_frame(job.series, job.timestamp, job.horizon, job.level, job.model_key, job.periods)
+        )
+    except Exception as e:
+        return encode_error(str(e) or type(e).__name__)
+
+
+class ForecastQueue:
+    """
+    The API side of the queue.  forecast_frame can be passed to
+    tsapi.forecast.forecast_groups as its fit.
+    """
+
+    def __init__(self, settings):
+        self.client = redis.Redis(host=settings.redis_host, port=6379, db=0)
+        self.timeout = settings.forecast_timeout_seconds
+
+    async def forecast_frame(
+            self,
+            series: pl.Series,
+            timestamp: pl.Series,
+            horizon: int = 10,
+            level: float = 0.95,
+            model_key: tuple = None,
+            periods: list[int] = None
+    ) -> pl.DataFrame:
+        """
+        Queue a fit and wait for the forecast (see tsapi.forecast.forecast_frame).
+
+        :raises TsApiForecastTimeoutError: If no worker finished it within the timeout
+        :raises TsApiForecastError: If the fit failed
+        """
+        job = ForecastJob(
+            uuid.uuid4().hex, series, timestamp, horizon, level, model_key, periods, time.time() + self.timeout
+        )
+
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(job_key(job.id), mapping=encode_job(job))
+            pipe.expire(job_key(job.id), math.ceil(self.timeout))
+            pipe.lpush(QUEUE_KEY, job.id)
+            await pipe.execute()
+
+        reply = await self.client.blpop([result_key(job.id)], timeout=math.ceil(self.timeout))
+        if reply is None:
+            # The job expires, so a worker that gets to it later skips it
+            raise TsApiForecastTimeoutError(f"Forecast not done within {self.timeout} s")
+        return decode_result(reply[1])
+
+
+_queues: dict[str, ForecastQueue] = {}
+
+
+def get_forecast_queue(settings) -> ForecastQueue:
+    """The forecast queue client of the process, sharing one connection pool."""
+    queue = _queues.get(settings.redis_host)
+    if queue is None:
+        queue = _queues[settings.redis_host] = ForecastQueue(settings)
+    return queue
+
+
+class ForecastWorker:
+    """
+    Takes jobs from the queue, at most concurrency at a time, and fits them in
+    a pool of as many processes.  Each process keeps its own model cache.
+
+    A job is moved to the worker's processing list, and only removed from it
+    once its result is pushed, so it isn't lost if the worker dies during the
+    fit.  A job is only taken once a process of the pool is free: one that
+    timed out still holds its process until the fit ends.
+    """
+
+    def __init__(self, settings, logger, concurrency: int = None):
+        self.client = redis.Redis(host=settings.redis_host, port=6379, db=0)
+        self.logger = logger
+        self.id = uuid.uuid4().hex
+        self.concurrency = concurrency or settings.forecast_worker_concurrency
+        self.result_seconds = settings.forecast_result_seconds
+        self.pool = ProcessPoolExecutor(self.concurrency, mp_context=multiprocessing.get_context('spawn'))
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.stopping = asyncio.Event()
+
+    async def take(self) -> tuple[str, dict[bytes, bytes]] | None:
+        reply = await self.client.blmove(QUEUE_KEY, processing_key(self.id), POLL_SECONDS, 'RIGHT', 'LEFT')
+        if reply is None:
+            return None
+
+        job_id = reply.decode()
+        fields = await self.client.hgetall(job_key(job_id))
+        if not fields:
+            # Expired, the caller has given up
+            await self.client.lrem(processing_key(self.id), 1, job_id)
+            self.logger.info("Skipped expired forecast job", job_id=job_id)
+            return None
+        return job_id, fields
+
+    async def finish(self, job_id: str, payload: bytes | None):
+        """Push the result (None if the job timed out) and drop the job."""
+        async with self.client.pipeline(transaction=True) as pipe:
+            if payload is not None:
+                pipe.rpush(result_key(job_id), payload)
+                pipe.expire(result_key(job_id), self.result_seconds)
+            pipe.delete(job_key(job_id))
+            pipe.lrem(processing_key(self.id), 1, job_id)
+            await pipe.execute()
+
+    async def process(self, job_id: str, fields: dict[bytes, bytes]):
+        """Fit a job, holding a slot that has already been acquired until the fit ends."""
+        loop = asyncio.get_running_loop()
+        deadline = json.loads(fields[b'params'])['deadline']
+        start = time.perf_counter()
+        # A fit can't be stopped once it runs, so the slot is only free when it is done
+        future = self.pool.submit(run_job, job_id, fields)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.slots.release))
+
+        payload = None
+        try:
+            payload = await asyncio.wait_for(asyncio.wrap_future(future), timeout=max(0.0, deadline - time.time()))
+        except TimeoutError:
+            self.logger.warning("Forecast job timed out", job_id=job_id)
+
+        try:
+            await self.finish(job_id, payload)
+        except redis.RedisError as e:
+            self.logger.error("Forecast result not saved", job_id=job_id, error=str(e))
+            return
+        if payload is not None:
+            self.logger.info(
+                "Forecast job done", job_id=job_id, ok=payload.startswith(OK),
+                seconds=round(time.perf_counter() - start, 3)
+            )
+
+    async def consume(self):
+        tasks = set()
+        while not self.stopping.is_set():
+            await self.slots.acquire()
+            if self.stopping.is_set():
+                self.slots.release()
+                break
+            try:
+                job = await self.take()
+            except redis.RedisError as e:
+                self.slots.release()
+                self.logger.error("Forecast queue unavailable", error=str(e))
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+            if job is None:
+                self.slots.release()
+                continue
+
+            task = asyncio.create_task(self.process(*job))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # Jobs in progress finish
+        await asyncio.gather(*tasks)
+
+    async def requeue_orphans(self):
+        """Put the jobs of workers that have gone away back at the front of the queue."""
+        async for key in self.client.scan_iter(match=f'{PROCESSING_PREFIX}:*'):
+            worker_id = key.decode().rsplit(':', 1)[1]
+            if worker_id == self.id or await self.client.exists(worker_key(worker_id)):
+                continue
+            while (job_id := await self.client.lmove(key, QUEUE_KEY, 'RIGHT', 'RIGHT')) is not None:
+                self.logger.warning("Requeued forecast job", job_id=job_id.decode(), worker_id=worker_id)
+
+    async def heartbeat(self):
+        while not self.stopping.is_set():
+            try:
+                await self.client.set(worker_key(self.id), 1, ex=WORKER_SECONDS)
+                await self.requeue_orphans()
+            except redis.RedisError as e:
+                self.logger.error("Forecast queue unavailable", error=str(e))
+            try:
+                await asyncio.wait_for(self.stopping.wait(), WORKER_SECONDS / 3)
+            except TimeoutError:
+                pass
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        self.logger.info("Started forecast worker", worker_id=self.id, concurrency=self.concurrency)
+        try:
+            # The key has to exist before any job is taken, or another worker would requeue it
+            await self.client.set(worker_key(self.id), 1, ex=WORKER_SECONDS)
+            await asyncio.gather(self.heartbeat(), self.consume())
+        finally:
+            self.pool.shutdown()
+            await self.client.delete(worker_key(self.id))
+            await self.client.aclose()
+            self.logger.info("Stopped forecast worker")
+
+
+def main():
+    from tsapi.settings import load_settings
+
+    asyncio.run(ForecastWorker(load_settings(), structlog.get_logger()).run())
+
+
+if __name__ == '__main__':
+    main()
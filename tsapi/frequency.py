@@ -6,11 +6,18 @@ import polars as pl
 from tsapi.constants import MAX_POINTS
 
 
+def _sorted(series):
+    # Checking is linear (and free if polars already knows), sorting is not
+    if series.is_sorted():
+        return series
+    return series.sort()
+
+
 def frequency_counts(series):
     try:
-        freq_counts = series.dt.replace_time_zone(None).sort().diff().value_counts().drop_nulls()
+        freq_counts = _sorted(series.dt.replace_time_zone(None)).diff().value_counts().drop_nulls()
     except pl.exceptions.InvalidOperationError:
-        freq_counts = series.dt.date().sort().diff().value_counts().drop_nulls()
+        freq_counts = _sorted(series.dt.date()).diff().value_counts().drop_nulls()
     return freq_counts
 
 
@@ -40,28 +47,71 @@ def infer_freq(series):
     return freq
 
 
-def adjust_frequency(df: pl.DataFrame, timestamp_col: str) -> str:
+def downsample_seconds(timestamps: pl.Series, max_points: int) -> int:
+    """
+    Width in seconds of the buckets needed to reduce the (sorted) timestamps
+    to at most max_points.
+    """
+    try:
+        freq = infer_freq(timestamps)
+        points_per_group = math.ceil(len(timestamps) / max_points)
+
+        s = int((points_per_group * freq).total_seconds())
+    except ValueError:
+        time_delta_per_group = (timestamps.max() - timestamps.min()) / max_points
+        s = int(time_delta_per_group.total_seconds())
+
+    return max(s, 1)
+
+
+def adjust_frequency(
+        df: pl.DataFrame, timestamp_col: str, group_col: str = None, max_points: int = MAX_POINTS
+) -> pl.DataFrame:
     """
-    Infer the frequency of a time series from the data
+    Downsample a time series to at most max_points by averaging over time buckets.
 
     :param df: DataFrame with a timestamp column
-    :return: frequency string
+    :param timestamp_col: name of the timestamp column
+    :param group_col: optional column identifying separate series (e.g. a stock
+        ticker), in which case the points are shared among the groups
+    :param max_points: maximum number of points to return
+    :return: downsampled dataframe
     """
-    if len(df) < MAX_POINTS:
+    if group_col is not None:
+        return adjust_group_frequency(df, timestamp_col, group_col, max_points)
+
+    if len(df) < max_points:
         return df
 
     df = df.sort(timestamp_col)
+    s = downsample_seconds(df[timestamp_col], max_points)
 
-    try:
-        freq = infer_freq(df[timestamp_col])
-        points_per_group = math.ceil(len(df) / MAX_POINTS)
+    return df.group_by_dynamic(timestamp_col, every=f'{s}s').agg(pl.all().mean())
 
-        s = int((points_per_group * freq).total_seconds())
-    except ValueError:
-        time_delta_per_group = (df[timestamp_col].max() - df[timestamp_col].min()) / MAX_POINTS
-        s = int(time_delta_per_group.total_seconds())
 
-    return df.group_by_dynamic(timestamp_col, every=f'{s}s').agg(pl.all().mean())
+def adjust_group_frequency(
+        df: pl.DataFrame, timestamp_col: str, group_col: str, max_points: int = MAX_POINTS
+) -> pl.DataFrame:
+    """
+    Downsample each group separately, using the same bucket width for every
+    group so the downsampled series still line up.
+    """
+    df = df.sort(group_col, timestamp_col)
+
+    group_sizes = df[group_col].value_counts(sort=True)
+    if len(group_sizes) == 0:
+        return df
+
+    points_per_group = max(max_points // len(group_sizes), 1)
+    if group_sizes['count'][0] <= points_per_group:
+        return df
+
+    # The bucket width is determined by the longest series
+    largest_group = group_sizes[group_col][0]
+    timestamps = df.filter(pl.col(group_col).eq_missing(largest_group))[timestamp_col]
+    s = downsample_seconds(timestamps, points_per_group)
+
+    return df.group_by_dynamic(timestamp_col, every=f'{s}s', group_by=group_col).agg(pl.all().mean())
 
 
 def check_time_series(series: pl.Series) -> [str]:
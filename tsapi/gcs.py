@@ -1,4 +1,3 @@
-from google.cloud import storage
 from datetime import timedelta
 
 
@@ -11,6 +10,9 @@ def generate_signed_url(bucket_name, blob_name, expiration_minutes=15):
     :param expiration_minutes: The duration in minutes for which the signed URL should be valid.
     :return: The signed URL as a string.
     """
+    # Imported here because it is slow to import and only needed in production
+    from google.cloud import storage
+
     # Initialize a client for Google Cloud Storage
     client = storage.Client()
 
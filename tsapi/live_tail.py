@@ -0,0 +1,284 @@
+import asyncio
+import json
+import uuid
+
+import polars as pl
+
+from tsapi.dataset_storage import DatasetStorage
+from tsapi.model.dataset import DataSet, OperationSet
+from tsapi.model.time_series import TimeRecord
+from tsapi.operations import apply_operations
+
+LOCK_SECONDS = 10  # A producer that stops renewing its lock is replaced after this long
+POSITION_SECONDS = 60  # Without a producer, tailing starts again from the end of the dataset
+KEEPALIVE_SECONDS = 15
+# Messages a subscriber can fall behind by before its stream is closed
+MAX_QUEUED_MESSAGES = 100
+
+# Only delete or renew the lock if it is still ours
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def tail_channel(opset_id: str) -> str:
+    return f'tail:{opset_id}'
+
+
+def producer_key(opset_id: str) -> str:
+    return f'tail:{opset_id}:producer'
+
+
+def position_key(opset_id: str) -> str:
+    return f'tail:{opset_id}:rows'
+
+
+def tail_frame(
+        storage: DatasetStorage, dataset: DataSet, opset: OperationSet, start_row: int, num_rows: int
+) -> pl.DataFrame:
+    """
+    The opset rows for dataset rows start_row to num_rows.  With operations,
+    the rows before start_row (up to the opset limit) are read as well, so
+    derived series continue from the rows the subscribers already have.  The
+    frame then starts at the last row at or before the first new timestamp,
+    which for resample is the bucket that the new rows were added to.
+    """
+    tscol = dataset.tscol
+    if not opset.operations:
+        columns = [tscol] + opset.series_ids + ([opset.group_by] if opset.group_by is not None else [])
+        return storage.read_parquet(dataset.file_name, start_row, num_rows - start_row, columns)
+
+    context_start = max(0, start_row - opset.limit)
+    df = storage.read_parquet(dataset.file_name, context_start, num_rows - context_start)
+    first_new = df[tscol][start_row - context_start]
+
+    df = apply_operations(df, opset.operations, tscol, opset.series_ids, opset.group_by)
+    since = df.filter(pl.col(tscol) <= first_new)[tscol].max()
+    return df.filter(pl.col(tscol) >= since) if since is not None else df
+
+
+def tail_message(df: pl.DataFrame, tscol: str, opset: OperationSet, num_rows: int) -> str:
+    """
+    The JSON published for new rows.  Clients replace the records they hold
+    from `since` onwards with `data`.
+    """
+    data = [
+        TimeRecord(
+            timestamp=x[tscol],
+            data={k: x[k] for k in opset.series_ids},
+            group=str(x[opset.group_by]) if opset.group_by is not None else None
+        ).model_dump(mode='json')
+        for x in df.iter_rows(named=True)
+    ]
+    return json.dumps({
+        'since': data[0]['timestamp'] if data else None,
+        'rows': num_rows,
+        'data': data,
+    })
+
+
+class TailProducer:
+    """
+    Polls the dataset for appended rows and publishes them on the opset tail
+    channel.  There is one producer per opset across all workers, the holder
+    of a Redis lock, and it stops once the channel has no subscribers.  The
+    number of rows published is kept in Redis, so a replacement producer
+    carries on where the last one stopped.
+    """
+
+    def __init__(self, client, settings, storage: DatasetStorage, dataset: DataSet, opset: OperationSet, logger):
+        self.client = client
+        self.storage = storage
+        self.dataset = dataset
+        self.opset = opset
+        self.logger = logger
+        self.poll_seconds = settings.tail_poll_seconds
+        self.token = uuid.uuid4().hex
+
+    async def acquire(self) -> bool:
+        return bool(await self.client.set(producer_key(self.opset.id), self.token, nx=True, ex=LOCK_SECONDS))
+
+    async def renew(self) -> bool:
+        return bool(await self.client.eval(RENEW_SCRIPT, 1, producer_key(self.opset.id), self.token, LOCK_SECONDS))
+
+    async def has_subscribers(self) -> bool:
+        counts = await self.client.pubsub_numsub(tail_channel(self.opset.id))
+        return any(count > 0 for _, count in counts)
+
+    async def poll(self):
+        _, metadata = await asyncio.to_thread(self.storage.metadata, self.dataset.file_name)
+        num_rows = metadata.num_rows
+
+        position = await self.client.get(position_key(self.opset.id))
+        start_row = int(position) if position is not None else num_rows
+
+        # Fewer rows means the dataset was replaced, so start again from its end
+        if num_rows > start_row:
+            df = await asyncio.to_thread(tail_frame, self.storage, self.dataset, self.opset, start_row, num_rows)
+            message = tail_message(df, self.dataset.tscol, self.opset, num_rows)
+            receivers = await self.client.publish(tail_channel(self.opset.id), message)
+            self.logger.info("Published tail", opset_id=self.opset.id, rows=len(df), receivers=receivers)
+
+        await self.client.set(position_key(self.opset.id), num_rows, ex=POSITION_SECONDS)
+
+    async def run(self):
+        self.logger.info("Started tail producer", opset_id=self.opset.id)
+        try:
+            while await self.renew() and await self.has_subscribers():
+                try:
+                    await self.poll()
+                except Exception as e:
+                    self.logger.error("Tail poll failed", opset_id=self.opset.id, error=str(e))
+                await asyncio.sleep(self.poll_seconds)
+        finally:
+            await self.client.eval(RELEASE_SCRIPT, 1, producer_key(self.opset.id), self.token)
+            self.logger.info("Stopped tail producer", opset_id=self.opset.id)
+
+
+class TailHub:
+    """
+    The tail subscriptions of a worker.  They share one Redis connection,
+    subscribed to an opset channel while anyone in the worker follows it, and
+    each message is passed on to the queues of the subscribers.  While the
+    worker has subscribers of an opset it checks, every LOCK_SECONDS / 2, that
+    a producer holds the lock, and starts one if none does, so that one takes
+    over if the worker running it goes away.
+    """
+
+    def __init__(self, settings, logger):
+        # Imported here, it is only needed by workers with tail subscribers
+        import redis.asyncio as redis
+
+        self.client = redis.Redis(host=settings.redis_host, port=6379, db=0)
+        self.pubsub = self.client.pubsub()
+        self.settings = settings
+        self.logger = logger
+        self.queues: dict[str, set[asyncio.Queue]] = {}
+        self.subscribed: set[str] = set()
+        self.lock = asyncio.Lock()
+        self.reader: asyncio.Task | None = None
+        self.watchers: dict[str, asyncio.Task] = {}
+        self.producers: dict[str, asyncio.Task] = {}
+
+    async def update_subscriptions(self, channel: str):
+        # Serialized, so that the last unsubscribe and a new subscribe can't be sent out of order
+        async with self.lock:
+            if self.queues.get(channel) and channel not in self.subscribed:
+                await self.pubsub.subscribe(channel)
+                self.subscribed.add(channel)
+            elif not self.queues.get(channel) and channel in self.subscribed:
+                await self.pubsub.unsubscribe(channel)
+                self.subscribed.discard(channel)
+
+    async def subscribe(self, storage: DatasetStorage, dataset: DataSet, opset: OperationSet) -> asyncio.Queue:
+        channel = tail_channel(opset.id)
+        queue = asyncio.Queue(MAX_QUEUED_MESSAGES)
+        self.queues.setdefault(channel, set()).add(queue)
+        # Subscribe first, so the producer doesn't stop for lack of subscribers
+        await self.update_subscriptions(channel)
+
+        watcher = self.watchers.get(opset.id)
+        if watcher is None or watcher.done():
+            self.watchers[opset.id] = asyncio.create_task(self.watch(storage, dataset, opset))
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.create_task(self.read())
+        return queue
+
+    async def unsubscribe(self, opset_id: str, queue: asyncio.Queue):
+        channel = tail_channel(opset_id)
+        subscribers = self.queues.get(channel, set())
+        subscribers.discard(queue)
+        if not subscribers:
+            self.queues.pop(channel, None)
+            watcher = self.watchers.pop(opset_id, None)
+            if watcher is not None:
+                watcher.cancel()
+        await self.update_subscriptions(channel)
+
+    def dispatch(self, channel: str, data: str):
+        for queue in self.queues.get(channel, ()):
+            if queue.full():
+                # Too far behind: None closes its stream, the client reconnects
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+            else:
+                queue.put_nowait(data)
+
+    async def read(self):
+        while self.queues:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                self.logger.error("Tail subscription failed", error=str(e))
+                await asyncio.sleep(1.0)
+                continue
+            if message is not None:
+                self.dispatch(message['channel'].decode(), message['data'].decode())
+
+    async def ensure_producer(self, storage: DatasetStorage, dataset: DataSet, opset: OperationSet):
+        """
+        Start a producer in this worker unless one is running somewhere already.
+        """
+        task = self.producers.get(opset.id)
+        if task is not None and not task.done():
+            return
+
+        producer = TailProducer(self.client, self.settings, storage, dataset, opset, self.logger)
+        if await producer.acquire():
+            self.producers[opset.id] = asyncio.create_task(producer.run())
+
+    async def watch(self, storage: DatasetStorage, dataset: DataSet, opset: OperationSet):
+        while True:
+            try:
+                await self.ensure_producer(storage, dataset, opset)
+            except Exception as e:
+                self.logger.error("Tail producer check failed", opset_id=opset.id, error=str(e))
+            await asyncio.sleep(LOCK_SECONDS / 2)
+
+
+# The hub of this worker, by Redis host
+_hubs: dict[str, TailHub] = {}
+
+
+def get_tail_hub(settings, logger) -> TailHub:
+    hub = _hubs.get(settings.redis_host)
+    if hub is None:
+        hub = _hubs[settings.redis_host] = TailHub(settings, logger)
+    return hub
+
+
+async def tail_events(settings, storage: DatasetStorage, dataset: DataSet, opset: OperationSet, logger):
+    """
+    Server-Sent Events with the rows published on the opset tail channel,
+    received through the hub of the worker.
+    """
+    hub = get_tail_hub(settings, logger)
+    queue = await hub.subscribe(storage, dataset, opset)
+    logger.info("Subscribed to tail", opset_id=opset.id)
+
+    try:
+        yield ': subscribed\n\n'
+        while True:
+            try:
+                data = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+            if data is None:
+                logger.warning("Tail subscriber fell behind", opset_id=opset.id)
+                return
+            yield f"event: rows\ndata: {data}\n\n"
+    finally:
+        await hub.unsubscribe(opset.id, queue)
+        logger.info("Unsubscribed from tail", opset_id=opset.id)
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from tsapi.errors import TsApiMemoryBudgetError
+from tsapi.model.admission import MemoryStats
+
+
+class Reservation:
+    """Bytes held against a MemoryBudget, resized once the frame is known."""
+
+    def __init__(self, budget: 'MemoryBudget', nbytes: int):
+        self.budget = budget
+        self.nbytes = nbytes
+
+    def resize(self, nbytes: int):
+        """Account the actual size, without waiting even if it is over the budget."""
+        self.budget.release(self.nbytes - nbytes)
+        self.nbytes = nbytes
+
+
+class MemoryBudget:
+    """
+    Accounts the bytes of the frames a worker is loading and caching.  A
+    reservation that doesn't fit waits in line, first come first served so
+    that large loads aren't starved by small ones, and is rejected after
+    wait_seconds.  One larger than the whole budget is let in when nothing
+    else is in flight, so it can still be served, alone.  A limit of 0
+    only accounts.
+    """
+
+    def __init__(self, limit_bytes: int, wait_seconds: float = 10.0):
+        self.limit = limit_bytes
+        self.wait_seconds = wait_seconds
+        self.in_flight = 0
+        self.waiters: deque[tuple[int, asyncio.Future]] = deque()
+        self.stats = MemoryStats(budget_bytes=limit_bytes)
+
+    def fits(self, nbytes: int) -> bool:
+        return self.limit <= 0 or self.in_flight == 0 or self.in_flight + nbytes <= self.limit
+
+    def hold(self, nbytes: int):
+        self.in_flight += nbytes
+        self.stats.in_flight_bytes = self.in_flight
+        self.stats.peak_bytes = max(self.stats.peak_bytes, self.in_flight)
+
+    def release(self, nbytes: int):
+        self.hold(-nbytes)
+        self.wake()
+
+    def wake(self):
+        while self.waiters:
+            nbytes, future = self.waiters[0]
+            if not future.done():
+                if not self.fits(nbytes):
+                    break
+                # Held on behalf of the waiter, which gives it back if it has just given up
+                self.hold(nbytes)
+                future.set_result(None)
+            self.waiters.popleft()
+        self.stats.waiting = len(self.waiters)
+
+    async def acquire(self, nbytes: int):
+        """
+        :raises TsApiMemoryBudgetError: If the bytes didn't fit within wait_seconds
+        """
+        self.stats.largest_bytes = max(self.stats.largest_bytes, nbytes)
+        if not self.waiters and self.fits(nbytes):
+            self.hold(nbytes)
+            self.stats.admitted += 1
+            return
+
+        if self.wait_seconds <= 0:
+            self.stats.rejected += 1
+            raise TsApiMemoryBudgetError(f"No memory for a {nbytes} byte frame")
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((nbytes, future))
+        self.stats.waiting = len(self.waiters)
+        self.stats.queued += 1
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.wait_seconds):
+                await future
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                self.release(nbytes)
+            else:
+                future.cancel()
+                # It may have held back smaller waiters behind it
+                self.wake()
+            if isinstance(e, TimeoutError):
+                self.stats.rejected += 1
+                raise TsApiMemoryBudgetError(f"No memory for a {nbytes} byte frame within {self.wait_seconds} s")
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.stats.wait_seconds_total += waited
+            self.stats.wait_seconds_max = max(self.stats.wait_seconds_max, waited)
+
+        self.stats.admitted += 1
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int):
+        """Hold nbytes (waiting for them) until the block exits."""
+        await self.acquire(nbytes)
+        reservation = Reservation(self, nbytes)
+        try:
+            yield reservation
+        finally:
+            self.release(reservation.nbytes)
+
+    @contextmanager
+    def track(self, nbytes: int):
+        """Account nbytes until the block exits, without waiting, e.g. for a copy of a reserved frame."""
+        self.hold(nbytes)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
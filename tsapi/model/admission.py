@@ -0,0 +1,47 @@
+from pydantic import BaseModel
+
+
+class AdmissionStats(BaseModel):
+    """
+    Admission counters of one route class in one worker.
+    """
+    route_class: str
+    limit: int = 0
+    in_flight: int = 0
+    queued: int = 0
+    admitted: int = 0
+    # Rejected with 503 because the queue was full or the wait too long
+    rejected_queue_full: int = 0
+    rejected_timeout: int = 0
+    # Rejected with 429 by the client's token bucket
+    rate_limited: int = 0
+    queue_seconds_total: float = 0.0
+    queue_seconds_max: float = 0.0
+
+
+class MemoryStats(BaseModel):
+    """
+    Bytes of the frames a worker is loading and caching (see
+    tsapi.memory_budget), against its budget.
+    """
+    budget_bytes: int = 0
+    in_flight_bytes: int = 0
+    peak_bytes: int = 0
+    largest_bytes: int = 0
+    waiting: int = 0
+    admitted: int = 0
+    # Had to wait for memory
+    queued: int = 0
+    # Rejected with 503 after waiting too long
+    rejected: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+
+class AdmissionReport(BaseModel):
+    """
+    Admission counters of a worker, with its parquet loads and frame memory.
+    """
+    route_classes: list[AdmissionStats] = []
+    parquet_loads_waiting: int = 0
+    memory: MemoryStats = MemoryStats()
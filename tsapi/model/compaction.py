@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+
+
+class CompactionReport(BaseModel):
+    """
+    The storage and load-time savings of compacting a dataset at ingest.
+    """
+    original_bytes: int
+    compacted_bytes: int
+    original_load_seconds: float
+    compacted_load_seconds: float
+    # Columns whose type changed, with the new type
+    dtypes: dict[str, str] = {}
+    # Whether the rows had to be sorted by timestamp
+    sorted: bool = False
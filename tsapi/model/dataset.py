@@ -1,18 +1,46 @@
+import asyncio
 import io
-import os
-from typing import Optional, Self
+from datetime import datetime
+from typing import BinaryIO, Literal, Optional, Self
 
 import polars as pl
 from pydantic import BaseModel
 
+from tsapi.column_stats import dataset_stats, split_columns
+from tsapi.compaction import compact_dataset
+from tsapi.csv_import import WidenColumns, import_csv
 from tsapi.errors import TsApiNoTimestampError
 from tsapi.frequency import check_time_series
-from tsapi.dataset_storage import load_async, load_csv_async, delete_dataset_from_storage
+from tsapi.model.compaction import CompactionReport
+from tsapi.model.stats import DatasetStats
+from tsapi.seasonality import dataset_periods
+from tsapi.dataset_storage import DatasetStorage
 
 
 class DatasetRequest(BaseModel):
     name: str
     upload_type: str
+    # Downcast, encode and sort the dataset when it is stored
+    compact: bool = False
+    # Let compaction store Float64 columns as Float32 even if that loses precision
+    allow_float32: bool = False
+
+
+class Operation(BaseModel):
+    """
+    A derived-series operation.  Only the parameters relevant to `op` are used:
+    rolling (window, agg), diff and pct_change (periods), resample (every, agg),
+    ewm (span or alpha) and zscore (none).  If `columns` is empty the
+    operation applies to the opset series.
+    """
+    op: Literal['rolling', 'diff', 'pct_change', 'resample', 'zscore', 'ewm']
+    columns: list[str] = []
+    window: Optional[int] = None
+    periods: int = 1
+    every: Optional[str] = None
+    agg: str = 'mean'
+    span: Optional[float] = None
+    alpha: Optional[float] = None
 
 
 class OperationSet(BaseModel):
@@ -22,6 +50,14 @@ class OperationSet(BaseModel):
     offset: int = 0
     limit: int = 1000
     dependent: Optional[str] = None
+    operations: list[Operation] = []
+    # One of the dataset other_cols, for datasets holding many series (e.g. stocks)
+    group_by: Optional[str] = None
+    # Seasonal periods of derived or grouped series, detected on first forecast
+    periods: dict[str, list[int]] = {}
+    # Bumped whenever the opset is updated
+    version: int = 1
+    updated_at: Optional[datetime] = None
 
 
 class DataSet(BaseModel):
@@ -35,17 +71,26 @@ class DataSet(BaseModel):
     other_cols: list[str] = []
     ops: list[OperationSet] = []
     conditions: list[str] = []
+    stats: Optional[DatasetStats] = None
+    periods: dict[str, list[int]] = {}
+    compaction: Optional[CompactionReport] = None
+    # Bumped whenever the dataset contents change
+    version: int = 1
+    updated_at: Optional[datetime] = None
 
-    def load(self, data_dir) -> pl.DataFrame:
-        return pl.read_parquet(os.path.join(data_dir, self.file_name))
+    def load(self, storage: DatasetStorage) -> pl.DataFrame:
+        return storage.read_parquet(self.file_name)
 
-    async def load_async(self, data_dir: str) -> pl.DataFrame:
-        """Reads a Parquet file asynchronously using Polars."""
-        df = await load_async(os.path.join(data_dir, self.file_name))
+    async def load_async(self, storage: DatasetStorage, offset: int = 0, limit: int = None) -> pl.DataFrame:
+        """
+        Reads rows offset to offset + limit of the dataset asynchronously.  Only
+        the parquet row groups holding those rows are fetched.
+        """
+        df = await storage.load_async(self.file_name, offset, limit)
         return df
 
-    async def delete(self, data_dir, logger):
-        return await delete_dataset_from_storage(os.path.join(data_dir, f'{self.name}.parquet'), logger)
+    async def delete(self, storage: DatasetStorage, logger):
+        return await storage.delete(self.file_name, logger)
 
     @property
     def tscol(self):
@@ -56,57 +101,83 @@ class DataSet(BaseModel):
         return f'{self.name}.parquet'
 
     @staticmethod
-    def from_dataframe(dataframe: pl.DataFrame, name: str):
-        """ Extract metadata from columns and dtypes and also rename empty columns """
-
-        series = []
-        times = []
-        others = []
-
-        for col, value in dataframe.schema.items():
-            if value.is_numeric():
-                series.append(col)
-            elif value.is_temporal():
-                times.append(col)
-            else:
-                others.append(col)
+    def from_dataframe(dataframe: pl.DataFrame, name: str, stats: DatasetStats = None):
+        """
+        Extract metadata from columns and dtypes.  With stats, the dataframe is
+        only the head of the dataset (see tsapi.csv_import), and its conditions
+        and periods are detected from that.
+        """
+        series, times, others = split_columns(dataframe.schema)
 
         if len(times) == 0:
             raise TsApiNoTimestampError("No timestamp columns found")
 
+        conditions = check_time_series(dataframe[times[0]])
+
+        # Repeated timestamps mean the series have to be grouped before they have a season
+        periods = {}
+        if "GroupOrFilter" not in conditions:
+            periods = dataset_periods(dataframe, times[0], series)
+
+        if stats is None:
+            stats = dataset_stats(dataframe, times[0], series)
+
         return DataSet(
             id="abc",
             name=name,
             description='',
             num_series=len(series),
-            max_length=len(dataframe),
+            max_length=stats.rows,
             series_cols=series,
             timestamp_cols=times,
             other_cols=others,
-            conditions=check_time_series(dataframe[times[0]])
+            conditions=conditions,
+            stats=stats,
+            periods=periods
         )
 
     @classmethod
-    async def build(cls, name: str, data_dir: str) -> Self:
+    async def build(
+            cls, name: str, storage: DatasetStorage, compact: bool = False, allow_float32: bool = False
+    ) -> Self:
         """
-        Build a DataSet object from a parquet file.
+        Build a DataSet object from a parquet file, compacting the file if asked.
         """
-        df = await load_async(os.path.join(data_dir, f'{name}.parquet'))
-        return DataSet.from_dataframe(df, name)
+        df = await storage.load_async(f'{name}.parquet')
+        dataset = DataSet.from_dataframe(df, name)
+        if compact:
+            await asyncio.to_thread(write_dataset, dataset, df, storage, compact, allow_float32)
+        return dataset
 
     @classmethod
-    async def import_csv(cls, name: str, data_dir: str) -> Self:
+    async def import_csv(
+            cls, name: str, storage: DatasetStorage, logger, compact: bool = False, allow_float32: bool = False
+    ) -> Self:
         """
         Import a dataset from a CSV file and convert it to parquet format.
-        This function will also rename any blank columns in the dataframe.
+        Blank columns are renamed.
         """
-        source_file_name = os.path.join(data_dir, f'{name}.csv')
-        df = await load_csv_async(source_file_name)
-        df = rename_blank_columns(df)
+        def convert():
+            with storage.store.open(f'{name}.csv') as source:
+                return convert_csv(name, storage, source, logger, compact, allow_float32)
 
-        df.write_parquet(os.path.join(data_dir, f'{name}.parquet'))
+        return await asyncio.to_thread(convert)
 
-        return DataSet.from_dataframe(df, name)
+
+def write_dataset(
+        dataset: DataSet, df: pl.DataFrame, storage: DatasetStorage, compact: bool = False, allow_float32: bool = False
+):
+    """
+    Write the dataset parquet file.  With compact, it is downcast, encoded and
+    sorted first, and the savings are recorded on the dataset.
+    """
+    if not compact:
+        storage.write_parquet(dataset.file_name, df)
+        return
+
+    _, data, report = compact_dataset(df, dataset.tscol, dataset.other_cols, allow_float32)
+    storage.store.write(dataset.file_name, data)
+    dataset.compaction = report
 
 
 def rename_blank_columns(df: pl.DataFrame):
@@ -119,20 +190,22 @@ def rename_blank_columns(df: pl.DataFrame):
     return df
 
 
-def store_dataset(name: str, data_dir: str, data: bytes, upload_type: str, logger):
+def store_dataset(name: str, storage: DatasetStorage, data: bytes, upload_type: str, logger):
     try:
         if upload_type == 'add':
             df = pl.read_parquet(io.BytesIO(data))
-            df.write_parquet(os.path.join(data_dir, f'{name}.parquet'))
+            storage.write_parquet(f'{name}.parquet', df)
         else:
-            df = pl.read_csv(io.BytesIO(data))
-            df.write_csv(os.path.join(data_dir, f'{name}.csv'))
+            # Stored as is, it is parsed when the dataset is imported
+            storage.store.write(f'{name}.csv', data)
     except Exception as e:
         logger.error(f"Error reading data: {e}")
         raise e
 
 
-def save_dataset(name: str, data_dir: str, data: bytes, logger):
+def save_dataset(
+        name: str, storage: DatasetStorage, data: bytes, logger, compact: bool = False, allow_float32: bool = False
+):
     try:
         df_parquet = pl.read_parquet(io.BytesIO(data))
     except Exception as e:
@@ -141,23 +214,63 @@ def save_dataset(name: str, data_dir: str, data: bytes, logger):
 
     df_parquet = rename_blank_columns(df_parquet)
     dataset = DataSet.from_dataframe(df_parquet, name)
-    df_parquet.write_parquet(os.path.join(data_dir, dataset.file_name))
+    write_dataset(dataset, df_parquet, storage, compact, allow_float32)
 
     return dataset
 
 
-def save_dataset_source(name: str, data_dir: str, data: bytes):
-    """ When a new CSV files is imported, this will save the original and
-        then attempt to convert it into a parquet file.
+def convert_csv(
+        name: str, storage: DatasetStorage, source: BinaryIO, logger, compact: bool = False,
+        allow_float32: bool = False
+) -> DataSet:
+    """
+    Convert a CSV file to the dataset parquet file, streamed from source to
+    the store, so neither file is in memory whole.  Malformed rows are
+    skipped and saved to <name>_rejected.csv.  If integer columns have
+    fractions further on, the file is converted again with them as floats.
+    Compaction sorts the whole dataset, so with compact the converted file
+    is read back.
     """
-    source_file_name = os.path.join(data_dir, f'{name}_source.csv')
-    with open(source_file_name, 'wb') as f:
-        f.write(data)
+    file_name = f'{name}.parquet'
+    float_columns = []
+    while True:
+        try:
+            with storage.store.open_write(file_name) as sink:
+                result = import_csv(source, sink, float_columns=float_columns)
+            break
+        except WidenColumns as e:
+            # Rare, the head of the file only had integers in them.  The aborted write isn't saved.
+            logger.info("Widening integer columns", name=name, columns=e.columns)
+            float_columns += e.columns
+            source.seek(0)
+    logger.info(
+        "Converted CSV", name=name, rows=result.rows, rejected_rows=result.rejected_rows,
+        seconds=round(result.seconds, 3), rows_per_second=round(result.rows_per_second)
+    )
+
+    rejected_name = f'{name}_rejected.csv'
+    if result.rejected is not None:
+        storage.store.write(rejected_name, result.rejected)
+    else:
+        # Any left from an earlier upload of the dataset
+        try:
+            storage.store.delete(rejected_name)
+        except FileNotFoundError:
+            pass
+
+    dataset = DataSet.from_dataframe(result.head, name, result.stats)
+    if compact:
+        write_dataset(dataset, storage.read_parquet(file_name), storage, compact, allow_float32)
 
-    df = pl.read_csv(source_file_name, has_header=True, try_parse_dates=True)
+    return dataset
 
-    df = rename_blank_columns(df)
-    dataset = DataSet.from_dataframe(df, name)
-    df.write_parquet(os.path.join(data_dir, dataset.file_name))
 
-    return dataset
+def save_dataset_source(
+        name: str, storage: DatasetStorage, data: bytes, logger, compact: bool = False, allow_float32: bool = False
+):
+    """ When a new CSV files is imported, this will save the original and
+        then attempt to convert it into a parquet file.
+    """
+    storage.store.write(f'{name}_source.csv', data)
+
+    return convert_csv(name, storage, io.BytesIO(data), logger, compact, allow_float32)
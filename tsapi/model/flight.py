@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class FlightRequest(BaseModel):
+    """
+    What a Flight client asks for, as the JSON command of its descriptor:
+    a dataset by name, or an opset by id, optionally limited to some columns
+    and to timestamps in [start, end).
+    """
+    dataset: Optional[str] = None
+    opset: Optional[str] = None
+    columns: Optional[list[str]] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+
+class FlightTicket(BaseModel):
+    """
+    One of the parallel streams of a request: a range of row groups of the
+    dataset file, as it was when the flight info was made.
+    """
+    request: FlightRequest
+    name: str
+    version: str
+    row_groups: list[int] = []
+    # The rows of the file in the request, the opset window for opsets
+    start_row: int = 0
+    end_row: int
+    columns: list[str]
+    # Read the whole window and apply the opset operations
+    operations: bool = False
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from datetime import datetime
+
+from pydantic import BaseModel, Field
 
 from tsapi.model.time_series import TimeRecord
 
@@ -14,6 +16,43 @@ class ForecastResponse(BaseModel):
 class ForecastRequest(BaseModel):
     opset_id: str
     series_id: str
-    horizon: int = 10
+    horizon: int = Field(10, gt=0)
+    # The prediction interval, e.g. 0.95 for 95 %
+    level: float = Field(0.95, gt=0, lt=1)
+    # For grouped opsets, forecast only this group (otherwise every group)
+    group: str | None = None
     model: str = "default"
     model_version: str = "1.0.0"
+
+
+class BacktestRequest(BaseModel):
+    opset_id: str
+    series_id: str
+    horizon: int = Field(10, gt=0)
+    folds: int = Field(5, gt=0)
+    level: float = Field(0.95, gt=0, lt=1)
+    group: str | None = None
+
+
+class BacktestFold(BaseModel):
+    fold: int
+    train_size: int
+    start: datetime
+    end: datetime
+    # None if the fit failed, with the reason in error
+    mae: float | None = None
+    mape: float | None = None
+    coverage: float | None = None
+    fit_seconds: float | None = None
+    error: str | None = None
+
+
+class BacktestResponse(BaseModel):
+    folds: list[BacktestFold]
+    # Over the folds that didn't fail
+    mae: float | None = None
+    mape: float | None = None
+    coverage: float | None = None
+    compute_seconds: float
+    model: str = "default"
+    error: str | None = None
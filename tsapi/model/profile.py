@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class StageTiming(BaseModel):
+    name: str
+    seconds: float
+
+
+class ProfileReport(BaseModel):
+    """
+    The stage timings of a profiled request.  The flamegraph, if the sampling
+    profiler is installed, is stored alongside in speedscope format.
+    """
+    id: str
+    method: str
+    path: str
+    started_at: datetime
+    seconds: float
+    status_code: Optional[int] = None
+    stages: list[StageTiming] = []
+    # Whether a speedscope file was stored, and the sampling interval it used
+    flamegraph: bool = False
+    interval_seconds: Optional[float] = None
+    # Sampling stopped at the per-request limit before the request finished
+    truncated: bool = False
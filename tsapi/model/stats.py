@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class ColumnStats(BaseModel):
+    name: str
+    dtype: str
+    count: int
+    null_count: int
+    min: float | None = None
+    max: float | None = None
+    mean: float | None = None
+    std: float | None = None
+
+
+class ChunkStats(BaseModel):
+    start: datetime
+    end: datetime
+    rows: int
+    min: dict[str, float | None] = {}
+    max: dict[str, float | None] = {}
+
+
+class DatasetStats(BaseModel):
+    rows: int
+    start: datetime | None = None
+    end: datetime | None = None
+    columns: list[ColumnStats] = []
+    chunks: list[ChunkStats] = []
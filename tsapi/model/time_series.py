@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Union, Dict
+from typing import Union, Dict, Optional
 from pydantic import BaseModel
 
 
@@ -10,7 +10,8 @@ class TimePoint(BaseModel):
 
 class TimeRecord(BaseModel):
     timestamp: datetime
-    data: Dict[str, float]
+    data: Dict[str, Optional[float]]
+    group: Optional[str] = None
 
 
 #
@@ -29,3 +30,32 @@ class TimeSeries(BaseModel):
 
 class TimeSeriesSet(BaseModel):
     series: list[TimeSeries]
+
+
+class AlignedRequest(BaseModel):
+    opset_ids: list[str]
+    # Bucket size (e.g. '1h') for a time-bucketed join, otherwise an as-of join
+    every: Optional[str] = None
+    # Maximum staleness (e.g. '5m') for values in an as-of join
+    tolerance: Optional[str] = None
+
+
+class AlignedTimeSeries(BaseModel):
+    timestamps: list[datetime]
+    series: Dict[str, list[Optional[float]]]
+
+
+class TimeSeriesRefinement(BaseModel):
+    """
+    One line of a progressive time series response.  Each refinement replaces
+    the previous one, the last has final set.
+    """
+    id: str
+    level: int
+    # 'stats' (the dataset chunk statistics), 'sample' (some of the row groups) or 'full'
+    source: str
+    # Fraction of the opset rows the points were computed from
+    fraction: float
+    final: bool = False
+    data: list[TimeRecord] = []
+    error: Optional[str] = None
@@ -1,46 +1,171 @@
+from datetime import datetime, timezone
+
 from bson import ObjectId
 
 import motor.motor_asyncio
 
 
+def utcnow():
+    # MongoDB stores millisecond precision, so truncate to match what gets read back
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
 class MongoClient:
     def __init__(self, settings):
         self.client = motor.motor_asyncio.AsyncIOMotorClient(settings.mdb_url)
         self.db = self.client[settings.mdb_name]
 
+    async def bump_datasets_version(self):
+        """
+        The datasets listing (datasets and their opsets) has a version of its
+        own, so that deletions also change it.
+        """
+        await self.db.meta.update_one(
+            {"_id": "datasets"},
+            {"$inc": {"version": 1}, "$set": {"updated_at": utcnow()}},
+            upsert=True
+        )
+
+    async def get_datasets_version(self):
+        doc = await self.db.meta.find_one({"_id": "datasets"})
+        if doc is None:
+            return 0, None
+        return doc['version'], doc['updated_at']
+
     async def insert_dataset(self, dataset):
+        dataset = {**dataset, "version": 1, "updated_at": utcnow()}
         result = await self.db.datasets.insert_one(dataset)
+        await self.bump_datasets_version()
         return str(result.inserted_id)
 
+    async def replace_dataset(self, dataset_id, dataset):
+        """
+        Replace a re-ingested dataset in place, keeping its id and opsets.  Its
+        version is incremented, so what was cached of the old file isn't used.
+        """
+        dataset = {k: v for k, v in dataset.items() if k not in ("id", "version")}
+        result = await self.db.datasets.update_one(
+            {"_id": ObjectId(dataset_id)},
+            {"$set": {**dataset, "updated_at": utcnow()}, "$inc": {"version": 1}}
+        )
+        await self.bump_datasets_version()
+        return result.matched_count
+
+    async def save_dataset(self, dataset):
+        """
+        Insert a dataset, or replace the one with its name (the file of which
+        has just been overwritten).
+
+        :return: The dataset id
+        """
+        existing = await self.db.datasets.find_one({"name": dataset["name"]}, {"_id": 1})
+        if existing is None:
+            return await self.insert_dataset(dataset)
+
+        dataset_id = str(existing["_id"])
+        await self.replace_dataset(dataset_id, dataset)
+        return dataset_id
+
     async def get_datasets(self):
-        cursor = self.db.datasets.find({})
+        # The statistics can be large, so they're only returned by get_dataset_stats
+        cursor = self.db.datasets.find({}, {"stats": 0})
         docs = [doc for doc in await cursor.to_list(length=100)]
         for doc in docs:
             doc['id'] = str(doc['_id'])
             doc['ops'] = await self.get_opsets_for_dataset(doc['id'])
         return docs
 
+    async def get_all_datasets(self):
+        """
+        Every dataset (without its stats) and its opsets, for maintenance tasks
+        that can't stop at a page of datasets.
+        """
+        datasets = await self.db.datasets.find({}, {"stats": 0}).to_list(length=None)
+        opsets = await self.db.opsets.find({}).to_list(length=None)
+
+        by_dataset = {}
+        for ops in opsets:
+            if ops['id'] is None or ops['id'] == '0':
+                ops['id'] = str(ops['_id'])
+            by_dataset.setdefault(ops['dataset_id'], []).append(ops)
+
+        for doc in datasets:
+            doc['id'] = str(doc['_id'])
+            doc['ops'] = by_dataset.get(doc['id'], [])
+        return datasets
+
     async def get_dataset(self, dataset_id):
+        if not ObjectId.is_valid(dataset_id):
+            return None
         doc = await self.db.datasets.find_one({"_id": ObjectId(dataset_id)})
+        if doc is None:
+            return None
         doc['id'] = str(doc['_id'])
         return doc
 
+    async def get_dataset_stats(self, dataset_id):
+        if not ObjectId.is_valid(dataset_id):
+            return None
+        doc = await self.db.datasets.find_one({"_id": ObjectId(dataset_id)}, {"stats": 1})
+        if doc is None:
+            return None
+        return doc.get('stats')
+
+    async def update_dataset_periods(self, dataset_id, periods):
+        await self.db.datasets.update_one({"_id": ObjectId(dataset_id)}, {"$set": {"periods": periods}})
+        # The periods are part of the datasets listing
+        await self.bump_datasets_version()
+
+    async def update_dataset_metadata(self, dataset_id, metadata):
+        """
+        Replace metadata derived from the dataset file (e.g. stats), which
+        doesn't change its contents or version.
+        """
+        await self.db.datasets.update_one({"_id": ObjectId(dataset_id)}, {"$set": metadata})
+        await self.bump_datasets_version()
+
     async def get_dataset_by_name(self, name):
         doc = await self.db.datasets.find_one({"name": name})
+        if doc is None:
+            return None
         doc['id'] = str(doc['_id'])
         return doc
 
     async def delete_dataset(self, dataset_id):
         _ = await self.db.opsets.delete_many({"dataset_id": dataset_id})
         result = await self.db.datasets.delete_one({"_id": ObjectId(dataset_id)})
+        await self.bump_datasets_version()
+        return result.deleted_count
+
+    async def delete_orphan_opsets(self, dry_run=False):
+        """
+        Delete the opsets of datasets that no longer exist.
+
+        :return: The number of orphaned opsets
+        """
+        dataset_ids = [str(doc['_id']) for doc in await self.db.datasets.find({}, {"_id": 1}).to_list(length=None)]
+        orphans = {"dataset_id": {"$nin": dataset_ids}}
+        if dry_run:
+            return await self.db.opsets.count_documents(orphans)
+
+        result = await self.db.opsets.delete_many(orphans)
+        if result.deleted_count:
+            await self.bump_datasets_version()
         return result.deleted_count
 
     async def insert_opset(self, opset):
+        opset = {**opset, "version": 1, "updated_at": utcnow()}
         result = await self.db.opsets.insert_one(opset)
+        await self.bump_datasets_version()
         return str(result.inserted_id)
 
     async def get_opset(self, opset_id):
+        if not ObjectId.is_valid(opset_id):
+            return None
         doc = await self.db.opsets.find_one({"_id": ObjectId(opset_id)})
+        if doc is None:
+            return None
 
         if doc['id'] is None or doc['id'] == '0':
             doc['id'] = str(doc['_id'])
@@ -55,7 +180,17 @@ class MongoClient:
         return opsets
 
     async def update_opset(self, opset_id, opset):
+        curr_opset = await self.db.opsets.find_one({"_id": ObjectId(opset_id)}, {"version": 1})
+        if curr_opset is None:
+            return None
+
+        opset = {**opset, "version": curr_opset.get("version", 1) + 1, "updated_at": utcnow()}
         result = await self.db.opsets.replace_one({"_id": ObjectId(opset_id)}, opset)
         if result.matched_count == 0:
             return None
+        await self.bump_datasets_version()
         return await self.get_opset(opset_id)
+
+    async def update_opset_periods(self, opset_id, periods):
+        await self.db.opsets.update_one({"_id": ObjectId(opset_id)}, {"$set": {"periods": periods}})
+        await self.bump_datasets_version()
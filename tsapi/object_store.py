@@ -0,0 +1,290 @@
+import io
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import BinaryIO, NamedTuple
+
+
+class ObjectInfo(NamedTuple):
+    size: int
+    # Changes whenever the object is rewritten, so it can be part of cache keys
+    version: str
+
+
+@contextmanager
+def replace_file(path: str):
+    """
+    A file to write path through.  It is written under a unique temporary name
+    in the same directory and renamed into place if the block succeeds, so
+    readers and other writers (threads or processes) never see a partly
+    written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f'{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class ObjectStore(ABC):
+    """
+    Where dataset files are kept.  Objects are named relative to the store,
+    e.g. 'sales.parquet', and can be read in byte ranges so that parquet
+    files don't have to be downloaded whole.
+    """
+
+    @abstractmethod
+    def stat(self, name: str) -> ObjectInfo:
+        """
+        :raises FileNotFoundError: If there is no such object
+        """
+
+    @abstractmethod
+    def read_range(self, name: str, start: int, length: int, version: str = None) -> bytes:
+        """
+        Read length bytes from start.  With version, the read fails rather than
+        returning bytes of a newer object, where the store supports that.
+        """
+
+    @abstractmethod
+    def write(self, name: str, data: bytes):
+        pass
+
+    @abstractmethod
+    def delete(self, name: str):
+        """
+        :raises FileNotFoundError: If there is no such object
+        """
+
+    @contextmanager
+    def open_write(self, name: str):
+        """
+        A file to write an object through, for objects too large to hold in
+        memory.  The object is only replaced if the block succeeds.
+        """
+        buffer = io.BytesIO()
+        yield buffer
+        self.write(name, buffer.getvalue())
+
+    def read(self, name: str) -> bytes:
+        info = self.stat(name)
+        return self.read_range(name, 0, info.size, info.version)
+
+    def exists(self, name: str) -> bool:
+        try:
+            self.stat(name)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def open(self, name: str) -> BinaryIO:
+        return RangeFile(self, name, self.stat(name))
+
+    def local_path(self, name: str) -> str | None:
+        """The path of the object if it is a local file, which readers can open themselves."""
+        return None
+
+
+class RangeFile(io.RawIOBase):
+    """
+    A read-only file over an object, where each read is a ranged read of the
+    store.  Parquet readers seek to the footer and then to the column chunks
+    they need, so only those bytes are transferred.
+    """
+
+    def __init__(self, store: ObjectStore, name: str, info: ObjectInfo):
+        super().__init__()
+        self.store = store
+        self.name = name
+        self.info = info
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.info.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self.info.size - self.position)
+        if length <= 0:
+            return 0
+
+        data = self.store.read_range(self.name, self.position, length, self.info.version)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def readall(self) -> bytes:
+        return self.read(self.info.size - self.position)
+
+    def size(self) -> int:
+        return self.info.size
+
+
+class LocalStore(ObjectStore):
+    """
+    Objects are files in a directory, e.g. a mounted volume in production or
+    data_dir when running locally.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def stat(self, name: str) -> ObjectInfo:
+        st = os.stat(self.path(name))
+        return ObjectInfo(st.st_size, f'{st.st_mtime_ns}-{st.st_size}')
+
+    def read_range(self, name: str, start: int, length: int, version: str = None) -> bytes:
+        with open(self.path(name), 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+
+    def open(self, name: str) -> BinaryIO:
+        # The file itself, ranged reads are only worth it for remote objects
+        return open(self.path(name), 'rb')
+
+    def local_path(self, name: str) -> str | None:
+        return self.path(name)
+
+    def write(self, name: str, data: bytes):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with replace_file(path) as f:
+            f.write(data)
+
+    @contextmanager
+    def open_write(self, name: str):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with replace_file(path) as f:
+            yield f
+
+    def delete(self, name: str):
+        os.remove(self.path(name))
+
+
+class GCSStore(ObjectStore):
+    """
+    Objects are blobs under a prefix of a Google Cloud Storage bucket.  The
+    client honours STORAGE_EMULATOR_HOST, so this also runs against a local
+    emulator such as fake-gcs-server.
+    """
+
+    def __init__(self, bucket_name: str, prefix: str = ''):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        with self._lock:
+            if self._bucket is None:
+                # Imported here because it is slow to import and only needed with GCS
+                from google.cloud import storage
+
+                self._bucket = storage.Client().bucket(self.bucket_name)
+            return self._bucket
+
+    def blob_name(self, name: str) -> str:
+        return f'{self.prefix}{name}'
+
+    def stat(self, name: str) -> ObjectInfo:
+        blob = self.bucket.get_blob(self.blob_name(name))
+        if blob is None:
+            raise FileNotFoundError(f"No object '{self.blob_name(name)}' in bucket '{self.bucket_name}'")
+        return ObjectInfo(blob.size, str(blob.generation))
+
+    def read_range(self, name: str, start: int, length: int, version: str = None) -> bytes:
+        # Pinning the generation keeps the ranges of one read consistent if the blob is replaced
+        generation = int(version) if version is not None else None
+        blob = self.bucket.blob(self.blob_name(name), generation=generation)
+        # The end of the range is inclusive
+        return blob.download_as_bytes(start=start, end=start + length - 1)
+
+    def write(self, name: str, data: bytes):
+        self.bucket.blob(self.blob_name(name)).upload_from_string(data, content_type='application/octet-stream')
+
+    @contextmanager
+    def open_write(self, name: str):
+        # A resumable upload, sent a chunk at a time.  Parquet writers flush, which only the close can do.
+        f = self.bucket.blob(self.blob_name(name)).open(
+            'wb', ignore_flush=True, content_type='application/octet-stream'
+        )
+        # Without the close the upload is never finished, so the object isn't replaced
+        yield f
+        f.close()
+
+    def delete(self, name: str):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.bucket.blob(self.blob_name(name)).delete()
+        except NotFound:
+            raise FileNotFoundError(f"No object '{self.blob_name(name)}' in bucket '{self.bucket_name}'")
+
+
+class MemoryStore(ObjectStore):
+    """
+    Objects kept in memory, for tests.  Every ranged read is recorded so tests
+    can check how much of an object was transferred.
+    """
+
+    def __init__(self):
+        self.objects: dict[str, tuple[bytes, str]] = {}
+        self.reads: list[tuple[str, int, int]] = []
+        self._generation = 0
+
+    def stat(self, name: str) -> ObjectInfo:
+        if name not in self.objects:
+            raise FileNotFoundError(name)
+        data, version = self.objects[name]
+        return ObjectInfo(len(data), version)
+
+    def read_range(self, name: str, start: int, length: int, version: str = None) -> bytes:
+        if name not in self.objects:
+            raise FileNotFoundError(name)
+        data, current = self.objects[name]
+        if version is not None and version != current:
+            raise FileNotFoundError(f"{name} version {version} has been replaced")
+        self.reads.append((name, start, length))
+        return data[start:start + length]
+
+    def write(self, name: str, data: bytes):
+        self._generation += 1
+        self.objects[name] = (bytes(data), str(self._generation))
+
+    def delete(self, name: str):
+        if name not in self.objects:
+            raise FileNotFoundError(name)
+        del self.objects[name]
+
+    @property
+    def bytes_read(self) -> int:
+        return sum(length for _, _, length in self.reads)
@@ -0,0 +1,127 @@
+import polars as pl
+
+from tsapi.errors import TsApiOperationError
+from tsapi.model.dataset import Operation
+
+ROLLING_AGGS = {'mean', 'sum', 'min', 'max', 'std', 'median'}
+RESAMPLE_AGGS = {'mean', 'sum', 'min', 'max', 'first', 'last', 'median'}
+
+
+def _target_columns(op: Operation, series_ids: list[str], schema: pl.Schema) -> list[str]:
+    columns = op.columns or series_ids or [col for col, dtype in schema.items() if dtype.is_numeric()]
+
+    missing = [col for col in columns if col not in schema]
+    if missing:
+        raise TsApiOperationError(f"Unknown columns for {op.op}: {missing}")
+
+    return columns
+
+
+def _finite(expr: pl.Expr) -> pl.Expr:
+    # NaN and inf (e.g. pct_change from zero) can't be serialized, so make them nulls
+    return pl.when(expr.is_finite()).then(expr)
+
+
+def _rolling(col: pl.Expr, op: Operation) -> pl.Expr:
+    if op.window is None or op.window < 1:
+        raise TsApiOperationError("rolling requires a positive window")
+    if op.agg not in ROLLING_AGGS:
+        raise TsApiOperationError(f"Unsupported rolling aggregation: {op.agg}")
+    return getattr(col, f'rolling_{op.agg}')(window_size=op.window)
+
+
+def _ewm(col: pl.Expr, op: Operation) -> pl.Expr:
+    if op.span is None and op.alpha is None:
+        raise TsApiOperationError("ewm requires span or alpha")
+    return col.ewm_mean(span=op.span, alpha=op.alpha)
+
+
+def _zscore(col: pl.Expr, op: Operation) -> pl.Expr:
+    return (col - col.mean()) / col.std()
+
+
+COLUMN_OPS = {
+    'rolling': _rolling,
+    'diff': lambda col, op: col.diff(op.periods),
+    'pct_change': lambda col, op: col.pct_change(op.periods),
+    'zscore': _zscore,
+    'ewm': _ewm,
+}
+
+
+def _resample(
+        lf: pl.LazyFrame, op: Operation, tscol: str, columns: list[str], group_col: str = None
+) -> pl.LazyFrame:
+    if op.every is None:
+        raise TsApiOperationError("resample requires an interval ('every')")
+    if op.agg not in RESAMPLE_AGGS:
+        raise TsApiOperationError(f"Unsupported resample aggregation: {op.agg}")
+
+    if group_col is not None:
+        lf = lf.sort(group_col, tscol)
+    else:
+        lf = lf.sort(tscol)
+
+    return (
+        lf.group_by_dynamic(tscol, every=op.every, group_by=group_col)
+        .agg(getattr(pl.col(columns), op.agg)())
+    )
+
+
+def build_query(
+        lf: pl.LazyFrame,
+        operations: list[Operation],
+        tscol: str,
+        series_ids: list[str],
+        group_col: str = None
+) -> pl.LazyFrame:
+    """
+    Compile the opset operations into a single lazy query.  Operations are
+    applied in order and replace the values of the columns they target, so
+    the opset series ids still refer to the (derived) series.  If there is a
+    group column, each operation is applied to each group separately.
+    """
+    schema = lf.collect_schema()
+
+    if group_col is not None:
+        # Window operations over groups need each group in time order
+        lf = lf.sort(group_col, tscol)
+
+    for op in operations:
+        if op.op == 'resample':
+            # Resampling changes the rows, so every numeric column has to be aggregated
+            numeric_cols = [col for col, dtype in schema.items() if dtype.is_numeric() and col != group_col]
+            lf = _resample(lf, op, tscol, numeric_cols, group_col)
+        elif op.op in COLUMN_OPS:
+            columns = _target_columns(op, series_ids, schema)
+            exprs = [COLUMN_OPS[op.op](pl.col(col).cast(pl.Float64), op) for col in columns]
+            if group_col is not None:
+                exprs = [expr.over(group_col) for expr in exprs]
+            lf = lf.with_columns(_finite(expr).alias(col) for expr, col in zip(exprs, columns))
+        else:
+            raise TsApiOperationError(f"Unsupported operation: {op.op}")
+
+        schema = lf.collect_schema()
+
+    return lf
+
+
+def apply_operations(
+        df: pl.DataFrame,
+        operations: list[Operation],
+        tscol: str,
+        series_ids: list[str],
+        group_col: str = None
+) -> pl.DataFrame:
+    """
+    :raises TsApiOperationError: If the operations can't be applied, e.g. an
+        invalid interval or a column that isn't numeric
+    """
+    if len(operations) == 0:
+        return df
+
+    try:
+        return build_query(df.lazy(), operations, tscol, series_ids, group_col).collect()
+    except (pl.exceptions.PolarsError, ValueError) as e:
+        # Polars validates most parameters only when the query is built or run
+        raise TsApiOperationError(f"Invalid operation: {e}") from e
@@ -0,0 +1,255 @@
+import asyncio
+import hmac
+import re
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import cache
+from urllib.parse import parse_qs
+
+import structlog
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from tsapi.dataset_storage import get_storage
+from tsapi.model.profile import ProfileReport, StageTiming
+from tsapi.object_store import ObjectStore
+
+# The sampling profiler is optional (pip install tsapi[profiling]), stage timings are always recorded.
+# It is only imported when a request is first profiled.
+@cache
+def load_profiler():
+    """
+    :return: The pyinstrument Profiler and SpeedscopeRenderer classes, or None if it isn't installed
+    """
+    try:
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+    except ImportError:
+        return None
+    return Profiler, SpeedscopeRenderer
+
+
+PROFILE_PREFIX = 'profiles/'
+
+PROFILED_ROUTES = [
+    ('GET', re.compile(r'^/tsapi/v1/tsop/[^/]+$')),
+    ('POST', re.compile(r'^/tsapi/v1/forecast$')),
+]
+
+_profile: ContextVar['RequestProfile | None'] = ContextVar('tsapi_profile', default=None)
+
+
+def report_name(profile_id: str) -> str:
+    return f'{PROFILE_PREFIX}{profile_id}.json'
+
+
+def speedscope_name(profile_id: str) -> str:
+    return f'{PROFILE_PREFIX}{profile_id}.speedscope.json'
+
+
+class RequestProfile:
+
+    def __init__(self, scope: Scope):
+        self.id = uuid.uuid4().hex
+        self.method = scope['method']
+        self.path = scope['path']
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.stages: list[StageTiming] = []
+        self.status_code = None
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a stage of the request, if it is being profiled.
+    """
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.stages.append(StageTiming(name=name, seconds=time.perf_counter() - start))
+
+
+class ProfileBudget:
+    """
+    Limits the profiling overhead of a worker: one profile at a time, at most
+    max_per_minute of them and at most max_fraction of the last minute spent
+    in profiled requests.
+    """
+
+    def __init__(self, max_per_minute: int, max_fraction: float, window_seconds: float = 60.0):
+        self.max_per_minute = max_per_minute
+        self.max_fraction = max_fraction
+        self.window_seconds = window_seconds
+        # End time and duration of the recent profiles
+        self.recent = deque()
+        self.active = False
+
+    def try_start(self, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        while self.recent and self.recent[0][0] < now - self.window_seconds:
+            self.recent.popleft()
+
+        if (
+            self.active
+            or len(self.recent) >= self.max_per_minute
+            or sum(seconds for _, seconds in self.recent) >= self.max_fraction * self.window_seconds
+        ):
+            return False
+        self.active = True
+        return True
+
+    def finish(self, seconds: float, now: float = None):
+        self.recent.append((time.monotonic() if now is None else now, seconds))
+        self.active = False
+
+
+def profile_requested(scope: Scope) -> bool:
+    if scope['type'] != 'http':
+        return False
+    if not any(method == scope['method'] and pattern.match(scope['path']) for method, pattern in PROFILED_ROUTES):
+        return False
+
+    flag = Headers(scope=scope).get('x-profile')
+    if flag is None:
+        flag = parse_qs(scope.get('query_string', b'').decode()).get('profile', [None])[0]
+    return flag is not None and flag.lower() in ('1', 'true')
+
+
+def authorized(scope: Scope, token: str | None) -> bool:
+    """Profiling is disabled unless a token has been configured."""
+    given = Headers(scope=scope).get('x-profile-token')
+    return bool(token) and given is not None and hmac.compare_digest(given.encode(), token.encode())
+
+
+def save_profile(store: ObjectStore, report: ProfileReport, speedscope: str | None):
+    if speedscope is not None:
+        store.write(speedscope_name(report.id), speedscope.encode())
+    store.write(report_name(report.id), report.model_dump_json().encode())
+
+
+class ProfilingMiddleware:
+    """
+    Profile single requests to the tsop and forecast endpoints on request,
+    with an X-Profile: 1 header (or profile=1 in the query) and the profiling
+    token in X-Profile-Token.  The stage timings and the flamegraph are stored
+    under profiles/ in the dataset storage, and the response has the profile
+    id in X-Profile-Id.  Requests over the budget (see ProfileBudget) are
+    served without profiling.
+
+    Options that aren't given are read from the app settings on the first
+    request.
+    """
+
+    def __init__(
+            self, app: ASGIApp, token: str = None, budget: ProfileBudget = None, store: ObjectStore = None,
+            interval_seconds: float = None, max_seconds: float = None, logger=None
+    ):
+        self.app = app
+        self.token = token
+        self.budget = budget
+        self.store = store
+        self.interval_seconds = interval_seconds
+        self.max_seconds = max_seconds
+        self.logger = logger or structlog.get_logger()
+        self.configured = False
+
+    def configure(self, scope: Scope):
+        settings = getattr(scope['app'].state, 'settings', None) if 'app' in scope else None
+
+        if self.token is None:
+            self.token = getattr(getattr(settings, 'secrets', None), 'profile_token', None)
+        if self.budget is None:
+            self.budget = ProfileBudget(settings.profile_max_per_minute, settings.profile_max_fraction)
+        if self.store is None:
+            self.store = get_storage(settings).store
+        if self.interval_seconds is None:
+            self.interval_seconds = settings.profile_interval_ms / 1000
+        if self.max_seconds is None:
+            self.max_seconds = settings.profile_max_seconds
+
+        self.configured = True
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if not self.configured:
+            self.configure(scope)
+
+        if not authorized(scope, self.token):
+            await JSONResponse({'detail': 'Profiling not allowed'}, status_code=403)(scope, receive, send)
+            return
+
+        if not self.budget.try_start():
+            self.logger.info("Profiling budget exceeded", path=scope['path'])
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope)
+
+        async def send_with_id(message: Message):
+            if message['type'] == 'http.response.start':
+                profile.status_code = message['status']
+                MutableHeaders(raw=message['headers'])['X-Profile-Id'] = profile.id
+            await send(message)
+
+        profiler = None
+        timer = None
+        truncated = False
+        classes = load_profiler()
+        if classes is not None:
+            Profiler, SpeedscopeRenderer = classes
+            profiler = Profiler(interval=self.interval_seconds, async_mode='enabled')
+
+            def stop_sampling():
+                nonlocal truncated
+                if profiler.is_running:
+                    profiler.stop()
+                    truncated = True
+
+            profiler.start()
+            timer = asyncio.get_running_loop().call_later(self.max_seconds, stop_sampling)
+
+        context_token = _profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _profile.reset(context_token)
+            seconds = time.perf_counter() - profile.start
+            if profiler is not None:
+                timer.cancel()
+                if profiler.is_running:
+                    profiler.stop()
+            self.budget.finish(seconds)
+
+            report = ProfileReport(
+                id=profile.id,
+                method=profile.method,
+                path=profile.path,
+                started_at=profile.started_at,
+                seconds=seconds,
+                status_code=profile.status_code,
+                stages=profile.stages,
+                flamegraph=profiler is not None,
+                interval_seconds=self.interval_seconds if profiler is not None else None,
+                truncated=truncated,
+            )
+            try:
+                speedscope = profiler.output(renderer=SpeedscopeRenderer()) if profiler is not None else None
+                await asyncio.to_thread(save_profile, self.store, report, speedscope)
+                self.logger.info("Saved profile", profile_id=profile.id, path=profile.path, seconds=seconds)
+            except Exception as e:
+                self.logger.error("Saving profile failed", profile_id=profile.id, error=str(e))
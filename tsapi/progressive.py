@@ -0,0 +1,179 @@
+import asyncio
+from datetime import datetime
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from tsapi.constants import MAX_POINTS
+from tsapi.dataset_cache import DatasetCache
+from tsapi.dataset_storage import DatasetStorage
+from tsapi.frequency import adjust_frequency
+from tsapi.model.dataset import DataSet, OperationSet
+from tsapi.model.time_series import TimeRecord, TimeSeriesRefinement
+
+# Row group strides of the sampled refinements, coarsest first.  Each level
+# reads only the row groups the previous ones haven't.
+SAMPLE_STRIDES = [16, 4]
+
+
+def time_records(df: pl.DataFrame, tscol: str, opset: OperationSet) -> list[TimeRecord]:
+    return [
+        TimeRecord(
+            timestamp=x[tscol],
+            data={k: x[k] for k in opset.series_ids},
+            group=str(x[opset.group_by]) if opset.group_by is not None else None
+        )
+        for x in df.iter_rows(named=True)
+    ]
+
+
+def stats_preview(dataset: DataSet, opset: OperationSet) -> pl.DataFrame | None:
+    """
+    A point per chunk of the dataset statistics overlapping the opset window,
+    at the middle of the chunk's range.  Derived and grouped series aren't
+    summarized, so they have no preview.
+    """
+    if opset.operations or opset.group_by is not None or dataset.stats is None or not dataset.stats.chunks:
+        return None
+    if any(col not in dataset.stats.chunks[0].min for col in opset.series_ids):
+        return None
+
+    end = opset.offset + opset.limit
+    timestamps: list[datetime] = []
+    values = {col: [] for col in opset.series_ids}
+    row = 0
+    for chunk in dataset.stats.chunks:
+        if row < end and row + chunk.rows > opset.offset:
+            timestamps.append(chunk.start)
+            for col in opset.series_ids:
+                low, high = chunk.min[col], chunk.max[col]
+                values[col].append(None if low is None or high is None else (low + high) / 2)
+        row += chunk.rows
+
+    if not timestamps:
+        return None
+    return pl.DataFrame({dataset.tscol: timestamps, **values}, schema_overrides={col: pl.Float64 for col in values})
+
+
+def window_row_groups(metadata: pq.FileMetaData, offset: int, limit: int) -> list[tuple[int, int]]:
+    """
+    :return: The index and first row of the row groups holding rows offset to offset + limit
+    """
+    end = min(offset + limit, metadata.num_rows)
+    row_groups = []
+    row = 0
+    for i in range(metadata.num_row_groups):
+        num_rows = metadata.row_group(i).num_rows
+        if row < end and row + num_rows > offset:
+            row_groups.append((i, row))
+        row += num_rows
+    return row_groups
+
+
+class RowGroupSampler:
+    """
+    Reads the row groups of an opset window a stride at a time, keeping the
+    ones already read, so that the last (stride 1) has the whole window.  All
+    the columns are read, since the whole window is cached for the opset.
+    """
+
+    def __init__(self, storage: DatasetStorage, dataset: DataSet, opset: OperationSet):
+        self.storage = storage
+        self.name = dataset.file_name
+        self.offset = opset.offset
+        self.end = opset.offset + opset.limit
+        self.info, self.metadata = storage.metadata(self.name)
+        self.row_groups = window_row_groups(self.metadata, opset.offset, opset.limit)
+        self.frames: dict[int, pl.DataFrame] = {}
+
+    def read(self, stride: int) -> tuple[pl.DataFrame, float]:
+        """
+        :return: The rows of every stride-th row group in the window, and the fraction of the window they are
+        """
+        for position, (i, first_row) in enumerate(self.row_groups):
+            if position % stride != 0 or i in self.frames:
+                continue
+            df = self.storage.read_row_group(self.name, self.info, self.metadata, i)
+            # Only the part inside the window
+            start = max(self.offset - first_row, 0)
+            self.frames[i] = df.slice(start, self.end - first_row - start)
+
+        frames = [self.frames[i] for i, _ in self.row_groups if i in self.frames]
+        if not frames:
+            return pl.from_arrow(self.metadata.schema.to_arrow_schema().empty_table()), 1.0
+
+        rows = sum(len(df) for df in frames)
+        total = min(self.end, self.metadata.num_rows) - self.offset
+        return pl.concat(frames), rows / max(total, 1)
+
+
+def refine(df: pl.DataFrame, dataset: DataSet, opset: OperationSet, group: str | None, max_points: int):
+    if opset.group_by is not None and group is None:
+        return adjust_frequency(df, dataset.tscol, group_col=opset.group_by, max_points=max_points)
+    return adjust_frequency(df, dataset.tscol, max_points=max_points)
+
+
+async def progressive_refinements(
+        dataset: DataSet,
+        opset: OperationSet,
+        group: str | None,
+        ds_cache: DatasetCache,
+        storage: DatasetStorage,
+        logger,
+        max_points: int = MAX_POINTS
+):
+    """
+    NDJSON lines (see TimeSeriesRefinement) refining the opset time series:
+    first a preview from the dataset statistics, then from a growing sample
+    of the row groups with more points each time, and finally the full
+    result, the same as the non-progressive response.
+    """
+    def line(level, source, fraction, df=None, final=False, error=None):
+        data = [] if df is None else time_records(df, dataset.tscol, opset)
+        return TimeSeriesRefinement(
+            id=opset.id, level=level, source=source, fraction=fraction, final=final, data=data, error=error
+        ).model_dump_json() + '\n'
+
+    level = 0
+    preview = stats_preview(dataset, opset)
+    if preview is not None:
+        yield line(level, 'stats', 0.0, preview)
+        level += 1
+
+    try:
+        key = await ds_cache.opset_key(opset)
+        # Derived series need the whole window, and cached frames are quick to send whole
+        if opset.operations or await ds_cache.get_cached_dataset(key) is not None:
+            if opset.group_by is not None and group is not None:
+                df = await ds_cache.get_operation_set_group(opset, group)
+            else:
+                df = await ds_cache.get_operation_set(opset)
+        else:
+            sampler = await asyncio.to_thread(RowGroupSampler, storage, dataset, opset)
+            estimate = await asyncio.to_thread(storage.estimate_size, dataset.file_name, opset.offset, opset.limit)
+            # The sampled row groups add up to the whole window, which is held until it is cached
+            async with storage.memory.reserve(estimate):
+                for stride in SAMPLE_STRIDES:
+                    if stride >= len(sampler.row_groups):
+                        continue
+                    df, fraction = await asyncio.to_thread(sampler.read, stride)
+                    if group is not None:
+                        df = df.filter(pl.col(opset.group_by).cast(pl.String) == group)
+                    # The sample is spread over the window, so its buckets are about as wide as the full
+                    # result's and it has about fraction as many points
+                    refined = await asyncio.to_thread(refine, df, dataset, opset, group, max_points)
+                    yield line(level, 'sample', fraction, refined)
+                    level += 1
+
+                df, _ = await asyncio.to_thread(sampler.read, 1)
+                await ds_cache.cache_dataset(key, df)
+            if group is not None:
+                df = df.filter(pl.col(opset.group_by).cast(pl.String) == group)
+    except Exception as e:
+        # The response has started, so errors can only be reported in it
+        logger.error("Progressive time series failed", opset_id=opset.id, error=str(e))
+        yield line(level, 'full', 1.0, final=True, error=str(e))
+        return
+
+    yield line(level, 'full', 1.0, await asyncio.to_thread(refine, df, dataset, opset, group, max_points), final=True)
+    logger.info("Sent progressive time series", opset_id=opset.id, levels=level + 1)
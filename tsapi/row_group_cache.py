@@ -0,0 +1,103 @@
+import hashlib
+import os
+import threading
+import time
+
+import polars as pl
+
+from tsapi.object_store import replace_file
+
+SUFFIX = '.arrow'
+
+# The other workers sharing the directory write to it too, so it is scanned at least this often
+SCAN_SECONDS = 60
+
+
+class RowGroupCache:
+    """
+    Parquet row groups fetched from the object store, kept as Arrow IPC files
+    in a local directory and bounded by their total size.  The workers on a
+    host share the directory: entries are written to a temporary file and
+    renamed into place, and a hit touches the file so eviction removes the
+    least recently used entries first.  The directory is only scanned when
+    the bytes written since the last scan may have taken it over max_bytes,
+    or SCAN_SECONDS after the last scan.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # The size of the directory at the last scan plus what this process has written since
+        self._size = None
+        self._scanned_at = 0.0
+
+    @staticmethod
+    def key(name: str, version: str, row_group: int, columns: list[str] = None) -> str:
+        parts = [name, version, str(row_group)] + sorted(columns or [])
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key: str) -> pl.DataFrame | None:
+        path = self.path(key)
+        try:
+            # Not memory mapped, another worker may evict the file
+            df = pl.read_ipc(path, memory_map=False)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return df
+
+    def put(self, key: str, df: pl.DataFrame):
+        with replace_file(self.path(key)) as f:
+            df.write_ipc(f)
+            written = f.tell()
+
+        with self._lock:
+            if self._size is not None:
+                self._size += written
+            due = (
+                self._size is None or self._size > self.max_bytes
+                or time.monotonic() - self._scanned_at > SCAN_SECONDS
+            )
+        if due:
+            self.evict()
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        """(last used, size, path) of each entry, least recently used first."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(SUFFIX):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return sorted(entries)
+
+    @property
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        with self._lock:
+            self._scanned_at = time.monotonic()
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Evicted by another worker
+                pass
+            total -= size
+
+        with self._lock:
+            self._size = total
@@ -0,0 +1,139 @@
+from datetime import timedelta
+
+import numpy as np
+import polars as pl
+
+from tsapi.frequency import infer_freq
+
+# Seasons that calendar-based data usually has
+CALENDAR_SEASONS = [
+    timedelta(minutes=1),
+    timedelta(hours=1),
+    timedelta(days=1),
+    timedelta(weeks=1),
+    timedelta(days=365.25),
+]
+
+MAX_PERIODS = 2  # Each period is another STL decomposition, so keep this small
+ACF_THRESHOLD = 0.3
+NUM_PEAKS = 5
+
+
+def calendar_periods(freq: timedelta) -> list[int]:
+    """
+    The calendar seasons that are a whole number (at least 2) of samples at
+    this frequency, e.g. 24 and 168 for hourly data.
+    """
+    periods = []
+    for season in CALENDAR_SEASONS:
+        period = season / freq
+        if period >= 2 and abs(period - round(period)) <= 0.001 * period:
+            periods.append(round(period))
+    return periods
+
+
+def autocorrelation(y: np.ndarray) -> np.ndarray:
+    """
+    Autocorrelation at every lag, computed with an FFT rather than a lag by lag loop.
+    """
+    y = y - y.mean()
+    n = len(y)
+    # Zero pad to avoid the circular correlation wrapping around
+    spectrum = np.fft.rfft(y, n=2 * n)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+
+    if acf[0] == 0:
+        return np.zeros(n)
+    return acf / acf[0]
+
+
+def detrend(y: np.ndarray) -> np.ndarray:
+    x = np.arange(len(y))
+    return y - np.polyval(np.polyfit(x, y, 1), x)
+
+
+def periodogram_peaks(y: np.ndarray, num_peaks: int = NUM_PEAKS) -> list[int]:
+    """
+    The periods (in samples) of the strongest frequencies in the periodogram.
+    """
+    power = np.abs(np.fft.rfft(y)) ** 2
+    freqs = np.fft.rfftfreq(len(y))
+
+    # Skip the zero frequency
+    strongest = np.argsort(power[1:])[::-1][:num_peaks] + 1
+    return sorted({int(round(1 / freqs[i])) for i in strongest})
+
+
+def detect_periods(
+        y: np.ndarray,
+        freq: timedelta = None,
+        max_periods: int = MAX_PERIODS,
+        threshold: float = ACF_THRESHOLD
+) -> list[int]:
+    """
+    Detect seasonal periods in a series.  Candidates are the calendar seasons
+    for the frequency (if known) and the peaks of the periodogram; a candidate
+    is kept if the autocorrelation at that lag is at least threshold, and
+    there are at least two full cycles of it in the data.
+
+    :return: Up to max_periods periods, shortest first
+    """
+    y = np.asarray(y, dtype=np.float64)
+    y = y[np.isfinite(y)]
+    n = len(y)
+    if n < 8:
+        return []
+
+    # A trend swamps the low frequencies and makes every lag look correlated
+    residual = detrend(y)
+    if residual.var() <= 1e-10 * max(y.var(), 1.0):
+        return []
+    y = residual
+
+    seasons = calendar_periods(freq) if freq is not None else []
+    candidates = [p for p in set(periodogram_peaks(y)) | set(seasons) if 2 <= p and 2 * p < n]
+    if len(candidates) == 0:
+        return []
+
+    acf = autocorrelation(y)
+    scored = sorted(((acf[p], p) for p in candidates if acf[p] >= threshold), reverse=True)
+
+    periods = []
+    for _, period in scored:
+        # Neighbouring periodogram bins are the same season
+        if any(abs(period - p) <= 0.1 * p for p in periods):
+            continue
+        # Multiples of a stronger period are just as correlated, but add nothing
+        # unless they are a season of their own (e.g. weekly on top of daily)
+        if period not in seasons and any(period % p == 0 for p in periods):
+            continue
+        periods.append(period)
+        if len(periods) == max_periods:
+            break
+
+    return sorted(periods)
+
+
+def series_periods(series: pl.Series, timestamp: pl.Series) -> list[int]:
+    """
+    Detect the seasonal periods of a series using the timestamps to find calendar seasons.
+    """
+    try:
+        freq = infer_freq(timestamp)
+    except ValueError:
+        freq = None
+
+    return detect_periods(series.cast(pl.Float64).to_numpy(), freq)
+
+
+def dataset_periods(df: pl.DataFrame, tscol: str, series_cols: list[str]) -> dict[str, list[int]]:
+    """
+    Detect the periods of each series of a dataset, ordered by time.
+    """
+    df = df.drop_nulls(tscol).sort(tscol)
+    try:
+        freq = infer_freq(df[tscol])
+    except ValueError:
+        freq = None
+
+    return {col: detect_periods(df[col].cast(pl.Float64).to_numpy(), freq) for col in series_cols}
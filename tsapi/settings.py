@@ -0,0 +1,118 @@
+from typing import Any
+
+import environ
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    env: str = "local"
+    app_name: str = "Time Series API"
+    data_dir: str
+    secrets_dir: str = "/var/secrets"
+    secrets: Any = None
+
+    mdb_user: str = "tsapiuser"
+    mdb_host: str = "localhost"
+    mdb_port: int = 27017
+    mdb_name: str = "tsapidb"
+    mdb_scheme: str = "mongodb"
+    mdb_options: str = ""
+
+    redis_host: str = "localhost"
+
+    # Where dataset files are kept: 'local' (data_dir) or 'gcs' (gcs_prefix in gcs_bucket)
+    storage_backend: str = "local"
+    gcs_bucket: str = "tsnext_bucket"
+    gcs_prefix: str = "datasets/"
+    # Row groups fetched from GCS, shared by the workers on a host (0 disables)
+    row_group_cache_dir: str = "/tmp/tsapi-row-groups"
+    row_group_cache_mb: int = 1024
+
+    # How often orphaned cache entries are deleted (0 disables the sweeper)
+    cache_sweep_seconds: int = 600
+
+    # How often the live tail producer checks a dataset for new rows
+    tail_poll_seconds: float = 2.0
+
+    # Admission control (see tsapi.admission), per worker.  A request waits at
+    # most max_queue_seconds for a slot before it is rejected with a 503.
+    max_concurrent_requests: int = 32
+    # Concurrency limits of the route classes (0 or missing is unlimited)
+    route_concurrency: dict[str, int] = {"forecast": 2, "tsop": 8, "ingest": 2}
+    max_queued_requests: int = 64
+    max_queue_seconds: float = 10.0
+    # Token bucket per client, shared by the workers (0 disables)
+    rate_limit_per_second: float = 0
+    rate_limit_burst: int = 20
+    # Parquet files read at the same time
+    max_parquet_loads: int = 4
+    # Bytes of frames being loaded and cached at once per worker (0 only
+    # accounts), and how long a load waits for them before a 503
+    memory_budget_mb: int = 2048
+    memory_wait_seconds: float = 10.0
+
+    # Opt-in request profiling (see tsapi.profiling), per worker.  It is only
+    # enabled if the profile_token secret is set.
+    profile_max_per_minute: int = 6
+    # Of the wall time of the last minute
+    profile_max_fraction: float = 0.05
+    profile_interval_ms: float = 1.0
+    # Sampling stops after this, the stage timings are still recorded
+    profile_max_seconds: float = 30.0
+
+    # Run forecast fits on queue workers (see tsapi.forecast_queue) instead of
+    # the process pool of each API worker.  A fit not done within
+    # forecast_timeout_seconds is a 504.
+    forecast_queue: bool = False
+    forecast_timeout_seconds: float = 60.0
+    # Fits a queue worker runs at once, a process each
+    forecast_worker_concurrency: int = 2
+    # How long a result waits for the request that queued it
+    forecast_result_seconds: int = 60
+
+    # Bulk export (see tsapi.flight), a process of its own
+    flight_host: str = "0.0.0.0"
+    flight_port: int = 8815
+    # Parallel streams a request is split into, at most one per row group
+    flight_streams: int = 8
+    # The URI clients fetch the streams from, if not the one they asked
+    flight_location: str | None = None
+
+    compression_min_size: int = 1024
+    # Compressed responses kept per worker, keyed by ETag and body checksum (0 disables)
+    compression_cache_mb: int = 64
+
+    model_config = SettingsConfigDict(env_file=".env")
+
+    @property
+    def mdb_url(self):
+        """MongoDB connection URL"""
+        # NB: Leaving out port for now because mongodb+srv can't use it.
+        url = f"{self.mdb_scheme}://{self.mdb_user}:{self.secrets.mdb_password}@{self.mdb_host}/{self.mdb_name}"
+
+        if self.mdb_options:
+            url += f"?{self.mdb_options}"
+
+        return url
+
+
+def load_secrets(secrets_dir: str):
+    # Kinda silly maybe, but i like how environ does secrets.  Maybe should just
+    # ditch pydantic for settings?
+    file_secrets = environ.secrets.DirectorySecrets.from_path(secrets_dir)
+
+    @environ.config
+    class SecretConfig:
+        mdb_password = file_secrets.secret()
+        profile_token = file_secrets.secret(default=None)
+
+    return SecretConfig.from_environ()
+
+
+def load_settings() -> Settings:
+    """
+    Read the settings and secrets.  The app does this once, at startup.
+    """
+    settings = Settings()
+    settings.secrets = load_secrets(settings.secrets_dir)
+    return settings